@@ -0,0 +1,259 @@
+"""Benchmarks of the drawing entry points.
+
+Run all cases (or a part of them) and save the results:
+
+    python benchmark.py run -o results.json [--quick] [-k bathroom] [--repeat 3]
+
+Compare the results with a saved baseline (exit code 1 on regressions):
+
+    python benchmark.py compare baseline.json results.json [--threshold 0.2]
+
+Wall time is the best of `repeat` runs. Peak memory is measured by
+tracemalloc (NumPy arrays are counted, PIL image buffers are not).
+"""
+import argparse
+import contextlib
+import datetime
+import io
+import itertools
+import json
+import platform
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import PIL
+
+from draw.algorithms import draw_floor, draw_floor1, draw_bathroom
+from draw.core import (
+    Canvas, Size, LAYING_METHOD_DIRECT, LAYING_METHOD_DIRECT_CENTER, LAYING_METHOD_DIAGONAL, LAYING_METHOD_AUTO,
+)
+from draw.estimate import estimate_floor, estimate_bathroom
+from draw.utils import encode_image, FORMAT_PNG
+
+
+# комнаты (ширина, длина) в мм: от 1 м до 50 м
+ROOMS = ((1000, 1000), (3000, 4000), (10000, 12000), (50000, 50000))
+# плитки (ширина, длина) в мм: от мозаики до слэбов
+TILES = ((20, 20), (100, 100), (300, 300), (600, 300), (1200, 600))
+DELIMITERS = (1, 3)
+WALL_HEIGHT = 2500
+DOOR = Size(800, 2000)
+
+
+def wall_openings(l, w):
+    """Window, niche and pipe on every wall: (x, y - above the floor, width, height) (mm)."""
+    return [
+        [(width / 2 - 300, 1200, 600, 600), (width - 500, 500, 400, 300), (50, 300, 100, 100)]
+        for width in (l, w, l, w)
+    ]
+
+
+def legacy_tile_size(w, l, tw, th):
+    """Tile size (px) in the picture of `draw_floor` (same scale as it picks).
+
+    `draw_floor` never ends when the tile is less than 1 px.
+    """
+    scale_factor = 10
+    while int(l / scale_factor) > 1000 or int(w / scale_factor) > 1000:
+        scale_factor += 1
+    return int(th / scale_factor), int(tw / scale_factor)
+
+
+QUICK_ROOMS = ROOMS[1:3]
+QUICK_TILES = TILES[1:4]
+
+DEFAULT_THRESHOLD = 0.2
+# разница времени меньше этой считается шумом (с)
+MIN_TIME_DELTA = 0.002
+
+
+class Case:
+
+    def __init__(self, name, fn, args, count_fn=None, count_args=None):
+        """
+        :param fn: drawing function
+        :param count_fn: function of the estimate for the number of tiles
+        """
+        self.name = name
+        self.fn = fn
+        self.args = args
+        self.count_fn = count_fn
+        self.count_args = count_args
+
+    def draw(self):
+        result = self.fn(*self.args)
+        # draw_floor1/draw_bathroom вернут Canvas, draw_floor - PIL.Image
+        return result.im if isinstance(result, Canvas) else result
+
+    def tiles(self):
+        if self.count_fn is None:
+            return None
+        return self.count_fn(*self.count_args)['tiles']
+
+
+def make_cases(quick=False):
+    rooms = QUICK_ROOMS if quick else ROOMS
+    tiles = QUICK_TILES if quick else TILES
+    delimiters = DELIMITERS[:1] if quick else DELIMITERS
+
+    cases = []
+    for (w, l), (tw, th) in itertools.product(rooms, tiles):
+        floor1_methods = (LAYING_METHOD_DIRECT, LAYING_METHOD_DIRECT_CENTER, LAYING_METHOD_DIAGONAL, LAYING_METHOD_AUTO)
+        for d, method in itertools.product(delimiters, floor1_methods):
+            cases.append(Case(
+                f'floor1/{w}x{l}/{tw}x{th}/d{d}/m{method}',
+                draw_floor1, (w, l, d, tw, th, method),
+                estimate_floor, (w, l, d, tw, th, method),
+            ))
+
+        # старый draw_floor не рисует плитки меньше 1 px (зацикливается)
+        legacy_methods = (LAYING_METHOD_DIRECT, LAYING_METHOD_DIRECT_CENTER, LAYING_METHOD_DIAGONAL)
+        if not all(legacy_tile_size(w, l, tw, th)):
+            legacy_methods = ()
+        for method in legacy_methods:
+            cases.append(Case(
+                f'floor/{w}x{l}/{tw}x{th}/m{method}',
+                draw_floor, (w, l, tw, th, method),
+            ))
+
+        for d, door in itertools.product(delimiters, (None, DOOR)):
+            cases.append(Case(
+                f'bathroom/{w}x{l}/{tw}x{th}/d{d}/{"door" if door else "nodoor"}',
+                draw_bathroom, (l, w, WALL_HEIGHT, d, tw, th, door),
+                estimate_bathroom, (l, w, WALL_HEIGHT, d, tw, th, door),
+            ))
+        for d in delimiters:
+            openings = wall_openings(l, w)
+            cases.append(Case(
+                f'bathroom/{w}x{l}/{tw}x{th}/d{d}/openings',
+                draw_bathroom, (l, w, WALL_HEIGHT, d, tw, th, DOOR, False, openings),
+                estimate_bathroom, (l, w, WALL_HEIGHT, d, tw, th, DOOR, openings),
+            ))
+            cases.append(Case(
+                f'bathroom/{w}x{l}/{tw}x{th}/d{d}/auto_start',
+                draw_bathroom, (l, w, WALL_HEIGHT, d, tw, th, DOOR, False, None, True),
+                estimate_bathroom, (l, w, WALL_HEIGHT, d, tw, th, DOOR, None, False, True),
+            ))
+
+    return cases
+
+
+def run_case(case, repeat):
+    """
+    :rtype: dict
+    """
+    times = []
+    im = None
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(repeat):
+            started = time.perf_counter()
+            im = case.draw()
+            times.append(time.perf_counter() - started)
+
+        tracemalloc.start()
+        case.draw()
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+        tiles = case.tiles()
+
+    return {
+        'name': case.name,
+        'time': min(times),
+        'time_median': statistics.median(times),
+        'peak_memory': peak,
+        'tiles': tiles,
+        'image_size': list(im.size),
+        'encoded_bytes': encode_image(im, FORMAT_PNG).size,
+    }
+
+
+def run(args):
+    cases = [c for c in make_cases(args.quick) if not args.k or args.k in c.name]
+    results = []
+    for i, case in enumerate(cases, 1):
+        r = run_case(case, args.repeat)
+        results.append(r)
+        print('[%d/%d] %-48s %8.1f ms %8.1f MB %9s tiles %8d bytes' % (
+            i, len(cases), r['name'], r['time'] * 1000, r['peak_memory'] / 2 ** 20,
+            r['tiles'] if r['tiles'] is not None else '-', r['encoded_bytes']
+        ), file=sys.stderr)
+
+    data = {
+        'meta': {
+            'date': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'pillow': PIL.__version__,
+            'platform': platform.platform(),
+            'repeat': args.repeat,
+        },
+        'cases': results,
+    }
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(data, f, indent=1)
+    else:
+        json.dump(data, sys.stdout, indent=1)
+
+
+def compare(args):
+    with open(args.baseline) as f:
+        baseline = {c['name']: c for c in json.load(f)['cases']}
+    with open(args.results) as f:
+        results = json.load(f)['cases']
+
+    regressions = 0
+    for r in results:
+        b = baseline.get(r['name'])
+        if b is None:
+            continue
+
+        flags = []
+        for field in ('time', 'peak_memory', 'encoded_bytes'):
+            if field == 'time' and r[field] - b[field] < MIN_TIME_DELTA:
+                continue
+            if b[field] and r[field] > b[field] * (1 + args.threshold):
+                flags.append('%s +%.0f%%' % (field, (r[field] / b[field] - 1) * 100))
+        if r['tiles'] != b['tiles']:
+            flags.append('tiles %s -> %s' % (b['tiles'], r['tiles']))
+
+        if flags:
+            regressions += 1
+        if flags or args.verbose:
+            print('%-48s %8.1f -> %8.1f ms  %s' % (
+                r['name'], b['time'] * 1000, r['time'] * 1000, ', '.join(flags) or 'ok'
+            ))
+
+    print('%d of %d cases regressed (threshold %d%%)' % (regressions, len(results), args.threshold * 100))
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmarks of the drawing entry points')
+    sub = parser.add_subparsers(dest='command', required=True)
+
+    p = sub.add_parser('run', help='run the benchmarks')
+    p.add_argument('-o', '--output', help='JSON file of the results (stdout if not set)')
+    p.add_argument('-k', help='only cases with the substring in the name')
+    p.add_argument('--quick', action='store_true', help='small grid of the cases')
+    p.add_argument('--repeat', type=int, default=3)
+    p.set_defaults(fn=run)
+
+    p = sub.add_parser('compare', help='compare results with a baseline')
+    p.add_argument('baseline')
+    p.add_argument('results')
+    p.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='allowed relative growth')
+    p.add_argument('-v', '--verbose', action='store_true', help='print all cases')
+    p.set_defaults(fn=compare)
+
+    args = parser.parse_args()
+    sys.exit(args.fn(args) or 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -10,9 +10,12 @@ from .core import (
     add_text_watermark, Size, Position, Canvas, Draw,
     WallTilesOptions, PositionalObject, Wall, Floor,
     color, color_cutted,
-    LAYING_METHOD_DIRECT, LAYING_METHOD_DIRECT_CENTER, LAYING_METHOD_DIAGONAL,
+    LAYING_METHOD_DIRECT, LAYING_METHOD_DIRECT_CENTER, LAYING_METHOD_DIAGONAL, DIAGONAL_ANGLE,
     DRAWING_WATERMARK_TEXT
 )
+from .layout import auto_wall_start
+from .metrics import log_sampled
+from .svg import SvgCanvas
 
 
 def check_with_delimiters(l, tl, d, c):
@@ -48,8 +51,13 @@ def add_background(color):
     return decorator
 
 
-def draw_floor1(width, length, d, tw, th, method=LAYING_METHOD_DIRECT):
-    """X=length, Y=width"""
+def draw_floor1(width, length, d, tw, th, method=LAYING_METHOD_DIRECT, vector=False, angle=DIAGONAL_ANGLE,
+                openings=None):
+    """X=length, Y=width
+    :param vector: draw into SvgCanvas
+    :param angle: rotation of the tiles for LAYING_METHOD_DIAGONAL (degrees)
+    :param openings: list of (x, y, width, height) of the floor (mm)
+    """
     draw = Draw()
 
     WIDTH_HD = 1280
@@ -63,19 +71,27 @@ def draw_floor1(width, length, d, tw, th, method=LAYING_METHOD_DIRECT):
         height=width + (contour_length * 2)
     )
 
-    print(max_size)
+    log_sampled('draw_floor1', max_size=str(max_size), method=method, angle=angle, vector=vector)
 
-    canvas = Canvas(
+    canvas = (SvgCanvas if vector else Canvas)(
         WIDTH_HD, HEIGHT_HD,
         max_size=max_size
     )
 
-    draw_offset = Position(canvas.to_pixels(contour_length), canvas.to_pixels(contour_length))
+    lpx, wpx = (
+        canvas.to_pixels(length) + canvas.to_pixels(contour_length * 2),
+        canvas.to_pixels(width) + canvas.to_pixels(contour_length * 2)
+    )
+    # схема сразу рисуется в центре кадра (растр), svg - смещается видимой областью
+    cx, cy = (0, 0) if vector else ((WIDTH_HD - lpx) // 2, (HEIGHT_HD - wpx) // 2)
+    draw_offset = Position(cx + canvas.to_pixels(contour_length), cy + canvas.to_pixels(contour_length))
 
     options = {
         'contour_out': {
             'length': canvas.to_pixels(contour_length)
-        }
+        },
+        'angle': angle,
+        'openings': openings,
     }
 
     floor = Floor(
@@ -88,33 +104,16 @@ def draw_floor1(width, length, d, tw, th, method=LAYING_METHOD_DIRECT):
         [PositionalObject(floor, draw_offset, {'method': method})]
     )
 
-    lpx, wpx = (
-        canvas.to_pixels(length) + canvas.to_pixels(contour_length * 2),
-        canvas.to_pixels(width) + canvas.to_pixels(contour_length * 2)
-    )
-    canvas.im = canvas.im.crop((0, 0, lpx, wpx))
-
-    sf = lpx / wpx
-    if sf <= 16/9:  # 1.777...
-        # scale by height
-        canvas.im.resize((int(HEIGHT_HD * sf), HEIGHT_HD))
+    if vector:
+        # видимая область документа - в центре
+        canvas.set_viewbox(-((WIDTH_HD - lpx) // 2), -((HEIGHT_HD - wpx) // 2), WIDTH_HD, HEIGHT_HD)
     else:
-        # scale by width
-        canvas.im.resize((WIDTH_HD, int(WIDTH_HD * sf)))
+        # концы контуров не выходят за схему
+        canvas.clip(cx, cy, cx + lpx, cy + wpx)
 
-    im_w, im_h = canvas.im.size
-    canvas1 = Canvas(
-        WIDTH_HD, HEIGHT_HD,
-        scale_factor=1.0
-    )
-    canvas1.im.paste(
-        canvas.im,
-        ((WIDTH_HD - im_w) // 2, (HEIGHT_HD - im_h) // 2)
-    )
-
-    draw.draw_wm(canvas1)
+    draw.draw_wm(canvas)
 
-    return canvas1
+    return canvas
 
 
 # @add_background(color=(255, 255, 255, 255))
@@ -304,7 +303,7 @@ def draw_walls(width, length, height, tile_length, tile_height, door_width=None,
     return image
 
 
-def draw_bathroom(l, w, h, d, tw, th, door_size=None):
+def draw_bathroom(l, w, h, d, tw, th, door_size=None, vector=False, openings=None, auto_start=False):
     """ Возможно следует добавить расчет "максимум целых плиток"
     :param l:
     :param w:
@@ -312,8 +311,12 @@ def draw_bathroom(l, w, h, d, tw, th, door_size=None):
     :param d:
     :param tw:
     :param th:
+    :param vector: draw into SvgCanvas
+    :param openings: openings of every wall: 4 lists of (x, y - above the floor, width, height) (mm)
+    :param auto_start: the offcut the first wall starts with is searched for (see `layout.auto_wall_start`)
     :return:
     """
+    openings = openings or [[]] * 4
     draw = Draw()
 
     WIDTH_HD = 1280
@@ -329,9 +332,9 @@ def draw_bathroom(l, w, h, d, tw, th, door_size=None):
         height=h + (contour_length*2)
     )
 
-    print(max_size)
+    log_sampled('draw_bathroom', max_size=str(max_size), door=door_size is not None, vector=vector)
 
-    canvas = Canvas(
+    canvas = (SvgCanvas if vector else Canvas)(
         WIDTH_HD, HEIGHT_HD,
         max_size=max_size
     )
@@ -355,13 +358,25 @@ def draw_bathroom(l, w, h, d, tw, th, door_size=None):
 
     # print(canvas.to_pixels(max_size.width) + padding_px)
 
-    wall = Wall(l, h, tile=WallTilesOptions(tw, th, d, sx=None), options=options)
+    # FIXME: little hack!!!
+    real_width = padding_px * 2 + sum(canvas.to_pixels(x) for x in (l, w, l, w)) + wall_del_px * 3
+    if real_width < max_size.width:
+        if vector:
+            canvas.set_viewbox(0, 0, real_width, HEIGHT_HD)
+        else:
+            # кадр сразу нужной ширины (масштаб тот же)
+            canvas = Canvas(real_width, HEIGHT_HD, scale_factor=canvas.scale_factor)
+
+    options['openings'] = openings[0]
+    sx = auto_wall_start((l, w, l, w), tw, d) if auto_start else None
+    wall = Wall(l, h, tile=WallTilesOptions(tw, th, d, sx=sx), options=options)
     draw.draw(canvas, [PositionalObject(wall, draw_offset)])
     wo = wall.get_tile_options()
     # print("Wall#1:\n\tsx={} sy={} mx={} my={}".format(wo.start_x, wo.start_y, wo.max_x, wo.max_y))
 
     tile_start_from_x = wall.get_tile_options().max_x
     draw_offset.x += canvas.to_pixels(wall.width) + wall_del_px
+    options['openings'] = openings[1]
     wall = Wall(w, h, tile=WallTilesOptions(tw, th, d, sx=tile_start_from_x), options=options)
     draw.draw(canvas, [PositionalObject(wall, draw_offset)])
     wo = wall.get_tile_options()
@@ -372,6 +387,7 @@ def draw_bathroom(l, w, h, d, tw, th, door_size=None):
     if door_size is not None:
         options['door_width'] = door_size.width
         options['door_height'] = door_size.height
+    options['openings'] = openings[2]
     wall = Wall(l, h, tile=WallTilesOptions(tw, th, d, sx=tile_start_from_x), options=options)
     draw.draw(canvas, [PositionalObject(wall, draw_offset)])
     wo = wall.get_tile_options()
@@ -381,17 +397,12 @@ def draw_bathroom(l, w, h, d, tw, th, door_size=None):
     draw_offset.x += canvas.to_pixels(wall.width) + wall_del_px
     options['door_width'] = None
     options['door_height'] = None
+    options['openings'] = openings[3]
     wall = Wall(w, h, tile=WallTilesOptions(tw, th, d, sx=tile_start_from_x), options=options)
     draw.draw(canvas, [PositionalObject(wall, draw_offset)])
     wo = wall.get_tile_options()
     # print("Wall#4:\n\tsx={} sy={} mx={} my={}".format(wo.start_x, wo.start_y, wo.max_x, wo.max_y))
 
-    # FIXME: little hack!!!
-    real_width = draw_offset.x + canvas.to_pixels(wall.width) + padding_px
-    if real_width < max_size.width:
-        canvas.im = canvas.im.crop((0, 0, real_width, HEIGHT_HD))
-    canvas.im.resize((WIDTH_HD, HEIGHT_HD))
-
     # print(real_width)
 
     draw.draw_wm(canvas)
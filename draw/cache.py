@@ -0,0 +1,217 @@
+"""Cache of render results keyed by the normalized request."""
+from collections import OrderedDict
+import hashlib
+import json
+import os
+import tempfile
+import threading
+
+
+def _canonical(value):
+    """Same numbers are the same in the key: 300 == 300.0"""
+    if isinstance(value, dict):
+        return {k: _canonical(v) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_canonical(v) for v in value]
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+def request_key(params):
+    """Canonical hash of the normalized request.
+    :type params: dict
+    :rtype: str
+    """
+    data = json.dumps(_canonical(params), sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+class RenderCache:
+    """Two-tier cache: in-memory LRU and an optional directory on disk.
+
+    Values are URLs (str), encoded images (bytes) or JSON
+    serializable results (dict). The disk tier keeps
+    its total size under `disk_limit` bytes, the least recently used
+    files are removed first.
+    """
+
+    def __init__(self, memory_size=1024, disk_dir=None, disk_limit=256 * 1024 * 1024):
+        self.memory_size = memory_size
+        self.disk_dir = disk_dir
+        self.disk_limit = disk_limit
+
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_usage = 0
+
+        self.hits_memory = 0
+        self.hits_disk = 0
+        self.misses = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+            self._disk_usage = sum(e.stat().st_size for e in self._disk_entries())
+
+    def get(self, key):
+        """
+        :return: cached value or None
+        """
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.hits_memory += 1
+                return self._memory[key]
+
+        value = self._disk_get(key)
+
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits_disk += 1
+            self._memory_put(key, value)
+
+        return value
+
+    def put(self, key, value):
+        with self._lock:
+            self._memory_put(key, value)
+        self._disk_put(key, value)
+
+    def _memory_put(self, key, value):
+        self._memory[key] = value
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+
+    # disk tier
+
+    def _disk_path(self, key, ext):
+        return os.path.join(self.disk_dir, key + ext)
+
+    def _disk_entries(self):
+        return [e for e in os.scandir(self.disk_dir) if e.is_file() and e.name.endswith(('.url', '.bin', '.json'))]
+
+    def _disk_get(self, key):
+        if not self.disk_dir:
+            return None
+
+        for ext in ('.json', '.url', '.bin'):
+            path = self._disk_path(key, ext)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+            except FileNotFoundError:
+                continue
+            os.utime(path)  # недавно использованный
+            if ext == '.json':
+                return json.loads(data.decode('utf-8'))
+            return data.decode('utf-8') if ext == '.url' else data
+
+        return None
+
+    def _disk_put(self, key, value):
+        if not self.disk_dir:
+            return
+
+        if isinstance(value, dict):
+            path, data = self._disk_path(key, '.json'), json.dumps(value).encode('utf-8')
+        elif isinstance(value, str):
+            path, data = self._disk_path(key, '.url'), value.encode('utf-8')
+        else:
+            path, data = self._disk_path(key, '.bin'), value
+
+        # запись через временный файл, чтобы не прочитать недописанное, у каждой записи свой файл
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.disk_dir)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+        except BaseException:
+            os.remove(tmp)
+            raise
+
+        with self._lock:
+            # перезаписанный файл больше не занимает место
+            old_size = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(tmp, path)
+            self._disk_usage += len(data) - old_size
+            if self._disk_usage > self.disk_limit:
+                self._evict()
+
+    def _evict(self):
+        entries = sorted(self._disk_entries(), key=lambda e: e.stat().st_mtime)
+        usage = sum(e.stat().st_size for e in entries)
+        for e in entries:
+            if usage <= self.disk_limit:
+                break
+            size = e.stat().st_size
+            try:
+                os.remove(e.path)
+            except FileNotFoundError:
+                pass
+            usage -= size
+        self._disk_usage = usage
+
+    def stats(self):
+        return {
+            'hits_memory': self.hits_memory,
+            'hits_disk': self.hits_disk,
+            'misses': self.misses,
+            'memory_items': len(self._memory),
+            'disk_usage': self._disk_usage,
+        }
+
+
+class ParamsStore:
+    """Requests behind the issued ids (pyramids).
+
+    URLs with the id are given to clients and must keep working, so the
+    requests are not kept in `RenderCache`. With `disk_dir` they are JSON
+    files there (survive restarts, memory does not grow, nothing is
+    evicted). Otherwise they are kept in memory, at most `memory_size`
+    of them: the oldest ids expire and their URLs give 404.
+    """
+
+    def __init__(self, disk_dir=None, memory_size=100000):
+        self.disk_dir = disk_dir
+        self.memory_size = memory_size
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def get(self, key):
+        """
+        :return: stored request or None
+        """
+        if not self.disk_dir:
+            with self._lock:
+                value = self._memory.get(key)
+                if value is not None:
+                    self._memory.move_to_end(key)
+                return value
+
+        try:
+            with open(os.path.join(self.disk_dir, key + '.json'), 'rb') as f:
+                return json.loads(f.read().decode('utf-8'))
+        except FileNotFoundError:
+            return None
+
+    def put(self, key, value):
+        if not self.disk_dir:
+            with self._lock:
+                self._memory[key] = value
+                self._memory.move_to_end(key)
+                # без диска память ограничена: старые id истекают
+                while len(self._memory) > self.memory_size:
+                    self._memory.popitem(last=False)
+            return
+
+        path = os.path.join(self.disk_dir, key + '.json')
+        # запись через временный файл, чтобы не прочитать недописанное
+        tmp = path + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.write(json.dumps(value).encode('utf-8'))
+        os.replace(tmp, path)
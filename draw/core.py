@@ -1,12 +1,22 @@
 #!/usr/bin/env python
 
-import copy
+from functools import lru_cache
 from math import ceil
 import os
 
 from abc import ABCMeta, abstractmethod, abstractstaticmethod
+import numpy as np
 from PIL import Image, ImageDraw, ImageFont
 
+from .layout import (
+    DiagonalPlan, direct_layout, center_layout, diagonal_layout, auto_layout,
+    CUT_LEFT, CUT_TOP, CUT_RIGHT, CUT_BOTTOM, STEPS_CENTER,
+)
+from .display import DisplayList, Tiles, Lattice
+from .metrics import stage, count, log_sampled
+from .pixels import grid_steps
+from .raster import BACKEND_NUMPY, BACKENDS, Frame
+
 
 # FIXME: real values
 DRAWING_WATERMARK_TEXT = 'www.tcutter.ru'
@@ -14,6 +24,7 @@ DRAWING_WATERMARK_FONT = os.path.join('static', 'fonts', 'arial.ttf')
 
 color = (120, 120, 120, 255)
 color_cutted = (255, 0, 0, 255)
+color_tile = (185, 203, 218, 255)  # #b9cbda
 
 
 __WATERMARK_FONT_SIZE = 60
@@ -22,43 +33,94 @@ __WATERMARK_FONT_SIZE = 60
 LAYING_METHOD_DIRECT = 1
 LAYING_METHOD_DIRECT_CENTER = 2
 LAYING_METHOD_DIAGONAL = 3
+# начало раскладки подбирается: без полосок по краям, меньше плиток
+LAYING_METHOD_AUTO = 4
+
+# угол поворота плитки при диагональной укладке (градусы)
+DIAGONAL_ANGLE = 45
+
 
+WATERMARK_COLOR = (0, 0, 0, 128)
+WATERMARK_CACHE_SIZE = 16
 
-def get_font(size):
+
+@lru_cache(maxsize=64)
+def get_font(size, path=DRAWING_WATERMARK_FONT):
     return ImageFont.truetype(
-        DRAWING_WATERMARK_FONT,
+        path,
         size=size
     )
 
 
+def fit_font(text, size, path=DRAWING_WATERMARK_FONT, scale=1):
+    """The biggest font (up to __WATERMARK_FONT_SIZE * scale) the text fits in the image with.
+    :param size: image size (px)
+    :type size: tuple
+    :param scale: scale of the biggest font (print pages are bigger than the screen frame)
+    """
+    draw = ImageDraw.Draw(Image.new('L', (1, 1)))
+    max_size = max(int(__WATERMARK_FONT_SIZE * scale), 2)
+
+    # размер уменьшается от наибольшего шагами по 2, шаг ищется бинарным поиском
+    lo, hi = 0, (max_size - 1) // 2
+    while lo < hi:
+        mid = (lo + hi) // 2
+        tw, th = draw.textsize(text, font=get_font(max_size - mid * 2, path))
+        if tw + 10 < size[0] and th + 10 < size[1]:
+            hi = mid
+        else:
+            lo = mid + 1
+
+    return get_font(max_size - lo * 2, path)
+
+
+@lru_cache(maxsize=WATERMARK_CACHE_SIZE)
+def get_watermark(text, size, path=DRAWING_WATERMARK_FONT, scale=1):
+    """Prerendered watermark for the image of the size.
+    :param size: image size (px)
+    :type size: tuple
+    :param scale: scale of the biggest font (see `fit_font`)
+    :return: overlay image and its position in the image
+    """
+    font = fit_font(text, size, path, scale)
+    draw = ImageDraw.Draw(Image.new('L', (1, 1)))
+    tw, th = draw.textsize(text, font=font)
+
+    # положение текста дробное, как при рисовании на всем изображении
+    x = size[0] / 2 - tw / 2
+    y = size[1] / 2 - th / 2
+
+    # запас для выступающих частей символов
+    margin = 5
+    ox = max(int(x) - margin, 0)
+    oy = max(int(y) - margin, 0)
+    overlay = Image.new(
+        'RGBA',
+        (min(tw + margin * 2, size[0] - ox), min(th + margin * 2, size[1] - oy)),
+        color=0
+    )
+    ImageDraw.Draw(overlay).text((x - ox, y - oy), text, fill=WATERMARK_COLOR, font=font)
+
+    return overlay, (ox, oy)
+
+
+def apply_watermark(image, text):
+    """Put the watermark in the center of the image (in place).
+    :type image: PIL.Image.Image
+    :return: image
+    """
+    overlay, dest = get_watermark(text, image.size)
+    image.alpha_composite(overlay, dest)
+
+    return image
+
+
 def add_text_watermark(text):
 
     def decorator(func):
         def wrapper(*args):
             image = func(*args)
-
-            watermark = Image.new('RGBA', size=image.size, color=0)
-            # watermark = Image.new('RGBA', size=(image.width, 64), color=0)
-            draw = ImageDraw.Draw(watermark)
-            font = get_font(60)
-            tw = None
-            th = None
-            while True:
-                tw, th = draw.textsize(text, font=font)
-                if tw+10 < image.size[0] and th+10 < image.size[1]:
-                    break
-                font = get_font(font.size-2)
-
-            draw.text(
-                (image.width/2 - tw/2, image.height/2 - th/2),
-                text,
-                fill=(0, 0, 0, 128),
-                font=font
-            )
-
-            # image.paste(watermark, box=(0, 15), mask=watermark)
-            return Image.alpha_composite(image, watermark)
-            # return image
+            return apply_watermark(image, text)
 
         return wrapper
     return decorator
@@ -73,17 +135,48 @@ class Object(metaclass=ABCMeta):
     def draw(self, canvas, start_pos, **kwargs): pass
 
     @staticmethod
-    def _draw_line(d, x0, y0, x1, y1, color=None):
+    def _draw_line(canvas, x0, y0, x1, y1, color=None):
         """
-        :param d:
-        :type d: ImageDraw
+        :param canvas:
+        :type canvas: Canvas
         :param x0:
         :param y0:
         :param x1:
         :param y1:
         :return:
         """
-        d.line((x0, y0, x1, y1), fill=color or (80, 80, 80, 255), width=1)
+        canvas.line((x0, y0, x1, y1), fill=color or (80, 80, 80, 255), width=1)
+
+    def _draw_openings(self, canvas, start_pos, areas):
+        """Openings over the tiles: filled, the sides inside the surface are cut lines.
+        :param areas: list of (x, y, w, h) (mm)
+        """
+        size = self.get_size()
+        for x, y, w, h in areas:
+            x0, y0, x1, y1 = self._opening_box(canvas, start_pos, (x, y, w, h))
+
+            canvas.polygon([(x0, y1), (x0, y0), (x1, y0), (x1, y1)], fill="#fff")
+
+            # стороны на краю поверхности не рисуются (низ двери)
+            if x > 0:
+                self._draw_line(canvas, x0, y1, x0, y0, color=color_cutted)
+            if x + w < size.width:
+                self._draw_line(canvas, x1, y1, x1, y0, color=color_cutted)
+            if y > 0:
+                self._draw_line(canvas, x0, y0, x1, y0, color=color_cutted)
+            if y + h < size.height:
+                self._draw_line(canvas, x0, y1, x1, y1, color=color_cutted)
+
+    def _opening_box(self, canvas, start_pos, area):
+        """Opening on the canvas (px): x0, y0, x1, y1.
+        :param area: x, y, w, h (mm)
+        """
+        x, y, w, h = area
+        sp = start_pos
+        return (
+            sp.x + canvas.to_pixels(x), sp.y + canvas.to_pixels(y),
+            sp.x + canvas.to_pixels(x + w), sp.y + canvas.to_pixels(y + h),
+        )
 
     @abstractmethod
     def draw_contour_out(self, canvas, start_pos, length): pass
@@ -97,6 +190,15 @@ class Object(metaclass=ABCMeta):
         pass
 
 
+def surface_openings(openings, wall=None):
+    """Openings of the normalized request on one surface.
+    :param openings: list of {'wall', 'x', 'y', 'width', 'height'} ('wall' - walls only)
+    :param wall: index of the wall, None - the floor
+    :return: list of (x, y, width, height) (mm)
+    """
+    return [(o['x'], o['y'], o['width'], o['height']) for o in openings or () if o.get('wall') == wall]
+
+
 class Size:
     def __init__(self, width, height):
         self.width = width
@@ -106,17 +208,32 @@ class Size:
         return "{}x{}".format(self.width, self.height)
 
 
+LOD_FULL = 'full'  # каждая плитка
+LOD_AGGREGATE = 'aggregate'  # целые плитки группами по step
+
+
 class Canvas:
-    def __init__(self, w, h, scale_factor=None, max_size=None):
+    DEFAULT_BACKEND = BACKEND_NUMPY
+    # шаг плиток (px), ниже которого целые плитки рисуются группами (0 - всегда по одной)
+    LOD_MIN_TILE_PX = 4
+
+    def __init__(self, w, h, scale_factor=None, max_size=None, backend=None):
         """
         :param w:
         :param h:
         :param scale_factor:
         :param max_size:
         :type Size
+        :param backend: rendering backend (BACKEND_NUMPY, BACKEND_PIL)
         """
         self._width = w
         self._height = h
+        backend = backend or Canvas.DEFAULT_BACKEND
+        assert backend in BACKENDS, f'Unknown backend: {backend}'
+        self._backend = BACKENDS[backend](color_tile, color, color_cutted)
+        self._display_list = DisplayList()
+        # раскладки нарисованных поверхностей (для плана раскроя)
+        self.layouts = []
         if scale_factor:
             self._scale_factor = scale_factor
         elif max_size:
@@ -135,18 +252,189 @@ class Canvas:
                     break
 
             self._scale_factor = sf
-            print("Scale factor auto set to: %f" % sf)
+            log_sampled('canvas_scale', size=(w, h), max_size=str(max_size), scale_factor=sf)
         else:
             raise Exception("need scale_factor or max_size")
 
-        self.im = Image.new(
-            'RGBA',
-            (self._width, self._height),
-            (255, 255, 255, 255)
+        self._frame = None  # создается при первой отрисовке, дальше рисуется только в него
+        # наибольшая группа плиток (по X, по Y) среди нарисованных раскладок
+        self.lod_step = (1, 1)
+
+    @property
+    def size(self):
+        return self._width, self._height
+
+    @property
+    def scale_factor(self):
+        return self._scale_factor
+
+    @property
+    def lod(self):
+        """Level of detail of the drawn layouts."""
+        return {
+            'level': LOD_FULL if self.lod_step == (1, 1) else LOD_AGGREGATE,
+            'step': list(self.lod_step),
+        }
+
+    def _get_frame(self):
+        if self._frame is None:
+            count('canvas_pixels', self._width * self._height)
+            self._frame = Frame(self._width, self._height, (255, 255, 255, 255))
+        return self._frame
+
+    @property
+    def im(self):
+        self.flush()
+        return self._get_frame().im
+
+    # Primitives are recorded into the display list and drawn by `flush`.
+
+    def line(self, xy, fill, width=1):
+        self._display_list.line(xy, fill, width)
+
+    def polygon(self, points, fill=None, outline=None):
+        self._display_list.polygon(points, fill, outline)
+
+    def text(self, xy, text, fill, font):
+        self._display_list.text(xy, text, fill, font)
+
+    def draw_tiles(self, x0, y0, x1, y1, cut):
+        """Draw tiles given as pixel rectangles (inclusive bounds) with CUT_* flags."""
+        self._display_list.tiles(Tiles(x0, y0, x1, y1, cut))
+
+    def draw_layout(self, start_pos, plan, delimiter=0):
+        """Draw tiles of the layout.
+
+        Tiles of a grid are stepped in pixels (see `pixels.py`), all of them
+        are drawn: the openings are drawn over the tiles.
+        :param start_pos: position of the surface on the canvas
+        :type start_pos: Position
+        :type plan: LayoutPlan
+        :param delimiter: grout between the tiles (mm)
+        :return: width of the cut tile of the last column (px, 0 - no cut tile is seen)
+            or None (not a grid)
+        """
+        self.layouts.append(plan)
+        sx, sy = int(start_pos.x), int(start_pos.y)
+        if isinstance(plan, DiagonalPlan):
+            self._draw_lattice(sx, sy, plan)
+            return None
+
+        dpix = self.to_pixels(delimiter) or 1
+        columns, offcut = grid_steps(
+            plan.columns.steps, self.to_pixels(plan.width), self.to_pixels(plan.columns.steps.tile), dpix,
+            self.to_pixels, columns=True
         )
+        rows, _ = grid_steps(
+            plan.rows.steps, self.to_pixels(plan.height), self.to_pixels(plan.rows.steps.tile), dpix,
+            self.to_pixels, columns=False
+        )
+
+        if plan.columns.steps.kind == STEPS_CENTER:
+            # колонка за колонкой, у первой колонки свои ряды
+            strips = columns[0]
+            parts = [(strips[:1], rows[0], True), (strips[1:], rows[1], True)]
+        else:
+            # ряд за рядом
+            parts = [(rows[0], columns[0], False)]
+
+        nx = self._lod_step(plan.columns.steps.tile, delimiter)
+        ny = self._lod_step(plan.rows.steps.tile, delimiter)
+        self.lod_step = (max(self.lod_step[0], nx), max(self.lod_step[1], ny))
+
+        cw, ch = self.size
+        for outer, inner, outer_x in parts:
+            if outer_x:
+                xs, ys = self._axis_tiles(outer, nx, sx, cw), self._axis_tiles(inner, ny, sy, ch)
+            else:
+                ys, xs = self._axis_tiles(outer, ny, sy, ch), self._axis_tiles(inner, nx, sx, cw)
+            self._draw_grid(sx, sy, xs, ys, outer_x)
+
+        return offcut or 0
+
+    def _lod_step(self, tile, delimiter):
+        """Number of tiles drawn as one along an axis (whole tiles too small to see)."""
+        step = self.to_pixels(tile) + (self.to_pixels(delimiter) or 1)
+        if not self.LOD_MIN_TILE_PX or step >= self.LOD_MIN_TILE_PX:
+            return 1
+        return int(ceil(self.LOD_MIN_TILE_PX / step))
 
-    def get_draw(self):
-        return ImageDraw.Draw(self.im)
+    @staticmethod
+    def _axis_tiles(axis, n, offset, size):
+        """Tiles of the axis grouped by n, only those on the canvas.
+        :type axis: PixelAxis
+        :return: PixelAxis, layers
+        """
+        axis, layer = axis.aggregate(n)
+        on = axis.visible(-offset, size - 1 - offset)
+        return axis[on], layer[on]
+
+    def _draw_grid(self, sx, sy, xs, ys, outer_x):
+        """Draw the product of columns and rows: by layers, every layer in the painting order.
+        :param outer_x: columns are painted one by one (else rows)
+        """
+        (cols, col_layer), (rows, row_layer) = xs, ys
+        outer, inner = (col_layer, row_layer) if outer_x else (row_layer, col_layer)
+        for lo in np.unique(outer):
+            for li in np.unique(inner):
+                if outer_x:
+                    ci, ri = np.meshgrid(np.flatnonzero(col_layer == lo), np.flatnonzero(row_layer == li), indexing='ij')
+                else:
+                    ri, ci = np.meshgrid(np.flatnonzero(row_layer == lo), np.flatnonzero(col_layer == li), indexing='ij')
+                ci, ri = ci.ravel(), ri.ravel()
+                cut = (
+                    cols.cut_lo[ci] * CUT_LEFT
+                    | cols.cut_hi[ci] * CUT_RIGHT
+                    | rows.cut_lo[ri] * CUT_TOP
+                    | rows.cut_hi[ri] * CUT_BOTTOM
+                ).astype(np.uint8)
+                count('tiles', len(ci))
+                self.draw_tiles(cols.x0[ci] + sx, rows.x0[ri] + sy, cols.x1[ci] + sx, rows.x1[ri] + sy, cut)
+
+    def _draw_lattice(self, sx, sy, plan):
+        """Rotated tiles, groups of n * n tiles are drawn as one when the tiles are too small.
+        :type plan: DiagonalPlan
+        """
+        sf = self._scale_factor
+        su, sv = plan.tw + plan.d, plan.th + plan.d
+        n = 1
+        if self.LOD_MIN_TILE_PX and min(su, sv) * sf < self.LOD_MIN_TILE_PX:
+            n = int(ceil(self.LOD_MIN_TILE_PX / (min(su, sv) * sf)))
+            self.lod_step = (max(self.lod_step[0], n), max(self.lod_step[1], n))
+
+        ox, oy = plan.to_surface(-plan.tw / 2, -plan.th / 2)
+        x0, y0, x1, y1 = plan.rect
+        count('tiles', len(plan))
+
+        self._display_list.lattice(Lattice(
+            (sx + ox * sf, sy + oy * sf),
+            plan.angle,
+            (n * su * sf, n * sv * sf),
+            ((n * su - plan.d) * sf, (n * sv - plan.d) * sf),
+            (sx + self.to_pixels(x0), sy + self.to_pixels(y0), sx + self.to_pixels(x1) - 1, sy + self.to_pixels(y1) - 1),
+        ))
+
+    def watermark(self, text):
+        """Put the watermark over everything drawn."""
+        im = self.im
+        with stage('watermark'):
+            apply_watermark(im, text)
+
+    def clip(self, x0, y0, x1, y1):
+        """Erase everything drawn outside the box (in place, same as cropping to the box)."""
+        self.flush()
+        a = self._get_frame().rgba
+        for region in (a[:y0], a[y1:], a[y0:y1, :x0], a[y0:y1, x1:]):
+            region[...] = 255
+
+    def flush(self):
+        """Draw all recorded primitives."""
+        if not len(self._display_list):
+            return
+        with stage('raster'):
+            items = self._display_list.optimize()
+            self._display_list.clear()
+            self._backend.render(self._get_frame(), items)
 
     def save_to_file(self, filename):
         self.im.save(filename, "PNG")
@@ -173,7 +461,6 @@ class Tile(Object):
         self.diag = diag
 
     def _direct_draw(self, canvas, start_pos, **kwargs):
-        d = canvas.get_draw()
         wpix = canvas.to_pixels(self.width)
         hpix = canvas.to_pixels(self.height)
 
@@ -196,34 +483,34 @@ class Tile(Object):
         #     return
 
         # fill shape
-        d.polygon([
+        canvas.polygon([
             (sp.x, sp.y),
             (sp.x + wpix, sp.y),
             (sp.x + wpix, sp.y + hpix),
             (sp.x, sp.y + hpix)
-        ], fill="#b9cbda")
+        ], fill=color_tile)
 
         # top line
         self._draw_line(
-            d, sp.x, sp.y, sp.x + wpix, sp.y,
+            canvas, sp.x, sp.y, sp.x + wpix, sp.y,
             color=color if self.start_y is None else color_cutted
         )
 
         # left line
         self._draw_line(
-            d, sp.x, sp.y + hpix, sp.x, sp.y,
+            canvas, sp.x, sp.y + hpix, sp.x, sp.y,
             color=color if self.start_x is None else color_cutted
         )
 
         # right line
         self._draw_line(
-            d, sp.x + wpix, sp.y, sp.x + wpix, sp.y + hpix,
+            canvas, sp.x + wpix, sp.y, sp.x + wpix, sp.y + hpix,
             color=color if self.max_x is None else color_cutted
         )
 
         # bottom line
         self._draw_line(
-            d, sp.x + wpix, sp.y + hpix, sp.x, sp.y + hpix,
+            canvas, sp.x + wpix, sp.y + hpix, sp.x, sp.y + hpix,
             color=color if self.max_y is None else color_cutted
         )
 
@@ -294,6 +581,9 @@ class Wall(Object):
             assert options['door_width'] <= w
         if 'door_height' in options and options['door_height'] is not None:
             assert options['door_height'] <= h
+        for ox, oy, ow, oh in options.get('openings') or ():
+            if ow <= 0 or oh <= 0 or ox < 0 or oy < 0 or ox + ow > w or oy + oh > h:
+                raise Exception("openings: invalid value")
 
         if w <= 0:
             raise Exception("w: invalid value")
@@ -306,30 +596,84 @@ class Wall(Object):
         self.width = w
 
         self._tile_opt = tile
-        d = self._tile_opt.delimiter
-        tw = self._tile_opt.width
-        twd = tw+d  # длина плитки с последующим! разделителем
-        th = self._tile_opt.height
-        # thd = th+d
-        tsx = (self._tile_opt.start_x or 0)
-        clear_width = self.width - (tsx + d)
-
-        self._tile_opt.max_x = None
-        ceil_num = ceil(clear_width/twd)
-
-        if ceil_num * twd > clear_width:
-            self._tile_opt.max_x = tw - ((ceil_num * twd) - clear_width)
+        self._opt = (options or {})
+        self._layouts = {}
 
+        # подрезка последней плитки ряда (мм) - начало следующей стены
+        self._tile_opt.max_x = self.get_layout().offcut
         self._tile_opt.max_y = None
 
-        self._opt = (options or {})
-
     def get_tile_options(self):
         return self._tile_opt
 
+    def _drawn_offcut(self):
+        """Offcut (mm) the picture continues with when no cut tile is seen in pixels:
+        counted the way the drawing always did, the first tile is counted whole.
+        """
+        d = self._tile_opt.delimiter
+        tw = self._tile_opt.width
+        twd = tw + d  # длина плитки с последующим! разделителем
+        clear_width = self.width - ((self._tile_opt.start_x or 0) + d)
+        ceil_num = ceil(clear_width / twd)
+        if ceil_num * twd > clear_width:
+            return tw - ((ceil_num * twd) - clear_width)
+        return None
+
     def get_size(self):
         return Size(self.width, self.height)
 
+    def is_door(self):
+        return 'door_width' in self._opt and 'door_height' in self._opt \
+               and self._opt['door_width'] is not None and self._opt['door_height'] is not None
+
+    def get_door_area(self):
+        """Door position on the wall (mm): x, y, width, height."""
+        dw = self._opt['door_width']
+        dh = self._opt['door_height']
+        return (self.width - dw) / 2, self.height - dh, dw, dh
+
+    def _opening_box(self, canvas, start_pos, area):
+        if not self.is_door() or area != self.get_door_area():
+            return super(Wall, self)._opening_box(canvas, start_pos, area)
+
+        # дверь - от центра стены в пикселях
+        sp = start_pos
+        center_x = sp.x + canvas.to_pixels(self.width) // 2
+        door_width_half_px = canvas.to_pixels(self._opt['door_width']) / 2
+        bottom = sp.y + canvas.to_pixels(self.height)
+        return (
+            center_x - door_width_half_px, bottom - canvas.to_pixels(self._opt['door_height']),
+            center_x + door_width_half_px, bottom,
+        )
+
+    def get_openings(self):
+        """Door and other openings of the wall (mm, from the top left corner): x, y, width, height.
+
+        Openings of the options are given by the height above the floor:
+        (x, y, width, height), y - bottom of the opening.
+        """
+        areas = [self.get_door_area()] if self.is_door() else []
+        areas.extend((x, self.height - y - h, w, h) for x, y, w, h in self._opt.get('openings') or ())
+        return areas
+
+    def get_layout(self, y_direction=-1):
+        """
+        :param y_direction:  1-сверху вниз/-1-снизу вверх
+        :rtype: LayoutPlan
+        """
+        if y_direction not in self._layouts:
+            with stage('layout'):
+                plan = direct_layout(
+                    self.width, self.height,
+                    self._tile_opt.width, self._tile_opt.height, self._tile_opt.delimiter,
+                    sx=self._tile_opt.start_x, sy=self._tile_opt.start_y,
+                    y_dir=y_direction
+                )
+                plan.exclude(self.get_openings())
+            self._layouts[y_direction] = plan
+
+        return self._layouts[y_direction]
+
     def draw(self, canvas, start_pos, **kwargs):
         """
         :param canvas:
@@ -337,20 +681,20 @@ class Wall(Object):
         :param start_pos:
         :type start_pos: Position
         :param y_direction:  1-сверху вниз/-1-снизу вверх
+        :param window: only tiles in (x0, y0, x1, y1) of the wall (mm)
         :return:
         """
         y_direction = kwargs.get('y_direction', -1)
 
-        d = canvas.get_draw()
         wpix = canvas.to_pixels(self.width)
         hpix = canvas.to_pixels(self.height)
         sp = start_pos
 
         # Рисуем общий контур стены
-        self._draw_line(d, sp.x, sp.y, sp.x + wpix, sp.y)
-        self._draw_line(d, sp.x + wpix, sp.y, sp.x + wpix, sp.y + hpix)
-        self._draw_line(d, sp.x + wpix, sp.y + hpix, sp.x, sp.y + hpix)
-        self._draw_line(d, sp.x, sp.y + hpix, sp.x, sp.y)
+        self._draw_line(canvas, sp.x, sp.y, sp.x + wpix, sp.y)
+        self._draw_line(canvas, sp.x + wpix, sp.y, sp.x + wpix, sp.y + hpix)
+        self._draw_line(canvas, sp.x + wpix, sp.y + hpix, sp.x, sp.y + hpix)
+        self._draw_line(canvas, sp.x, sp.y + hpix, sp.x, sp.y)
 
         # Рисуем внешний контур для размеров
         if 'contour_out' in self._opt:
@@ -360,133 +704,16 @@ class Wall(Object):
             self.draw_contour_out(canvas, start_pos, length)  # TODO: away from here...
 
         # Рисуем плитки
-        tile_wpix = canvas.to_pixels(self._tile_opt.width)
-        tile_hpix = canvas.to_pixels(self._tile_opt.height)
-        tile_dpix = canvas.to_pixels(self._tile_opt.delimiter) or 1
-
-        tile = Tile(self._tile_opt.width, self._tile_opt.height)
-
-        local = Position()
-        first_x = True
-        first_y = True
-        tiles_count = 0
-
-        is_door_draw = 'door_width' in self._opt and 'door_height' in self._opt \
-                       and self._opt['door_width'] is not None and self._opt['door_height'] is not None
-        center = Position(sp.x + wpix // 2, sp.y + hpix // 2)  # цетр стены с учетом начального положения
-
-        if is_door_draw:
-            door_size = Size(
-                canvas.to_pixels(self._opt['door_width']),
-                canvas.to_pixels(self._opt['door_height'])
-            )
-            door_pos = Position(center.x - (door_size.width/2), sp.y + hpix - door_size.height)
-
-        while True:
-            local.y += tile_dpix  # ряд начинается с разделителя
-
-            start_y = None
-            max_y = None
-
-            if local.y + tile_hpix > hpix - tile_dpix:  # целая плитка не входит
-                if y_direction == 1:  # подрезка снизу
-                    max_y = (hpix - tile_dpix) - local.y
-                elif y_direction == -1:  # подрезка сверху
-                    start_y = (local.y + tile_hpix) - (hpix - tile_dpix)
-                else:
-                    raise Exception("invalid y_direction")
-
-            while True:
-                sp1 = copy.copy(sp)
-                local.x += tile_dpix  # ряд начинается с разделителя
-
-                start_x = None
-                max_x = None
-
-                # если в настройках стены есть сдвиги добавляем их первому ряду плиток
-                if self._tile_opt.start_x and first_x:
-                    start_x = canvas.to_pixels(self._tile_opt.start_x)
-                    sp1.x -= start_x
-
-                if self._tile_opt.start_y and first_y:
-                    start_y = canvas.to_pixels(self._tile_opt.start_y)
-
-                if local.x + tile_wpix + tile_dpix > wpix:
-                    max_x = (wpix - tile_dpix) - local.x
-
-                tile.start_x = start_x
-                tile.start_y = start_y
-                tile.max_x = max_x
-                tile.max_y = max_y
-
-                if y_direction == 1:
-                    pos = Position(
-                        sp1.x + local.x,
-                        sp1.y + local.y
-                    )
-                elif y_direction == -1:
-                    pos = Position(
-                        sp1.x + local.x,
-                        sp1.y + hpix - (local.y + tile_hpix)
-                    )
-                else:
-                    raise Exception("invalid y_direction")
-
-                tile_pos = PositionalObject(tile, pos)
-                if not is_door_draw or not tile_pos.is_in_area(door_pos, door_size, canvas):
-                    tile_pos.draw(canvas)
+        plan = self.get_layout(y_direction)
+        if kwargs.get('window'):
+            plan = plan.crop(*kwargs['window'])
+        max_x = canvas.draw_layout(sp, plan, self._tile_opt.delimiter)
+        if max_x is not None:
+            # запомним подрезку последней плитки, как она нарисована
+            self._tile_opt.max_x = max_x / canvas.scale_factor if max_x > 0 else self._drawn_offcut()
 
-                if tile.start_x is None:  # если плитка не подрезка с предыдущей стены
-                    tiles_count += 1
-
-                if max_x is not None and max_x > 0:
-                    local.x += tile_dpix
-                    local.x += max_x - (start_x or 0)
-                    self._tile_opt.max_x = max_x / canvas._scale_factor  # запомним подрезку последней плитки
-                else:
-                    local.x += tile_wpix - (start_x or 0)
-
-                # if tile_dpix > 2:
-                #     x += tile_dpix-2
-                if local.x >= wpix:
-                    break
-
-                first_x = False
-
-            # ---------
-            local.x = 0
-            first_x = True
-
-            if start_y is not None:
-                local.y += tile_hpix  # -start_y
-            else:
-                local.y += tile_hpix
-
-            if local.y >= hpix:
-                break
-
-        # Draw the door
-        if 'door_width' in self._opt and 'door_height' in self._opt \
-                and self._opt['door_width'] is not None and self._opt['door_height'] is not None:
-            door_width_half_px = canvas.to_pixels(self._opt['door_width'])/2
-            door_height_px = canvas.to_pixels(self._opt['door_height'])
-
-            # Рисование двери заливкой
-            # draw = canvas.get_draw()
-            d.polygon([
-                (center.x-door_width_half_px, sp.y+hpix),
-                (center.x-door_width_half_px, sp.y+hpix-door_height_px),
-                (center.x+door_width_half_px, sp.y+hpix-door_height_px),
-                (center.x+door_width_half_px, sp.y+hpix),
-            ], fill="#fff")
-
-            # Рисование двери линиями
-            self._draw_line(d, center.x - door_width_half_px, sp.y + hpix,
-                            center.x - door_width_half_px, sp.y + hpix - door_height_px, color=color_cutted)
-            self._draw_line(d, center.x + door_width_half_px, sp.y + hpix,
-                            center.x + door_width_half_px, sp.y + hpix - door_height_px, color=color_cutted)
-            self._draw_line(d, center.x - door_width_half_px, sp.y + hpix - door_height_px,
-                            center.x + door_width_half_px, sp.y + hpix - door_height_px, color=color_cutted)
+        # Дверь и другие проемы
+        self._draw_openings(canvas, sp, self.get_openings())
 
         # TODO: other objects ...
 
@@ -496,260 +723,87 @@ class Wall(Object):
             wpix,  # width
             hpix,  # height
         )
-        print("tiles count=%d" % tiles_count)
-
         return bound_box_in_canvas
 
     def draw_contour_out(self, canvas, start_pos, length):
-        d = canvas.get_draw()
         wpix = canvas.to_pixels(self.width)
         hpix = canvas.to_pixels(self.height)
         sp = start_pos
 
-        self._draw_line(d, sp.x, sp.y, sp.x - length, sp.y)
-        self._draw_line(d, sp.x, sp.y, sp.x, sp.y - length)
+        self._draw_line(canvas, sp.x, sp.y, sp.x - length, sp.y)
+        self._draw_line(canvas, sp.x, sp.y, sp.x, sp.y - length)
 
-        self._draw_line(d, sp.x+wpix, sp.y, sp.x+wpix + length, sp.y)
-        self._draw_line(d, sp.x+wpix, sp.y, sp.x+wpix, sp.y - length)
+        self._draw_line(canvas, sp.x+wpix, sp.y, sp.x+wpix + length, sp.y)
+        self._draw_line(canvas, sp.x+wpix, sp.y, sp.x+wpix, sp.y - length)
 
-        self._draw_line(d, sp.x, sp.y+hpix, sp.x - length, sp.y + hpix)
-        self._draw_line(d, sp.x, sp.y+hpix, sp.x, sp.y + hpix + length)
+        self._draw_line(canvas, sp.x, sp.y+hpix, sp.x - length, sp.y + hpix)
+        self._draw_line(canvas, sp.x, sp.y+hpix, sp.x, sp.y + hpix + length)
 
-        self._draw_line(d, sp.x + wpix, sp.y + hpix, sp.x + wpix + length, sp.y + hpix)
-        self._draw_line(d, sp.x + wpix, sp.y + hpix, sp.x + wpix, sp.y + hpix + length)
+        self._draw_line(canvas, sp.x + wpix, sp.y + hpix, sp.x + wpix + length, sp.y + hpix)
+        self._draw_line(canvas, sp.x + wpix, sp.y + hpix, sp.x + wpix, sp.y + hpix + length)
 
 
 class AbstractFloorDrawingMethod(metaclass=ABCMeta):
 
     @abstractstaticmethod
-    def draw_floor(canvas, start_pos, size_pix, tile_opt, y_dir):
+    def layout(size, tile_opt, y_dir, options):
+        """
+        :param size: floor size (mm)
+        :type size: Size
+        :type tile_opt: WallTilesOptions
+        :param options: options of the floor
+        :rtype: LayoutPlan
+        """
         pass
 
 
 class DirectFloorDrawingMethod(AbstractFloorDrawingMethod):
 
     @staticmethod
-    def draw_floor(canvas, start_pos, size_pix, tile_opt, y_dir):
-        tile_wpix = canvas.to_pixels(tile_opt.width)
-        tile_hpix = canvas.to_pixels(tile_opt.height)
-        tile_dpix = canvas.to_pixels(tile_opt.delimiter) or 1
-
-        tile = Tile(tile_opt.width, tile_opt.height)
-
-        local = Position()
-        tiles_count = 0
-
-        sp = copy.copy(start_pos)
-        wpix, hpix = size_pix.width, size_pix.height
-
-        while True:
-            local.y += tile_dpix  # ряд начинается с разделителя
-
-            start_y = None
-            max_y = None
-
-            if local.y + tile_hpix > hpix - tile_dpix:  # целая плитка не входит
-                if y_dir == 1:  # подрезка снизу
-                    max_y = (hpix - tile_dpix) - local.y
-                elif y_dir == -1:  # подрезка сверху
-                    start_y = (local.y + tile_hpix) - (hpix - tile_dpix)
-                else:
-                    raise Exception("invalid y_direction")
-
-            while True:
-                local.x += tile_dpix  # ряд начинается с разделителя
-
-                start_x = None
-                max_x = None
-
-                tmp = (local.x + tile_wpix + tile_dpix) - wpix
-                if tmp > 0:
-                    max_x = tile_wpix - ((local.x + tile_wpix + tile_dpix) - wpix)
-
-                tile.start_x = start_x
-                tile.start_y = start_y
-                tile.max_x = max_x
-                tile.max_y = max_y
-
-                if y_dir == 1:
-                    pos = Position(
-                        sp.x + local.x,
-                        sp.y + local.y
-                    )
-                elif y_dir == -1:
-                    pos = Position(
-                        sp.x + local.x,
-                        sp.y + hpix - (local.y + tile_hpix)
-                    )
-                else:
-                    raise Exception("invalid y_direction")
-
-                tile_pos = PositionalObject(tile, pos, {'y_direction': y_dir})
-                tile_pos.draw(canvas)
-
-                if tile.start_x is None:  # если плитка не подрезка с предыдущей стены
-                    tiles_count += 1
-
-                if max_x is not None and max_x > 0:
-                    local.x += tile_dpix
-                    local.x += max_x - (start_x or 0)
-                    tile_opt.max_x = max_x / canvas._scale_factor  # запомним подрезку последней плитки
-                else:
-                    local.x += tile_wpix - (start_x or 0)
-
-                # if tile_dpix > 2:
-                #     x += tile_dpix-2
-                if local.x >= wpix:
-                    break
-
-                # first_x = False
-
-            # ---------
-            local.x = 0
-            # first_x = True
-
-            if start_y is not None:
-                local.y += tile_hpix  # -start_y
-            else:
-                local.y += tile_hpix
-
-            if local.y >= hpix:
-                break
+    def layout(size, tile_opt, y_dir, options):
+        return direct_layout(
+            size.width, size.height,
+            tile_opt.width, tile_opt.height, tile_opt.delimiter,
+            y_dir=y_dir
+        )
 
 
 class CenterFloorDrawingMethod(AbstractFloorDrawingMethod):
 
     @staticmethod
-    def draw_floor(canvas, start_pos, size_pix, tile_opt, y_dir):
-        tile_wpix = canvas.to_pixels(tile_opt.width)
-        tile_hpix = canvas.to_pixels(tile_opt.height)
-        tile_dpix = canvas.to_pixels(tile_opt.delimiter) or 1
-
-        tile = Tile(tile_opt.width, tile_opt.height)
-
-        sp = copy.copy(start_pos)
-        wpix, hpix = size_pix.width, size_pix.height
-
-        # находим центр
-        center = Position(
-            (wpix - tile_wpix) // 2,
-            (hpix - tile_hpix) // 2
+    def layout(size, tile_opt, y_dir, options):
+        return center_layout(
+            size.width, size.height,
+            tile_opt.width, tile_opt.height, tile_opt.delimiter
         )
-        tiles_count = 0  # optional
-
-        def draw_stip(center):
-            nonlocal tiles_count
-
-            local_center = copy.copy(center)  # начальная позиция
-
-            # рисуем центр
-            pos = Position(
-                sp.x + local_center.x,
-                sp.y + local_center.y
-            )
-            tile_pos = PositionalObject(tile, pos,  {'y_direction': y_dir})
-            tile_pos.draw(canvas)
-            tiles_count += 1
-
-            local = copy.copy(local_center)
-            local.y += tile_hpix - tile_dpix
-
-            # вниз от центра
-            while True:
-                local.y += tile_dpix
-
-                if local.y + tile_hpix > hpix - tile_hpix:  # целая плитка не входит
-                    tile.start_y = None
-                    tile.max_y = (hpix - tile_dpix) - local.y
-                else:
-                    tile.start_y = None
-                    tile.max_y = None
-
-                pos = Position(
-                    sp.x + local.x,
-                    sp.y + local.y
-                )
-                tile_pos = PositionalObject(tile, pos,  {'y_direction': y_dir})
-                tile_pos.draw(canvas)
-                tiles_count += 1
 
-                local.y += tile_hpix
-                if local.y > hpix:
-                    break
-
-            local = copy.copy(local_center)
-
-            # вверх от центра
-            while True:
-                local.y -= tile_dpix
-                if local.y < 0:  # целая плитка не входит
-                    tile.start_y = local.y * -1
-                    tile.max_y = None
-                else:
-                    tile.start_y = None
-                    tile.max_y = None
-
-                pos = Position(
-                    sp.x + local.x,
-                    sp.y + local.y
-                )
-                tile_pos = PositionalObject(tile, pos,  {'y_direction': y_dir})
-                tile_pos.draw(canvas)
-                tiles_count += 1
-
-                local.y -= tile_hpix
-                if local.y < -tile_hpix:
-                    break
 
-        local_center = copy.copy(center)
-        draw_stip(local_center)  # центральная полоса
-        local_center.x += tile_wpix
-
-        # полосы справа
-        while True:
-            local_center.x += tile_dpix
-
-            if local_center.x + tile_wpix > wpix - tile_wpix:  # целая плитка не входит
-                tile.start_x = None
-                tile.max_x = (wpix - tile_dpix) - local_center.x
-            else:
-                tile.start_x = None
-                tile.max_x = None
-
-            draw_stip(local_center)
-
-            local_center.x += tile_wpix
-            if local_center.x > wpix:
-                break
-
-        # полосы слева
-        local_center = copy.copy(center)
-        while True:
-            local_center.x -= tile_wpix + tile_dpix
-
-            if local_center.x < 0:  # целая плитка не входит
-                tile.start_x = local_center.x * -1
-                tile.max_x = None
-            else:
-                tile.start_x = None
-                tile.max_x = None
+class DiagonalFloorDrawingMethod(AbstractFloorDrawingMethod):
 
-            draw_stip(local_center)
-            if local_center.x < 0:
-                break
+    @staticmethod
+    def layout(size, tile_opt, y_dir, options):
+        return diagonal_layout(
+            size.width, size.height,
+            tile_opt.width, tile_opt.height, tile_opt.delimiter,
+            options.get('angle', DIAGONAL_ANGLE)
+        )
 
 
-class DiagonalFloorDrawingMethod(AbstractFloorDrawingMethod):
+class AutoFloorDrawingMethod(AbstractFloorDrawingMethod):
 
     @staticmethod
-    def draw_floor(canvas, start_pos, size_pix, tile_opt, y_dir):
-        pass
+    def layout(size, tile_opt, y_dir, options):
+        return auto_layout(
+            size.width, size.height,
+            tile_opt.width, tile_opt.height, tile_opt.delimiter
+        )
 
 
 FLOOR_DRAWING_METHODS = {
     LAYING_METHOD_DIRECT: DirectFloorDrawingMethod,
     LAYING_METHOD_DIRECT_CENTER: CenterFloorDrawingMethod,
-    LAYING_METHOD_DIAGONAL: DiagonalFloorDrawingMethod
+    LAYING_METHOD_DIAGONAL: DiagonalFloorDrawingMethod,
+    LAYING_METHOD_AUTO: AutoFloorDrawingMethod,
 }
 
 
@@ -759,6 +813,10 @@ class Floor(Object):
     DEFAULT_DIRECTION = 1
 
     def __init__(self, w, l, tile, options=None):
+        """
+        :param options: angle - rotation of the tiles of LAYING_METHOD_DIAGONAL (degrees),
+            openings - list of (x, y, width, height) (mm, x - along the length)
+        """
         super(Floor, self).__init__()
 
         self.width = w
@@ -766,24 +824,49 @@ class Floor(Object):
         self._tile_opt = tile
 
         self._opt = options or {}
+        self._layouts = {}
+
+        for ox, oy, ow, oh in self._opt.get('openings') or ():
+            if ow <= 0 or oh <= 0 or ox < 0 or oy < 0 or ox + ow > l or oy + oh > w:
+                raise Exception("openings: invalid value")
+
+    def get_openings(self):
+        """Openings of the floor (mm): x, y, width, height."""
+        return list(self._opt.get('openings') or ())
+
+    def get_layout(self, method=LAYING_METHOD_DIRECT, y_direction=DEFAULT_DIRECTION):
+        """
+        :rtype: LayoutPlan
+        """
+        assert method in FLOOR_DRAWING_METHODS, f'Unknown floor drawing method: {method}'
+
+        key = (method, y_direction)
+        if key not in self._layouts:
+            with stage('layout'):
+                plan = FLOOR_DRAWING_METHODS[method].layout(
+                    self.get_size(), self._tile_opt, y_direction, self._opt
+                )
+                plan.exclude(self.get_openings())
+            self._layouts[key] = plan
+
+        return self._layouts[key]
 
     def draw(self, canvas, start_pos, **kwargs):
         drawing_method = kwargs.get('method', LAYING_METHOD_DIRECT)
-        assert drawing_method in FLOOR_DRAWING_METHODS, f'Unknown floor drawing method: {drawing_method}'
-
         y_dir = kwargs.get('y_direction', Floor.DEFAULT_DIRECTION)
+        plan = self.get_layout(drawing_method, y_dir)
+        if kwargs.get('window'):
+            plan = plan.crop(*kwargs['window'])
 
-        d = canvas.get_draw()
         wpix = canvas.to_pixels(self.length)
         hpix = canvas.to_pixels(self.width)
         sp = start_pos
-        size_pix = Size(wpix, hpix)
 
         # Рисуем общий контур стены
-        self._draw_line(d, sp.x, sp.y, sp.x + wpix, sp.y)
-        self._draw_line(d, sp.x + wpix, sp.y, sp.x + wpix, sp.y + hpix)
-        self._draw_line(d, sp.x + wpix, sp.y + hpix, sp.x, sp.y + hpix)
-        self._draw_line(d, sp.x, sp.y + hpix, sp.x, sp.y)
+        self._draw_line(canvas, sp.x, sp.y, sp.x + wpix, sp.y)
+        self._draw_line(canvas, sp.x + wpix, sp.y, sp.x + wpix, sp.y + hpix)
+        self._draw_line(canvas, sp.x + wpix, sp.y + hpix, sp.x, sp.y + hpix)
+        self._draw_line(canvas, sp.x, sp.y + hpix, sp.x, sp.y)
 
         # Рисуем внешний контур для размеров
         if 'contour_out' in self._opt:
@@ -793,7 +876,10 @@ class Floor(Object):
             self.draw_contour_out(canvas, start_pos, length)  # TODO: away from here...
 
         # Рисуем плитки
-        FLOOR_DRAWING_METHODS[drawing_method].draw_floor(canvas, start_pos, size_pix, self._tile_opt, y_dir)
+        canvas.draw_layout(sp, plan, self._tile_opt.delimiter)
+
+        # Проемы (колонны, короба)
+        self._draw_openings(canvas, sp, self.get_openings())
 
         # TODO: other objects ...
 
@@ -808,22 +894,21 @@ class Floor(Object):
         return bound_box_in_canvas
 
     def draw_contour_out(self, canvas, start_pos, length):
-        d = canvas.get_draw()
         wpix = canvas.to_pixels(self.length)
         hpix = canvas.to_pixels(self.width)
         sp = start_pos
 
-        self._draw_line(d, sp.x, sp.y, sp.x - length, sp.y)
-        self._draw_line(d, sp.x, sp.y, sp.x, sp.y - length)
+        self._draw_line(canvas, sp.x, sp.y, sp.x - length, sp.y)
+        self._draw_line(canvas, sp.x, sp.y, sp.x, sp.y - length)
 
-        self._draw_line(d, sp.x+wpix, sp.y, sp.x+wpix + length, sp.y)
-        self._draw_line(d, sp.x+wpix, sp.y, sp.x+wpix, sp.y - length)
+        self._draw_line(canvas, sp.x+wpix, sp.y, sp.x+wpix + length, sp.y)
+        self._draw_line(canvas, sp.x+wpix, sp.y, sp.x+wpix, sp.y - length)
 
-        self._draw_line(d, sp.x, sp.y+hpix, sp.x - length, sp.y + hpix)
-        self._draw_line(d, sp.x, sp.y+hpix, sp.x, sp.y + hpix + length)
+        self._draw_line(canvas, sp.x, sp.y+hpix, sp.x - length, sp.y + hpix)
+        self._draw_line(canvas, sp.x, sp.y+hpix, sp.x, sp.y + hpix + length)
 
-        self._draw_line(d, sp.x + wpix, sp.y + hpix, sp.x + wpix + length, sp.y + hpix)
-        self._draw_line(d, sp.x + wpix, sp.y + hpix, sp.x + wpix, sp.y + hpix + length)
+        self._draw_line(canvas, sp.x + wpix, sp.y + hpix, sp.x + wpix + length, sp.y + hpix)
+        self._draw_line(canvas, sp.x + wpix, sp.y + hpix, sp.x + wpix, sp.y + hpix + length)
 
     def get_size(self):
         return Size(self.length, self.width)
@@ -846,27 +931,6 @@ class PositionalObject:
     def draw(self, canvas):
         self._obj.draw(canvas, self.pos, **(self.options or {}))
 
-    def is_in_area(self, area_pos, area_size, canvas):
-        """
-        :param area_pos:
-        :type area_pos: Position
-        :param area_size:
-        :type area_size: Size
-        :param canvas:
-        :type canvas: Canvas
-        :return:
-        """
-        x0 = self.pos.x
-        x1 = self.pos.x + canvas.to_pixels(self._obj.get_size().width)
-        y0 = self.pos.y
-        y1 = self.pos.y + canvas.to_pixels(self._obj.get_size().height)
-        return (
-                x0 > area_pos.x
-                and x1 < area_pos.x + area_size.width
-                and y0 > area_pos.y
-                and y1 < area_pos.y + area_size.height
-        )
-
 
 class Draw:
     def draw(self, canvas, objects):
@@ -880,28 +944,7 @@ class Draw:
         for obj in objects:
             obj.draw(canvas)
 
-    def draw_wm(self, canvas):
-        image = canvas.im
-        text = DRAWING_WATERMARK_TEXT
-
-        watermark = Image.new('RGBA', size=image.size, color=0)
-        # watermark = Image.new('RGBA', size=(image.width, 64), color=0)
-        draw = ImageDraw.Draw(watermark)
-        font = get_font(60)
-        tw = None
-        th = None
-        while True:
-            tw, th = draw.textsize(text, font=font)
-            if tw + 10 < image.size[0] and th + 10 < image.size[1]:
-                break
-            font = get_font(font.size - 2)
-
-        draw.text(
-            (image.width / 2 - tw / 2, image.height / 2 - th / 2),
-            text,
-            fill=(0, 0, 0, 128),
-            font=font
-        )
+        canvas.flush()
 
-        # image.paste(watermark, box=(0, 15), mask=watermark)
-        canvas.im = Image.alpha_composite(image, watermark)
+    def draw_wm(self, canvas):
+        canvas.watermark(DRAWING_WATERMARK_TEXT)
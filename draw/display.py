@@ -0,0 +1,144 @@
+"""Display list of the canvas.
+
+Primitives are recorded in pixel coordinates and drawn by a backend
+in one pass (see `Canvas.flush`).
+"""
+import numpy as np
+
+
+LINE = 'line'
+POLYGON = 'polygon'
+TEXT = 'text'
+TILES = 'tiles'
+LAYOUT = 'layout'
+LATTICE = 'lattice'
+
+
+class Tiles:
+    """Batch of tiles: pixel rectangles (inclusive bounds) with CUT_* flags."""
+
+    def __init__(self, x0, y0, x1, y1, cut):
+        self.x0 = x0
+        self.y0 = y0
+        self.x1 = x1
+        self.y1 = y1
+        self.cut = cut
+
+    def __len__(self):
+        return len(self.x0)
+
+    def bbox(self):
+        return (
+            int(min(self.x0.min(), self.x1.min())), int(min(self.y0.min(), self.y1.min())),
+            int(max(self.x0.max(), self.x1.max())), int(max(self.y0.max(), self.y1.max())),
+        )
+
+    def overlaps(self, other):
+        """Bounding boxes of the batches intersect."""
+        ax0, ay0, ax1, ay1 = self.bbox()
+        bx0, by0, bx1, by1 = other.bbox()
+        return ax0 <= bx1 and bx0 <= ax1 and ay0 <= by1 and by0 <= ay1
+
+    @classmethod
+    def concat(cls, batches):
+        return cls(*(
+            np.concatenate([getattr(b, f) for b in batches])
+            for f in ('x0', 'y0', 'x1', 'y1', 'cut')
+        ))
+
+
+class Lattice:
+    """Rotated grid of tiles clipped by a rectangle, in pixels of the canvas."""
+
+    def __init__(self, origin, angle, step, tile, rect):
+        """
+        :param origin: corner of a tile (px)
+        :param angle: rotation (degrees)
+        :param step: step of the tiles along their sides (px)
+        :param tile: size of the tiles (px)
+        :param rect: clip rectangle x0, y0, x1, y1 (inclusive bounds, px)
+        """
+        self.origin = origin
+        self.angle = angle
+        self.step = step
+        self.tile = tile
+        self.rect = rect
+
+
+def _line_key(xy):
+    """Lines along an axis are the same for both directions."""
+    x0, y0, x1, y1 = xy
+    if (x0 == x1 or y0 == y1) and (x1, y1) < (x0, y0):
+        return x1, y1, x0, y0
+    return tuple(xy)
+
+
+class DisplayList:
+
+    def __init__(self):
+        self._items = []
+
+    def __len__(self):
+        return len(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def line(self, xy, fill, width=1):
+        self._items.append((LINE, _line_key(xy), fill, width))
+
+    def polygon(self, points, fill=None, outline=None):
+        self._items.append((POLYGON, tuple(tuple(p) for p in points), fill, outline))
+
+    def text(self, xy, text, fill, font):
+        self._items.append((TEXT, tuple(xy), text, fill, font))
+
+    def tiles(self, tiles):
+        """
+        :type tiles: Tiles
+        """
+        if len(tiles):
+            self._items.append((TILES, tiles))
+
+    def lattice(self, lattice):
+        """
+        :type lattice: Lattice
+        """
+        self._items.append((LATTICE, lattice))
+
+    def layout(self, origin, plan):
+        """Layout in mm for vector backends.
+        :param origin: position of the surface (px)
+        :type plan: LayoutPlan
+        """
+        self._items.append((LAYOUT, origin, plan))
+
+    def clear(self):
+        self._items = []
+
+    def optimize(self):
+        """Remove repeated primitives and merge consecutive non-overlapping tile batches.
+
+        Only the last copy of a primitive is kept: it is painted
+        over everything the earlier copies were.
+        :return: list of items
+        """
+        seen = set()
+        items = []
+        for item in reversed(self._items):
+            if item[0] not in (TILES, LAYOUT, LATTICE):
+                if item in seen:
+                    continue
+                seen.add(item)
+            items.append(item)
+        items.reverse()
+
+        merged = []
+        for item in items:
+            if item[0] == TILES and merged and merged[-1][0] == TILES \
+                    and not merged[-1][1].overlaps(item[1]):
+                merged[-1] = (TILES, Tiles.concat((merged[-1][1], item[1])))
+            else:
+                merged.append(item)
+
+        return merged
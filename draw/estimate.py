@@ -0,0 +1,139 @@
+"""Render-free estimate of a scheme: tile counts, cuts and cost.
+
+The numbers come from the same layouts `draw_floor1` and `draw_bathroom`
+draw, only nothing is rasterized.
+"""
+import numpy as np
+
+from .algorithms import calc_cost
+from .core import Floor, Wall, WallTilesOptions, Size, LAYING_METHOD_DIRECT, DIAGONAL_ANGLE, surface_openings
+from .layout import auto_wall_start
+from .offcuts import make_cut_plan
+
+
+# точность размеров подрезки в ответе (мм)
+CUT_SIZE_DECIMALS = 1
+
+
+def plan_summary(plan):
+    """Counts of the layout.
+    :type plan: LayoutPlan
+    :rtype: dict
+    """
+    w, h, cut, reused, n = plan.groups()
+    needed = ~reused
+    sel = needed & (cut != 0)
+
+    # одинаковые подрезки - одной строкой (ключ - оба размера в одном int64)
+    scale = 10 ** CUT_SIZE_DECIMALS
+    keys = (np.rint(w[sel] * scale).astype(np.int64) << 32) | np.rint(h[sel] * scale).astype(np.int64)
+    keys, inv = np.unique(keys, return_inverse=True)
+    counts = np.bincount(inv.ravel(), weights=n[sel], minlength=len(keys)).astype(np.int64)
+
+    return {
+        'tiles': int(n[needed].sum()),
+        'whole': int(n[needed & (cut == 0)].sum()),
+        'cut': int(n[sel].sum()),
+        'reused': int(n[reused].sum()),
+        'cuts': [
+            {'width': (k >> 32) / scale, 'height': (k & 0xffffffff) / scale, 'count': c}
+            for k, c in zip(keys.tolist(), counts.tolist())
+        ],
+    }
+
+
+def _merge_cuts(summaries):
+    cuts = {}
+    for s in summaries:
+        for c in s['cuts']:
+            key = (c['width'], c['height'])
+            cuts[key] = cuts.get(key, 0) + c['count']
+    return [{'width': w, 'height': h, 'count': n} for (w, h), n in sorted(cuts.items())]
+
+
+def estimate_floor(width, length, d, tw, th, method=LAYING_METHOD_DIRECT, angle=DIAGONAL_ANGLE, openings=None,
+                   cut_plan=False):
+    """Same layout as `draw_floor1`. X=length, Y=width
+    :param angle: rotation of the tiles for LAYING_METHOD_DIAGONAL (degrees)
+    :param openings: list of (x, y, width, height) of the floor (mm)
+    :param cut_plan: add the cut plan (see `offcuts.make_cut_plan`)
+    :rtype: dict
+    """
+    floor = Floor(width, length, WallTilesOptions(tw, th, d), options={'angle': angle, 'openings': openings})
+    plan = floor.get_layout(method)
+    result = plan_summary(plan)
+    if cut_plan:
+        result['cut_plan'] = make_cut_plan([plan], tw, th)
+    return result
+
+
+def estimate_bathroom(l, w, h, d, tw, th, door_size=None, openings=None, cut_plan=False, auto_start=False):
+    """Same walls as `draw_bathroom`: the offcut of the last tile of a wall
+    starts the next wall, the door is on the third wall.
+    :type door_size: Size
+    :param openings: openings of every wall (see `draw_bathroom`)
+    :param cut_plan: add the cut plan of all the walls (see `offcuts.make_cut_plan`)
+    :param auto_start: the offcut the first wall starts with is searched for (see `layout.auto_wall_start`)
+    :rtype: dict
+    """
+    openings = openings or [[]] * 4
+    plans = []
+    walls = []
+    offcut = auto_wall_start((l, w, l, w), tw, d) if auto_start else None
+    for i, width in enumerate((l, w, l, w)):
+        options = {'openings': openings[i]}
+        if i == 2 and door_size is not None:
+            options['door_width'] = door_size.width
+            options['door_height'] = door_size.height
+
+        wall = Wall(width, h, tile=WallTilesOptions(tw, th, d, sx=offcut), options=options)
+        plans.append(wall.get_layout())
+        summary = plan_summary(plans[-1])
+        offcut = wall.get_tile_options().max_x
+        summary.update(width=width, height=h, offcut=offcut)
+        walls.append(summary)
+
+    result = {
+        'tiles': sum(s['tiles'] for s in walls),
+        'whole': sum(s['whole'] for s in walls),
+        'cut': sum(s['cut'] for s in walls),
+        'reused': sum(s['reused'] for s in walls),
+        'cuts': _merge_cuts(walls),
+        'walls': walls,
+    }
+    if cut_plan:
+        result['cut_plan'] = make_cut_plan(plans, tw, th)
+    return result
+
+
+def estimate(params):
+    """Estimate of the normalized request (see `server.parse_estimate_args`).
+    :type params: dict
+    :rtype: dict
+    """
+    tile = params['tile']
+    opts = params['options']
+
+    if params['scheme'] == 'floor':
+        result = estimate_floor(
+            params['width'], params['length'],
+            tile['delimiter'], tile['width'], tile['length'], opts['method'],
+            opts.get('angle', DIAGONAL_ANGLE), surface_openings(opts.get('openings')),
+            cut_plan=opts.get('cut_plan', False)
+        )
+    else:
+        door = opts.get('door')
+        result = estimate_bathroom(
+            params['length'], params['width'], opts['height'],
+            tile['delimiter'], tile['width'], tile['length'],
+            Size(door['width'], door['height']) if door else None,
+            [surface_openings(opts.get('openings'), i) for i in range(4)],
+            cut_plan=opts.get('cut_plan', False), auto_start=opts.get('auto_start', False)
+        )
+
+    # покупаются плитки плана раскроя (без него - плитки раскладки)
+    tiles = result['cut_plan']['tiles'] if 'cut_plan' in result else result['tiles']
+    price = tile.get('price')
+    result['cost'] = calc_cost(tiles, price) if price is not None else None
+
+    return result
@@ -0,0 +1,131 @@
+"""Bounded pool for rendering off the IOLoop."""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+import threading
+import time
+
+
+EXECUTOR_THREAD = 'thread'
+EXECUTOR_PROCESS = 'process'
+
+EXECUTORS = {
+    EXECUTOR_THREAD: ThreadPoolExecutor,
+    EXECUTOR_PROCESS: ProcessPoolExecutor,
+}
+
+
+class QueueFull(Exception):
+    pass
+
+
+def _timed_call(enqueued, fn, args):
+    """Runs in the worker: returns time spent in the queue and the result."""
+    wait = time.time() - enqueued
+    return wait, fn(*args)
+
+
+class BoundedExecutor:
+    """Thread or process pool with a bounded queue.
+
+    When `workers` tasks are running and `queue_size` tasks are waiting
+    new tasks are rejected with QueueFull.
+    """
+
+    def __init__(self, workers, queue_size, kind=EXECUTOR_THREAD):
+        assert kind in EXECUTORS, f'Unknown executor: {kind}'
+
+        self.workers = workers
+        self.queue_size = queue_size
+        self._executor = EXECUTORS[kind](max_workers=workers)
+        self._lock = threading.Lock()
+        self._pending = 0
+
+        self.completed = 0
+        self.rejected = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    @property
+    def in_flight(self):
+        return min(self._pending, self.workers)
+
+    @property
+    def queue_depth(self):
+        return max(self._pending - self.workers, 0)
+
+    def _acquire(self):
+        with self._lock:
+            if self._pending >= self.workers + self.queue_size:
+                self.rejected += 1
+                raise QueueFull()
+            self._pending += 1
+
+    def _release(self, wait):
+        with self._lock:
+            self._pending -= 1
+            if wait is not None:
+                self.completed += 1
+                self.wait_total += wait
+                self.wait_max = max(self.wait_max, wait)
+
+    async def run(self, fn, *args):
+        """Run fn(*args) in the pool.
+        :raise QueueFull: the queue is full
+        """
+        self._acquire()
+        wait = None
+        try:
+            future = self._executor.submit(_timed_call, time.time(), fn, args)
+            wait, result = await asyncio.wrap_future(future)
+        finally:
+            self._release(wait)
+
+        return result
+
+    def stats(self):
+        return {
+            'workers': self.workers,
+            'queue_size': self.queue_size,
+            'in_flight': self.in_flight,
+            'queue_depth': self.queue_depth,
+            'completed': self.completed,
+            'rejected': self.rejected,
+            'wait_avg': self.wait_total / self.completed if self.completed else 0.0,
+            'wait_max': self.wait_max,
+        }
+
+    def shutdown(self):
+        self._executor.shutdown(wait=False)
+
+
+class SingleFlight:
+    """Concurrent calls with the same key share one execution.
+
+    The result or the error of the execution is returned to every caller.
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self.coalesced = 0
+
+    def __len__(self):
+        return len(self._calls)
+
+    async def run(self, key, coro_fn, *args):
+        """Await coro_fn(*args) or the same call in progress."""
+        future = self._calls.get(key)
+        if future is not None:
+            self.coalesced += 1
+        else:
+            future = asyncio.ensure_future(coro_fn(*args))
+            self._calls[key] = future
+            future.add_done_callback(lambda f: self._calls.pop(key, None))
+
+        # отмена одного ожидающего не отменяет общую задачу
+        return await asyncio.shield(future)
+
+    def stats(self):
+        return {
+            'in_flight': len(self._calls),
+            'coalesced': self.coalesced,
+        }
@@ -0,0 +1,223 @@
+"""Compact binary geometry of a scheme, drawn by the client itself.
+
+The payload is made of the same layouts `Floor.draw` and `Wall.draw`
+draw; columns and rows of grid layouts are sent as runs of equal tiles
+with a constant step, so the size of a regular layout does not depend
+on the number of tiles.
+
+Format (little endian, every section is aligned to 4 bytes, so arrays
+can be read by typed array views without copying):
+
+    header   magic 'TLAY', uint16 version, uint16 number of surfaces,
+             float32 scene width, height (mm)
+    surface  uint8 kind (SURFACE_*), uint8 layout (LAYOUT_*), uint16 0,
+             float32 x, y, width, height, contour marks length (mm),
+             uint32 a, b, number of hidden blocks, of openings, of cut by openings tiles
+             float32 openings [k][x, y, width, height] (mm, door included)
+    LAYOUT_GRID  (a runs of columns, b runs of rows, p tiles cut by openings)
+             float32 start[a], step[a], size[a], uint32 count[a],
+             uint8 flags[a] (CUT_LEFT, CUT_RIGHT, REUSED)
+             the same of the rows, flags: CUT_TOP, CUT_BOTTOM
+             uint32 hidden blocks [c0, c1, r0, r1] (inclusive indexes of tiles)
+             uint32 index[p], float32 [p][x, y, w, h], uint8 cut[p] (CUT_NOTCH included)
+    LAYOUT_TILES  (a visible tiles)
+             float32 x[a], y[a], w[a], h[a], uint8 cut[a]
+    LAYOUT_LATTICE  (a lattice rows, b cut tiles)
+             float32 angle (degrees), tile width, tile height, delimiter (mm),
+             int32 row j[a], first i0[a], last i1[a] of the whole tiles,
+             int32 i[b], j[b], uint8 vertices[b],
+             float32 [b][MAX_VERTICES][2] vertices of the cut parts (mm, padded)
+
+Tile j of a run starts at start + j * step, the index of a grid tile is
+row * columns + column. Tiles of a lattice under the openings are not
+excluded: the openings are drawn over them. Tile (i, j) of a lattice has
+the corner c + R * (i * (w + d) - w / 2, j * (h + d) - h / 2), c - center
+of the surface, R - rotation by the angle.
+Positions of the surfaces are in mm of the scene, positions of the tiles
+are in mm of their surface.
+"""
+import struct
+
+import numpy as np
+
+from .core import Wall, LAYING_METHOD_DIRECT
+from .layout import CUT_LEFT, CUT_TOP, CUT_RIGHT, CUT_BOTTOM, REUSED, EPS, DiagonalPlan, MAX_VERTICES
+from .metrics import stage, count
+from .scene import Scene
+
+
+MAGIC = b'TLAY'
+VERSION = 2
+CONTENT_TYPE = 'application/octet-stream'
+
+SURFACE_FLOOR = 1
+SURFACE_WALL = 2
+
+LAYOUT_GRID = 1
+LAYOUT_TILES = 2
+LAYOUT_LATTICE = 3
+
+_HEADER = struct.Struct('<4sHHff')
+_SURFACE = struct.Struct('<BBH5f5I')
+
+
+def _f32(a):
+    return np.asarray(a, dtype='<f4').tobytes()
+
+
+def _i32(a):
+    return np.asarray(a, dtype='<i4').tobytes()
+
+
+def _u8(a):
+    data = np.asarray(a, dtype=np.uint8).tobytes()
+    return data + b'\0' * (-len(data) % 4)
+
+
+def _runs(start, size, flags):
+    """Runs of the tiles of an axis: equal size and flags, constant step.
+    :return: parts of the payload, number of runs
+    """
+    n = len(start)
+    step = np.diff(start)
+    brk = np.zeros(n, dtype=bool)
+    brk[:1] = True
+    brk[1:] = (np.abs(np.diff(size)) > EPS) | (np.diff(flags) != 0)
+    # шаг внутри серии постоянный (сравнивается, если предыдущая плитка не начало серии)
+    brk[2:] |= (np.abs(np.diff(step)) > EPS) & ~brk[1:-1]
+
+    first = np.flatnonzero(brk)
+    counts = np.diff(np.append(first, n))
+    run_step = np.where(counts > 1, np.append(step, 0)[first], 0)
+
+    parts = [_f32(start[first]), _f32(run_step), _f32(size[first]),
+             counts.astype('<u4').tobytes(), _u8(flags[first])]
+    return parts, len(first)
+
+
+def _axis_flags(axis, lo_flag, hi_flag):
+    return (axis.cut_lo * lo_flag | axis.cut_hi * hi_flag).astype(np.uint8)
+
+
+def _surface(obj, x, y, options, contour):
+    """
+    :return: parts of the payload
+    :rtype: list
+    """
+    if isinstance(obj, Wall):
+        kind = SURFACE_WALL
+        plan = obj.get_layout(options.get('y_direction', -1))
+    else:
+        kind = SURFACE_FLOOR
+        plan = obj.get_layout(options.get('method', LAYING_METHOD_DIRECT), options.get('y_direction', 1))
+    size = obj.get_size()
+    openings = obj.get_openings()
+    surface = (x, y, size.width, size.height, contour)
+    areas = [np.asarray(openings, dtype='<f4').tobytes()]
+
+    if isinstance(plan, DiagonalPlan):
+        header = (kind, LAYOUT_LATTICE, 0, *surface, len(plan.rows), len(plan.cut_i), 0, len(openings), 0)
+        parts = areas + [
+            _f32([plan.angle, plan.tw, plan.th, plan.d]),
+            _i32(plan.rows), _i32(plan.whole_lo), _i32(plan.whole_hi),
+            _i32(plan.cut_i), _i32(plan.cut_j), _u8(plan.cut_n),
+            _f32(plan.cut_points),
+        ]
+    elif plan.columns is not None:
+        cols, rows = plan.columns, plan.rows
+        col_flags = _axis_flags(cols, CUT_LEFT, CUT_RIGHT)
+        if plan.reused_first_column and len(cols):
+            col_flags[0] |= REUSED * cols.cut_lo[0]
+        col_parts, a = _runs(cols.start, cols.size, col_flags)
+        row_parts, b = _runs(rows.start, rows.size, _axis_flags(rows, CUT_TOP, CUT_BOTTOM))
+
+        header = (kind, LAYOUT_GRID, 0, *surface, a, b, len(plan.hidden), len(openings), len(plan.part_idx))
+        parts = areas + col_parts + row_parts + [
+            np.asarray(plan.hidden, dtype='<u4').tobytes(),
+            plan.part_idx.astype('<u4').tobytes(), _f32(plan.part_box), _u8(plan.part_cut),
+        ]
+    else:
+        tx, ty, tw, th, cut = plan.tiles(plan.visible_indexes())
+        header = (kind, LAYOUT_TILES, 0, *surface, len(tx), 0, 0, len(openings), 0)
+        parts = areas + [_f32(tx), _f32(ty), _f32(tw), _f32(th), _u8(cut)]
+
+    return [_SURFACE.pack(*header)] + parts
+
+
+def encode_scene(scene):
+    """
+    :type scene: Scene
+    :rtype: bytes
+    """
+    parts = [_HEADER.pack(MAGIC, VERSION, len(scene.objects), scene.width, scene.height)]
+    for obj, x, y, options in scene.objects:
+        parts.extend(_surface(obj, x, y, options, scene.contour))
+    return b''.join(parts)
+
+
+def encode_geometry(params):
+    """Geometry payload of the normalized request (see `server.parse_draw_args`).
+    :rtype: bytes
+    """
+    with stage('layout'):
+        scene = Scene.from_params(params)
+    with stage('encode'):
+        data = encode_scene(scene)
+    count('encoded_bytes', len(data))
+    return data
+
+
+def _read_runs(take, n):
+    """Runs expanded to the tiles: start, size, flags."""
+    start, step, size, counts, flags = (
+        take('<f4', n), take('<f4', n), take('<f4', n), take('<u4', n), take(np.uint8, n)
+    )
+    j = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return (
+        np.repeat(start, counts) + j * np.repeat(step, counts),
+        np.repeat(size, counts),
+        np.repeat(flags, counts),
+    )
+
+
+def decode_geometry(data):
+    """Reference reader of the payload.
+    :rtype: dict
+    """
+    magic, version, n, width, height = _HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION:
+        raise Exception("unsupported geometry payload")
+    offset = _HEADER.size
+
+    def take(dtype, length):
+        nonlocal offset
+        a = np.frombuffer(data, dtype=dtype, count=length, offset=offset)
+        offset += a.nbytes + (-a.nbytes % 4)
+        return a
+
+    surfaces = []
+    for _ in range(n):
+        kind, layout, _, *values = _SURFACE.unpack_from(data, offset)
+        offset += _SURFACE.size
+        x, y, w, h, contour, a, b, nb, k, p = values
+        surface = {
+            'kind': kind, 'layout': layout, 'x': x, 'y': y, 'width': w, 'height': h,
+            'contour': contour, 'openings': take('<f4', k * 4).reshape(-1, 4),
+        }
+        if layout == LAYOUT_GRID:
+            surface['columns'] = _read_runs(take, a)
+            surface['rows'] = _read_runs(take, b)
+            surface['hidden'] = take('<u4', nb * 4).reshape(-1, 4)
+            surface['parts'] = (take('<u4', p), take('<f4', p * 4).reshape(-1, 4), take(np.uint8, p))
+        elif layout == LAYOUT_LATTICE:
+            surface['lattice'] = take('<f4', 4)
+            surface['rows'] = (take('<i4', a), take('<i4', a), take('<i4', a))
+            surface['cut'] = (
+                take('<i4', b), take('<i4', b), take(np.uint8, b),
+                take('<f4', b * MAX_VERTICES * 2).reshape(b, MAX_VERTICES, 2),
+            )
+        else:
+            surface['tiles'] = tuple(take('<f4', a) for _ in range(4)) + (take(np.uint8, a),)
+        surfaces.append(surface)
+
+    return {'version': version, 'width': width, 'height': height, 'surfaces': surfaces}
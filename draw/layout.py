@@ -0,0 +1,1025 @@
+"""Tile layout computation.
+
+The layout (placement of every tile) is computed once in millimetres and
+kept in NumPy arrays, so it can be counted, cached and rendered by any
+backend without a Python object per tile. Grid layouts keep only their
+columns and rows (runs of tiles), the blocks of tiles hidden by openings
+(doors, windows, niches) and the tiles the openings cut.
+"""
+from math import ceil, floor, cos, sin, radians
+
+import numpy as np
+
+
+# Флаги подрезки плитки (битовая маска)
+CUT_LEFT = 1
+CUT_TOP = 2
+CUT_RIGHT = 4
+CUT_BOTTOM = 8
+# косой рез (плитка повернута относительно поверхности)
+CUT_SLANT = 16
+# вырез под проем внутри плитки (окно, ниша, труба)
+CUT_NOTCH = 64
+# обрезок с предыдущей поверхности (только для группировки, не флаг подрезки)
+REUSED = 128
+
+# точность сравнений в мм
+EPS = 1e-6
+
+# как плитки оси шагаются в пикселях при отрисовке (см. pixels.py)
+STEPS_DIRECT = 'direct'  # от края, первая плитка - обрезок на shift короче
+STEPS_CENTER = 'center'  # от центральной плитки в обе стороны
+
+
+class AxisSteps:
+    """How the tiles of an axis were laid, the picture steps them the same way in pixels."""
+
+    def __init__(self, kind, tile, delimiter, shift=0, mirrored=False):
+        """
+        :param kind: STEPS_DIRECT, STEPS_CENTER
+        :param tile: tile size (mm)
+        :param delimiter: delimiter (mm)
+        :param shift: the first tile is shorter by `shift` (mm, STEPS_DIRECT), a negative
+            one makes it longer
+        :param mirrored: the tiles are laid from the upper side
+        """
+        self.kind = kind
+        self.tile = tile
+        self.delimiter = delimiter
+        self.shift = shift
+        self.mirrored = mirrored
+
+    def mirror(self):
+        return AxisSteps(self.kind, self.tile, self.delimiter, self.shift, not self.mirrored)
+
+
+class Axis:
+    """Tiles placement along one axis."""
+
+    def __init__(self, start, size, cut_lo, cut_hi, steps=None):
+        """
+        :param start: start of visible part of every tile (mm)
+        :type start: numpy.ndarray
+        :param size: visible size of every tile (mm)
+        :type size: numpy.ndarray
+        :param cut_lo: tile is cut at the lower side
+        :type cut_lo: numpy.ndarray
+        :param cut_hi: tile is cut at the upper side
+        :type cut_hi: numpy.ndarray
+        :param steps: how the tiles were laid (for the drawing)
+        :type steps: AxisSteps
+        """
+        self.start = start
+        self.size = size
+        self.cut_lo = cut_lo
+        self.cut_hi = cut_hi
+        self.steps = steps
+
+    def __len__(self):
+        return len(self.start)
+
+    def full_range(self):
+        """Indexes (first, last) of the contiguous whole tiles or None."""
+        full = np.flatnonzero(~(self.cut_lo | self.cut_hi))
+        if not len(full) or full[-1] - full[0] + 1 != len(full):
+            return None
+        return int(full[0]), int(full[-1])
+
+    def __getitem__(self, index):
+        """Part of the axis.
+        :type index: slice
+        :rtype: Axis
+        """
+        return Axis(self.start[index], self.size[index], self.cut_lo[index], self.cut_hi[index], self.steps)
+
+    def window(self, lo, hi):
+        """Slice of the tiles intersecting (lo, hi) (mm)."""
+        i0 = int(np.searchsorted(self.start + self.size, lo, side='right'))
+        i1 = int(np.searchsorted(self.start, hi, side='left'))
+        return slice(i0, max(i0, i1))
+
+    def mirror(self, length):
+        """Axis counted from the opposite side of `length`."""
+        return Axis(
+            (length - (self.start + self.size))[::-1],
+            self.size[::-1],
+            self.cut_hi[::-1],
+            self.cut_lo[::-1],
+            self.steps and self.steps.mirror(),
+        )
+
+
+def axis_layout(length, tile, delimiter, origin, steps=None):
+    """Lay tiles along one axis.
+
+    Tiles of size `tile` are separated by `delimiter`, one of them starts
+    at `origin`. Tiles are clipped by [delimiter, length - delimiter]
+    (the gap to the wall equals the delimiter).
+
+    :param length: length of the axis (mm)
+    :param tile: tile size (mm)
+    :param delimiter: delimiter (mm)
+    :param origin: start of any tile of the lattice (mm), may be negative
+    :param steps: how the tiles are stepped by the drawing, by default from the
+        lower side, shifted by the origin
+    :type steps: AxisSteps
+    :return: tiles placement
+    :rtype: Axis
+    """
+    step = tile + delimiter
+    lo = delimiter
+    hi = length - delimiter
+
+    k = np.arange(
+        floor((lo - origin - tile) / step),
+        ceil((hi - origin) / step) + 1
+    )
+    start = origin + k * step
+    end = start + tile
+
+    vstart = np.maximum(start, lo)
+    vend = np.minimum(end, hi)
+    keep = vend - vstart > EPS
+
+    if steps is None:
+        steps = AxisSteps(STEPS_DIRECT, tile, delimiter, (delimiter - origin) % step)
+
+    return Axis(
+        vstart[keep],
+        (vend - vstart)[keep],
+        (start < lo - EPS)[keep],
+        (end > hi + EPS)[keep],
+        steps,
+    )
+
+
+def axis_edges(length, tile, delimiter, origin):
+    """Edge tiles of `axis_layout` for many origins at once (no tiles are laid).
+
+    :param origin: origins (mm), array
+    :return: number of tiles, visible width of the first and of the last tile,
+        the first and the last tile are cut (arrays)
+    """
+    step = tile + delimiter
+    lo = delimiter
+    hi = length - delimiter
+
+    # первая плитка заходит за lo, последняя начинается до hi
+    k0 = np.floor((lo + EPS - origin - tile) / step) + 1
+    k1 = np.ceil((hi - EPS - origin) / step) - 1
+    s0 = origin + k0 * step
+    s1 = origin + k1 * step
+
+    return (
+        np.maximum(k1 - k0 + 1, 0).astype(np.int64),
+        np.minimum(s0 + tile, hi) - np.maximum(s0, lo),
+        np.minimum(s1 + tile, hi) - np.maximum(s1, lo),
+        s0 < lo - EPS,
+        s1 + tile > hi + EPS,
+    )
+
+
+class LayoutPlan:
+    """Placement of tiles on a rectangular surface.
+
+    All values are in mm, the origin is the top left corner of the surface.
+    Tiles are ordered row by row (top to bottom, left to right).
+
+    Every tile is kept in the arrays. Grid layouts are kept in the compact
+    form of `GridPlan`, both have the same interface for the counting and
+    the drawing code.
+    """
+
+    columns = None
+    rows = None
+
+    def __init__(self, width, height, x, y, w, h, cut, reused=None):
+        """
+        :param width: surface width (mm)
+        :param height: surface height (mm)
+        :param x: visible part of tile, X (mm)
+        :param y: visible part of tile, Y (mm)
+        :param w: visible part of tile, width (mm)
+        :param h: visible part of tile, height (mm)
+        :param cut: cut flags (CUT_* bit mask)
+        :param reused: tile is an offcut from the previous surface
+        """
+        self.width = width
+        self.height = height
+        self.x = x
+        self.y = y
+        self.w = w
+        self.h = h
+        self.cut = cut
+        self.reused = reused if reused is not None else np.zeros(len(x), dtype=bool)
+        self.visible = np.ones(len(x), dtype=bool)
+
+    @classmethod
+    def empty(cls, width, height):
+        e = np.zeros(0)
+        return cls(width, height, e, e, e, e, np.zeros(0, dtype=np.uint8))
+
+    def __len__(self):
+        return len(self.x)
+
+    def tiles(self, idx):
+        """Tiles by indexes: x, y, w, h (mm) and cut flags."""
+        return self.x[idx], self.y[idx], self.w[idx], self.h[idx], self.cut[idx]
+
+    def visible_indexes(self, idx=None):
+        """Indexes of the visible tiles (of `idx` or of all)."""
+        if idx is None:
+            return np.flatnonzero(self.visible)
+        return idx[self.visible[idx]]
+
+    def groups(self):
+        """Visible tiles grouped by equal size, cut flags and reuse.
+        :return: w, h, cut, reused, number of tiles (arrays, one item per group)
+        """
+        v = self.visible
+        return _group_tiles(self.w[v], self.h[v], self.cut[v] | self.reused[v] * REUSED)
+
+    def crop(self, x0, y0, x1, y1):
+        """A layout which is not a grid is returned as is.
+        :rtype: LayoutPlan
+        """
+        return self
+
+    def exclude(self, areas):
+        """Hide tiles which lie entirely in the openings, mark the tiles crossing them.
+        :param areas: list of (x, y, w, h) (mm)
+        """
+        for x, y, w, h in areas:
+            self.visible &= ~(
+                (self.x > x)
+                & (self.x + self.w < x + w)
+                & (self.y > y)
+                & (self.y + self.h < y + h)
+            )
+            self.cut |= (
+                (self.x < x + w - EPS)
+                & (self.x + self.w > x + EPS)
+                & (self.y < y + h - EPS)
+                & (self.y + self.h > y + EPS)
+            ).astype(np.uint8) * np.uint8(CUT_NOTCH)
+
+    @property
+    def count(self):
+        """Number of tiles needed (offcuts from the previous surface are not counted)."""
+        _, _, _, reused, n = self.groups()
+        return int(n[~reused].sum())
+
+    @property
+    def cut_count(self):
+        _, _, cut, reused, n = self.groups()
+        return int(n[~reused & (cut != 0)].sum())
+
+    @property
+    def offcut(self):
+        """Visible width of the cut tile in the last column (mm) or None."""
+        if self.columns is None or not len(self.columns) or not self.columns.cut_hi[-1]:
+            return None
+        return float(self.columns.size[-1])
+
+
+class BlockIndex:
+    """Union of blocks of grid tiles (c0, c1, r0, r1, inclusive) for lookups.
+
+    Bounds of the blocks split the grid into cells (coordinate compression),
+    a cell is covered by the blocks or not. A lookup is two binary searches,
+    so the cost does not depend on the number of blocks.
+    """
+
+    def __init__(self, blocks):
+        self.blocks = list(blocks)
+        if not self.blocks:
+            # поверхность без проемов - самый частый случай
+            self.xs = self.ys = np.zeros(0, dtype=np.int64)
+            self.covered = np.zeros((0, 0), dtype=bool)
+            return
+        self.xs = np.unique([b for c0, c1, _, _ in self.blocks for b in (c0, c1 + 1)]).astype(np.int64)
+        self.ys = np.unique([b for _, _, r0, r1 in self.blocks for b in (r0, r1 + 1)]).astype(np.int64)
+        self.covered = np.zeros((max(len(self.xs) - 1, 0), max(len(self.ys) - 1, 0)), dtype=bool)
+        for c0, c1, r0, r1 in self.blocks:
+            self.covered[
+                np.searchsorted(self.xs, c0):np.searchsorted(self.xs, c1 + 1),
+                np.searchsorted(self.ys, r0):np.searchsorted(self.ys, r1 + 1),
+            ] = True
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def contains(self, xi, yi):
+        """Tiles (column xi, row yi) lie in the blocks."""
+        result = np.zeros(len(xi), dtype=bool)
+        if not self.blocks:
+            return result
+        ix = np.searchsorted(self.xs, xi, side='right') - 1
+        iy = np.searchsorted(self.ys, yi, side='right') - 1
+        ok = (ix >= 0) & (ix < self.covered.shape[0]) & (iy >= 0) & (iy < self.covered.shape[1])
+        result[ok] = self.covered[ix[ok], iy[ok]]
+        return result
+
+    def cells(self):
+        """Union of the blocks as disjoint blocks."""
+        if len(self.blocks) < 2:
+            return self.blocks
+        a, b = np.nonzero(self.covered)
+        return list(zip(
+            self.xs[a].tolist(), (self.xs[a + 1] - 1).tolist(),
+            self.ys[b].tolist(), (self.ys[b + 1] - 1).tolist(),
+        ))
+
+
+class GridPlan(LayoutPlan):
+    """Grid layout as a product of two axes.
+
+    Tiles are not stored: only the columns, the rows, the blocks of tiles
+    hidden by openings (door, window, etc) and the tiles cut by openings
+    are. Memory and the cost of counting depend on the number of columns,
+    rows and openings, not on the number of tiles.
+    The index of a tile is row * len(columns) + column.
+    """
+
+    def __init__(self, width, height, columns, rows, reused_first_column=False, areas=()):
+        """
+        :type columns: Axis
+        :type rows: Axis
+        :param reused_first_column: first column consists of offcuts from the previous surface
+        :param areas: openings (x, y, w, h) (mm), see `exclude`
+        """
+        self.width = width
+        self.height = height
+        self.columns = columns
+        self.rows = rows
+        self.reused_first_column = reused_first_column
+        self.areas = []
+        self.exclude(areas)
+
+    def __len__(self):
+        return len(self.columns) * len(self.rows)
+
+    def _split(self, idx):
+        nc = len(self.columns)
+        return idx % nc, idx // nc
+
+    def _reused_columns(self):
+        reused = np.zeros(len(self.columns), dtype=bool)
+        if self.reused_first_column and len(self.columns):
+            reused[0] = self.columns.cut_lo[0]
+        return reused
+
+    def tiles(self, idx):
+        cols, rows = self.columns, self.rows
+        xi, yi = self._split(idx)
+        cut = (
+            cols.cut_lo[xi] * CUT_LEFT
+            | cols.cut_hi[xi] * CUT_RIGHT
+            | rows.cut_lo[yi] * CUT_TOP
+            | rows.cut_hi[yi] * CUT_BOTTOM
+        ).astype(np.uint8)
+        x, y, w, h = cols.start[xi], rows.start[yi], cols.size[xi], rows.size[yi]
+
+        # плитки, подрезанные проемами
+        if len(self.part_idx):
+            pos = np.minimum(np.searchsorted(self.part_idx, idx), len(self.part_idx) - 1)
+            hit = self.part_idx[pos] == idx
+            pos = pos[hit]
+            x, y, w, h = (a.astype(float) for a in (x, y, w, h))
+            x[hit], y[hit], w[hit], h[hit] = self.part_box[pos].T
+            cut[hit] = self.part_cut[pos]
+        return x, y, w, h, cut
+
+    def visible_indexes(self, idx=None):
+        if idx is None:
+            idx = np.arange(len(self))
+        if not len(self.hidden_index):
+            return idx
+        return idx[~self.hidden_index.contains(*self._split(idx))]
+
+    def groups(self):
+        cols, rows = self.columns, self.rows
+        reused = self._reused_columns()
+
+        # классы колонок и рядов: одинаковые размер и подрезка
+        col_size, col_flags, col_inv = _classes(cols.size, cols.cut_lo * CUT_LEFT | cols.cut_hi * CUT_RIGHT | reused * REUSED)
+        row_size, row_flags, row_inv = _classes(rows.size, rows.cut_lo * CUT_TOP | rows.cut_hi * CUT_BOTTOM)
+
+        nc, nr = len(col_size), len(row_size)
+        n = np.outer(np.bincount(col_inv, minlength=nc), np.bincount(row_inv, minlength=nr))
+        for c0, c1, r0, r1 in self.hidden_index.cells():
+            n -= np.outer(
+                np.bincount(col_inv[c0:c1 + 1], minlength=nc),
+                np.bincount(row_inv[r0:r1 + 1], minlength=nr),
+            )
+
+        if not len(self.part_idx):
+            a, b = np.nonzero(n)
+            return (
+                col_size[a], row_size[b],
+                (col_flags[a] | row_flags[b]) & ~np.uint8(REUSED),
+                (col_flags[a] & REUSED) != 0,
+                n[a, b].astype(np.int64),
+            )
+
+        # подрезанные проемами плитки - отдельными группами
+        xi, yi = self._split(self.part_idx)
+        np.subtract.at(n, (col_inv[xi], row_inv[yi]), 1)
+        a, b = np.nonzero(n)
+        return _group_tiles(
+            np.concatenate((col_size[a], self.part_box[:, 2])),
+            np.concatenate((row_size[b], self.part_box[:, 3])),
+            np.concatenate((col_flags[a] | row_flags[b], self.part_cut | reused[xi] * REUSED)).astype(np.uint8),
+            np.concatenate((n[a, b], np.ones(len(xi)))),
+        )
+
+    def outside_block(self, c0, c1, r0, r1):
+        """Indexes of the grid tiles out of columns c0..c1 and rows r0..r1 (inclusive).
+
+        The cost depends on the number of the tiles out of the block only.
+        """
+        xi, yi = _block_ring(0, len(self.columns) - 1, 0, len(self.rows) - 1, c0, c1, r0, r1)
+        return yi * len(self.columns) + xi
+
+    def crop(self, x0, y0, x1, y1):
+        """Tiles of the grid intersecting the window (mm).
+        :rtype: GridPlan
+        """
+        cs = self.columns.window(x0, x1)
+        rs = self.rows.window(y0, y1)
+        # проемы - в мм поверхности, индексы плиток окна считаются заново
+        return GridPlan(
+            self.width, self.height, self.columns[cs], self.rows[rs],
+            reused_first_column=self.reused_first_column and cs.start == 0,
+            areas=self.areas,
+        )
+
+    def exclude(self, areas):
+        """Openings of the surface (door, window, niche, pipe).
+
+        Tiles lying entirely in an opening are hidden, tiles crossing it are
+        cut: to the side of the opening (CUT_LEFT, ...) when it covers the
+        tile across, otherwise a notch is cut (CUT_NOTCH). Only the tiles
+        on the border of the openings are looked at, the inner ones are
+        hidden by blocks, so the cost is tiles of the borders plus openings.
+
+        :param areas: list of (x, y, w, h) (mm)
+        """
+        self.areas.extend([tuple(map(float, a)) for a in areas])
+        cols, rows = self.columns, self.rows
+
+        hidden = []
+        border = []
+        for k, (x, y, w, h) in enumerate(self.areas):
+            # колонки (ряды), целиком лежащие в области, идут подряд
+            c0, c1 = _inner_range(cols, x, w)
+            r0, r1 = _inner_range(rows, y, h)
+            if c0 <= c1 and r0 <= r1:
+                hidden.append((c0, c1, r0, r1))
+            # остальные плитки, пересекающие область
+            cs = cols.window(x + EPS, x + w - EPS)
+            rs = rows.window(y + EPS, y + h - EPS)
+            if cs.stop > cs.start and rs.stop > rs.start:
+                xi, yi = _block_ring(cs.start, cs.stop - 1, rs.start, rs.stop - 1, c0, c1, r0, r1)
+                border.append((xi, yi, np.full(len(xi), k)))
+
+        self.hidden_index = BlockIndex(hidden)
+        self._cut_border(border)
+
+    def _cut_border(self, border):
+        """Cut the tiles crossing the openings (not hidden by the blocks)."""
+        empty = np.zeros(0, dtype=np.int64)
+        self.part_idx = empty
+        self.part_box = np.zeros((0, 4))
+        self.part_cut = np.zeros(0, dtype=np.uint8)
+        if not border:
+            return
+
+        cols, rows = self.columns, self.rows
+        xi, yi, k = (np.concatenate(a) for a in zip(*border))
+        keep = ~self.hidden_index.contains(xi, yi)
+        idx = (yi * len(cols) + xi)[keep]
+        k = k[keep]
+        if not len(idx):
+            return
+
+        # плитка может пересекать несколько проемов: проемы одной плитки
+        # применяются по очереди, на каждом шаге - ко всем плиткам сразу
+        order = np.argsort(idx, kind='stable')
+        idx, k = idx[order], k[order]
+        first = np.empty(len(idx), dtype=bool)
+        first[:1] = True
+        first[1:] = idx[1:] != idx[:-1]
+        tiles = idx[first]
+        inv = np.cumsum(first) - 1
+        rank = np.arange(len(idx)) - np.flatnonzero(first)[inv]
+
+        x, y, w, h, cut = GridPlan.tiles(self, tiles)
+        x0, y0 = x.astype(float), y.astype(float)
+        x1, y1 = x0 + w, y0 + h
+        touched = np.zeros(len(tiles), dtype=bool)
+        areas = np.asarray(self.areas)
+        for r in range(int(rank.max()) + 1):
+            sel = rank == r
+            t = inv[sel]
+            ax0, ay0, aw, ah = areas[k[sel]].T
+            ax1, ay1 = ax0 + aw, ay0 + ah
+            bx0, by0, bx1, by1 = x0[t], y0[t], x1[t], y1[t]
+
+            cross = (ax0 < bx1 - EPS) & (ax1 > bx0 + EPS) & (ay0 < by1 - EPS) & (ay1 > by0 + EPS)
+            across_v = cross & (ay0 <= by0 + EPS) & (ay1 >= by1 - EPS)
+            across_h = cross & (ax0 <= bx0 + EPS) & (ax1 >= bx1 - EPS)
+            left = across_v & (ax0 <= bx0 + EPS)
+            right = across_v & ~left & (ax1 >= bx1 - EPS)
+            top = across_h & ~across_v & (ay0 <= by0 + EPS)
+            bottom = across_h & ~across_v & ~top & (ay1 >= by1 - EPS)
+            notch = cross & ~(left | right | top | bottom)
+            touched[t] |= cross
+
+            x0[t] = np.where(left, ax1, bx0)
+            x1[t] = np.where(right, ax0, bx1)
+            y0[t] = np.where(top, ay1, by0)
+            y1[t] = np.where(bottom, ay0, by1)
+            cut[t] |= (
+                left * CUT_LEFT | right * CUT_RIGHT | top * CUT_TOP | bottom * CUT_BOTTOM | notch * CUT_NOTCH
+            ).astype(np.uint8)
+
+        # от плитки ничего не осталось (край плитки совпал с краем проема)
+        gone = (x1 - x0 <= EPS) | (y1 - y0 <= EPS)
+        if gone.any():
+            gx, gy = self._split(tiles[gone])
+            self.hidden_index = BlockIndex(
+                self.hidden_index.blocks + list(zip(gx.tolist(), gx.tolist(), gy.tolist(), gy.tolist()))
+            )
+
+        changed = touched & ~gone
+        self.part_idx = tiles[changed]
+        self.part_box = np.stack((x0, y0, x1 - x0, y1 - y0), axis=1)[changed]
+        self.part_cut = cut[changed]
+
+    @property
+    def hidden(self):
+        """Blocks of hidden tiles (c0, c1, r0, r1), inclusive."""
+        return self.hidden_index.blocks
+
+
+def _block_ring(oc0, oc1, or0, or1, c0, c1, r0, r1):
+    """Tiles (columns, rows) of the block oc0..oc1, or0..or1 out of the inner
+    block c0..c1, r0..r1 (inclusive, may be empty or partly out).
+    """
+    c0, c1 = max(c0, oc0), min(c1, oc1)
+    r0, r1 = max(r0, or0), min(r1, or1)
+    if c0 > c1 or r0 > r1:
+        c0, c1, r0, r1 = oc0, oc0 - 1, or0, or0 - 1
+    cols = np.arange(oc0, oc1 + 1)
+    rows_out = np.r_[or0:r0, r1 + 1:or1 + 1]
+    cols_out = np.r_[oc0:c0, c1 + 1:oc1 + 1]
+    rows_in = np.arange(r0, r1 + 1)
+    return (
+        np.concatenate((np.tile(cols, len(rows_out)), np.tile(cols_out, len(rows_in)))),
+        np.concatenate((np.repeat(rows_out, len(cols)), np.repeat(rows_in, len(cols_out)))),
+    )
+
+
+def _group_tiles(w, h, flags, n=None):
+    """Tiles grouped by equal size and flags (CUT_* and REUSED).
+    :param n: number of tiles of every item (1 if not set)
+    :return: w, h, cut, reused, number of tiles
+    """
+    # одна сортировка по (ширина, высота, флаги), как в _classes
+    order = np.lexsort((flags, h, w))
+    w, h, flags = w[order], h[order], flags[order]
+    first = np.empty(len(w), dtype=bool)
+    first[:1] = True
+    first[1:] = (w[1:] != w[:-1]) | (h[1:] != h[:-1]) | (flags[1:] != flags[:-1])
+    n = np.ones(len(w)) if n is None else n[order]
+    n = np.add.reduceat(n, np.flatnonzero(first)).astype(np.int64) if len(w) else n.astype(np.int64)
+    flags = flags[first]
+    return w[first], h[first], flags & ~np.uint8(REUSED), (flags & REUSED) != 0, n
+
+
+def _inner_range(axis, lo, size):
+    """Indexes (first, last) of the tiles lying strictly inside (lo, lo + size)."""
+    i0 = int(np.searchsorted(axis.start, lo, side='right'))
+    i1 = int(np.searchsorted(axis.start + axis.size, lo + size, side='left')) - 1
+    return i0, i1
+
+
+def _classes(size, flags):
+    """Unique (size, flags) of the tiles of an axis.
+    :return: size and flags of every class, class of every tile
+    """
+    # одна сортировка по (размер, флаги) вместо двух np.unique: у оси всего несколько классов
+    order = np.lexsort((flags, size))
+    size, flags = size[order], flags[order]
+    first = np.empty(len(size), dtype=bool)
+    first[:1] = True
+    first[1:] = (size[1:] != size[:-1]) | (flags[1:] != flags[:-1])
+    inv = np.empty(len(size), dtype=np.int64)
+    inv[order] = np.cumsum(first) - 1
+    return size[first], flags[first].astype(np.uint8), inv
+
+
+# вершин у части плитки после обрезки прямоугольником (4 стороны + 4 реза)
+MAX_VERTICES = 8
+
+
+def clip_polygons(points, n, x0, y0, x1, y1):
+    """Clip convex polygons by the rectangle (Sutherland-Hodgman for all polygons at once).
+
+    :param points: vertices, array (polygons, vertices, 2), padded
+    :param n: number of vertices of every polygon
+    :return: vertices (polygons, MAX_VERTICES, 2) and their numbers
+    """
+    px, py = points[..., 0], points[..., 1]
+    rows = np.arange(len(n))[:, None]
+    for axis, bound, sign in ((0, x0, 1), (0, x1, -1), (1, y0, 1), (1, y1, -1)):
+        m, k = px.shape
+        j = np.arange(k)
+        valid = j < n[:, None]
+        prev = np.maximum(np.where(j == 0, n[:, None] - 1, j - 1), 0)
+
+        # x и y - отдельными массивами, вершины выбираются индексами: меньше вызовов numpy на проход
+        qx, qy = px[rows, prev], py[rows, prev]
+        cur, prv = (px, qx) if axis == 0 else (py, qy)
+        cur_in = sign * (cur - bound) >= 0
+        prv_in = sign * (prv - bound) >= 0
+
+        # точка пересечения ребра prv-cur с границей
+        delta = cur - prv
+        t = (bound - prv) / np.where(delta == 0, 1, delta)
+
+        # на каждую вершину: пересечение входящего ребра и сама вершина
+        out_x, out_y = np.empty((m, 2 * k)), np.empty((m, 2 * k))
+        out_x[:, 0::2], out_x[:, 1::2] = qx + t * (px - qx), px
+        out_y[:, 0::2], out_y[:, 1::2] = qy + t * (py - qy), py
+        keep = np.empty((m, 2 * k), dtype=bool)
+        keep[:, 0::2] = valid & (cur_in != prv_in)
+        keep[:, 1::2] = valid & cur_in
+
+        # оставленные вершины - подряд в начало, в прежнем порядке
+        pos = np.cumsum(keep, axis=1) - 1
+        keep &= pos < MAX_VERTICES
+        r = np.nonzero(keep)[0]
+        px, py = np.zeros((m, MAX_VERTICES)), np.zeros((m, MAX_VERTICES))
+        px[r, pos[keep]] = out_x[keep]
+        py[r, pos[keep]] = out_y[keep]
+        n = keep.sum(axis=1)
+
+    return np.stack((px, py), axis=2), n
+
+
+def polygons_area(points, n):
+    """Areas of the polygons (padded as in `clip_polygons`)."""
+    j = np.arange(points.shape[1])
+    nxt = np.where(j + 1 < n[:, None], j + 1, 0)
+    x, y = points[..., 0], points[..., 1]
+    cross = x * np.take_along_axis(y, nxt, axis=1) - np.take_along_axis(x, nxt, axis=1) * y
+    return np.abs(np.where(j < n[:, None], cross, 0).sum(axis=1)) / 2
+
+
+def _linear_range(b, a, lo, hi):
+    """Real range of i where lo <= b + a * i <= hi (b - array, a - number)."""
+    if abs(a) < EPS:
+        inside = (b >= lo) & (b <= hi)
+        return np.where(inside, -np.inf, np.inf), np.where(inside, np.inf, -np.inf)
+    r0, r1 = (lo - b) / a, (hi - b) / a
+    return (r0, r1) if a > 0 else (r1, r0)
+
+
+class DiagonalPlan(LayoutPlan):
+    """Lattice of tiles rotated by an angle and clipped by the surface.
+
+    The tile (i, j) has the corner c + R * (i * (tw + d) - tw / 2, j * (th + d) - th / 2),
+    c - center of the surface, R - rotation by the angle, so the tile (0, 0)
+    is in the center. Whole tiles are kept as runs i0..i1 of every lattice
+    row j, cut tiles - as polygons (the part inside the surface). Memory
+    depends on the number of rows and cut tiles, not on the number of tiles.
+    """
+
+    def __init__(self, width, height, tw, th, d, angle, areas=()):
+        """
+        :param width: surface width (mm)
+        :param height: surface height (mm)
+        :param tw: tile width (mm)
+        :param th: tile height (mm)
+        :param d: delimiter (mm)
+        :param angle: rotation of the tiles (degrees, clockwise on the picture)
+        :param areas: openings (x, y, w, h) (mm), see `exclude`
+        """
+        self.width = width
+        self.height = height
+        self.tw = tw
+        self.th = th
+        self.d = d
+        self.angle = angle
+
+        a = radians(angle)
+        self.cos, self.sin = cos(a), sin(a)
+        # плитки - в пределах [d, size - d], как у прямой раскладки
+        self.rect = (d, d, width - d, height - d)
+
+        self._lay()
+        self.areas = []
+        self.exclude(areas)
+
+    def to_surface(self, u, v):
+        """Point of the lattice (mm, the center of the tile (0, 0) is 0, 0) on the surface."""
+        return (
+            self.width / 2 + u * self.cos - v * self.sin,
+            self.height / 2 + u * self.sin + v * self.cos,
+        )
+
+    def to_lattice(self, x, y):
+        x, y = x - self.width / 2, y - self.height / 2
+        return x * self.cos + y * self.sin, -x * self.sin + y * self.cos
+
+    def _lay(self):
+        x0, y0, x1, y1 = self.rect
+        su, sv = self.tw + self.d, self.th + self.d
+        tw, th = self.tw, self.th
+
+        # ряды решетки, пересекающие поверхность
+        _, v = self.to_lattice(np.array([x0, x1, x0, x1]), np.array([y0, y0, y1, y1]))
+        j = np.arange(floor((v.min() - th / 2) / sv), ceil((v.max() + th / 2) / sv) + 1)
+
+        # угол (0, 0) плитки i ряда j: bx + i * ax, by + i * ay
+        self._bx, self._by = self.to_surface(np.full(len(j), -tw / 2), j * sv - th / 2)
+        self._ax, self._ay = su * self.cos, su * self.sin
+        # смещения углов плитки от ее угла (0, 0)
+        self._cx = cx = np.array([0, tw * self.cos, tw * self.cos - th * self.sin, -th * self.sin])
+        self._cy = cy = np.array([0, tw * self.sin, tw * self.sin + th * self.cos, th * self.cos])
+
+        # пересекают прямоугольник / лежат в нем целиком
+        c0, c1 = self._tiles_range(x0, y0, x1, y1, inside=False)
+        w0, w1 = self._tiles_range(x0, y0, x1, y1, inside=True)
+
+        keep = c0 <= c1
+        j, bx, by = j[keep], self._bx[keep], self._by[keep]
+        self._bx, self._by = bx, by
+        ax, ay = self._ax, self._ay
+        c0, c1, w0, w1 = c0[keep], c1[keep], w0[keep], w1[keep]
+        empty = w0 > w1
+        w0, w1 = np.where(empty, c1 + 1, w0), np.where(empty, c1, w1)
+
+        self.rows = j
+        self.whole_lo = w0.astype(np.int64)
+        self.whole_hi = w1.astype(np.int64)
+
+        # остальные плитки рядов - кандидаты на обрезку: слева и справа от целых
+        lo = np.concatenate((c0, np.maximum(w1 + 1, c0))).astype(np.int64)
+        hi = np.concatenate((np.minimum(w0 - 1, c1), c1)).astype(np.int64)
+        rows = np.concatenate((j, j))
+        length = np.maximum(hi - lo + 1, 0)
+        k = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+        pi = np.repeat(lo, length) + k
+        pj = np.repeat(rows, length)
+
+        corner_x = bx[np.searchsorted(j, pj)] + pi * ax
+        corner_y = by[np.searchsorted(j, pj)] + pi * ay
+        points = np.stack((corner_x[:, None] + cx, corner_y[:, None] + cy), axis=2)
+        points, n = clip_polygons(points, np.full(len(pi), 4), x0, y0, x1, y1)
+
+        area = polygons_area(points, n)
+        keep = area > EPS
+        self.cut_i = pi[keep]
+        self.cut_j = pj[keep]
+        self.cut_points = points[keep]
+        self.cut_n = n[keep]
+        self.cut_area = area[keep]
+
+    def _tiles_range(self, x0, y0, x1, y1, inside):
+        """Tiles (i0..i1 of every row) crossing the rectangle or lying in it entirely."""
+        cx, cy = self._cx, self._cy
+        if inside:
+            bounds = (x0 - cx.min() - EPS, x1 - cx.max() + EPS, y0 - cy.min() - EPS, y1 - cy.max() + EPS)
+        else:
+            bounds = (x0 - cx.max() + EPS, x1 - cx.min() - EPS, y0 - cy.max() + EPS, y1 - cy.min() - EPS)
+        rx0, rx1 = _linear_range(self._bx, self._ax, bounds[0], bounds[1])
+        ry0, ry1 = _linear_range(self._by, self._ay, bounds[2], bounds[3])
+        return np.ceil(np.maximum(rx0, ry0) - EPS), np.floor(np.minimum(rx1, ry1) + EPS)
+
+    def _whole_tiles(self, lo, hi):
+        """Whole tiles i = lo..hi of every row (clipped by the runs): i, j."""
+        lo = np.maximum(np.minimum(lo, self.whole_hi + 1), self.whole_lo).astype(np.int64)
+        hi = np.minimum(np.maximum(hi, self.whole_lo - 1), self.whole_hi).astype(np.int64)
+        length = np.maximum(hi - lo + 1, 0)
+        k = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+        return np.repeat(lo, length) + k, np.repeat(self.rows, length)
+
+    def _tile_points(self, i, j):
+        """Corners of the tiles (tiles, 4, 2)."""
+        r = np.searchsorted(self.rows, j)
+        x = self._bx[r] + i * self._ax
+        y = self._by[r] + i * self._ay
+        return np.stack((x[:, None] + self._cx, y[:, None] + self._cy), axis=2)
+
+    def exclude(self, areas):
+        """Openings of the surface (door, window, niche, pipe).
+
+        Whole tiles and cut parts lying entirely in an opening are hidden,
+        the ones crossing it are cut (CUT_NOTCH), the opening is drawn over
+        them. Of the whole tiles only the ones of the rows crossing an
+        opening are looked at (ranges of the rows), so the cost is tiles of
+        the openings plus the cut parts.
+
+        :param areas: list of (x, y, w, h) (mm)
+        """
+        self.areas.extend([tuple(map(float, a)) for a in areas])
+        hidden, notched = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)]
+        self.cut_hidden = np.zeros(len(self.cut_i), dtype=bool)
+        self.cut_notch = np.zeros(len(self.cut_i), dtype=bool)
+
+        for x, y, w, h in self.areas:
+            x1, y1 = x + w, y + h
+            # целые плитки: в проеме целиком / пересекающие его
+            i, j = self._whole_tiles(*self._tiles_range(x, y, x1, y1, inside=True))
+            hidden.append(_lattice_keys(i, j))
+            lo, hi = self._tiles_range(x, y, x1, y1, inside=False)
+            i, j = self._whole_tiles(lo, hi)
+            points, n = clip_polygons(self._tile_points(i, j), np.full(len(i), 4), x, y, x1, y1)
+            notched.append(_lattice_keys(i, j)[polygons_area(points, n) > EPS])
+
+            # части плиток: по их рамкам
+            valid = np.arange(MAX_VERTICES) < self.cut_n[:, None]
+            px, py = self.cut_points[..., 0], self.cut_points[..., 1]
+            sel = np.flatnonzero(
+                (np.where(valid, px, np.inf).min(axis=1) < x1 - EPS)
+                & (np.where(valid, px, -np.inf).max(axis=1) > x + EPS)
+                & (np.where(valid, py, np.inf).min(axis=1) < y1 - EPS)
+                & (np.where(valid, py, -np.inf).max(axis=1) > y + EPS)
+            )
+            points, n = clip_polygons(self.cut_points[sel], self.cut_n[sel], x, y, x1, y1)
+            area = polygons_area(points, n)
+            self.cut_hidden[sel[area >= self.cut_area[sel] - EPS]] = True
+            self.cut_notch[sel[area > EPS]] = True
+
+        self.hidden_keys = np.unique(np.concatenate(hidden))
+        self.notch_keys = np.setdiff1d(np.concatenate(notched), self.hidden_keys)
+        self.cut_notch &= ~self.cut_hidden
+
+    def __len__(self):
+        whole = int((self.whole_hi - self.whole_lo + 1).sum()) - len(self.hidden_keys)
+        return whole + int(np.count_nonzero(~self.cut_hidden))
+
+    def cut_parts(self):
+        """Size of the cut parts in the tile (mm) and CUT_* flags.
+        :return: w, h, flags
+        """
+        u, v = self.to_lattice(self.cut_points[..., 0], self.cut_points[..., 1])
+        # координаты внутри своей плитки
+        u = u - (self.cut_i * (self.tw + self.d) - self.tw / 2)[:, None]
+        v = v - (self.cut_j * (self.th + self.d) - self.th / 2)[:, None]
+
+        valid = np.arange(MAX_VERTICES) < self.cut_n[:, None]
+        u0 = np.where(valid, u, np.inf).min(axis=1)
+        u1 = np.where(valid, u, -np.inf).max(axis=1)
+        v0 = np.where(valid, v, np.inf).min(axis=1)
+        v1 = np.where(valid, v, -np.inf).max(axis=1)
+        w, h = u1 - u0, v1 - v0
+
+        flags = (
+            (u0 > EPS) * CUT_LEFT
+            | (u1 < self.tw - EPS) * CUT_RIGHT
+            | (v0 > EPS) * CUT_TOP
+            | (v1 < self.th - EPS) * CUT_BOTTOM
+            # часть не прямоугольная
+            | (self.cut_area < w * h - EPS) * CUT_SLANT
+        ).astype(np.uint8)
+        return w, h, flags
+
+    def groups(self):
+        w, h, flags = self.cut_parts()
+        visible = ~self.cut_hidden
+        flags = flags | self.cut_notch * np.uint8(CUT_NOTCH)
+        notched = len(self.notch_keys)
+        whole = int((self.whole_hi - self.whole_lo + 1).sum()) - len(self.hidden_keys) - notched
+        return _group_tiles(
+            np.append(w[visible], [self.tw, self.tw]), np.append(h[visible], [self.th, self.th]),
+            np.append(flags[visible], [0, CUT_NOTCH]).astype(np.uint8),
+            np.append(np.ones(np.count_nonzero(visible)), [whole, notched]),
+        )
+
+
+def _lattice_keys(i, j):
+    """Key of the tile (i, j) of a lattice (one int64)."""
+    return j.astype(np.int64) * 2 ** 32 + i
+
+
+def direct_layout(width, height, tw, th, d, sx=None, sy=None, y_dir=1):
+    """Tiles are laid from the top left corner (y_dir=1)
+    or from the bottom left corner (y_dir=-1).
+
+    :param width: surface width (mm)
+    :param height: surface height (mm)
+    :param tw: tile width (mm)
+    :param th: tile height (mm)
+    :param d: delimiter (mm)
+    :param sx: first column starts from the offcut of this width (mm)
+    :param sy: first row starts from the offcut of this height (mm)
+    :param y_dir: 1 - top to bottom, -1 - bottom to top
+    :rtype: GridPlan
+    """
+    if y_dir not in (1, -1):
+        raise Exception("invalid y_direction")
+
+    # рисунок сдвигает первую плитку на sx/sy как есть, даже отрицательные
+    columns = axis_layout(width, tw, d, d - (sx or 0), AxisSteps(STEPS_DIRECT, tw, d, sx or 0))
+    rows = axis_layout(height, th, d, d - (sy or 0), AxisSteps(STEPS_DIRECT, th, d, sy or 0))
+    if y_dir == -1:
+        rows = rows.mirror(height)
+
+    return GridPlan(width, height, columns, rows, reused_first_column=bool(sx))
+
+
+def center_layout(width, height, tw, th, d):
+    """The central tile is placed in the center of the surface.
+
+    :rtype: GridPlan
+    """
+    columns = axis_layout(width, tw, d, (width - tw) / 2, AxisSteps(STEPS_CENTER, tw, d))
+    rows = axis_layout(height, th, d, (height - th) / 2, AxisSteps(STEPS_CENTER, th, d))
+
+    return GridPlan(width, height, columns, rows)
+
+
+# автоподбор начала раскладки: шаг перебора сдвигов (мм) и наибольшее их число
+AUTO_RESOLUTION = 0.5
+AUTO_MAX_CANDIDATES = 4096
+# подрезка уже этой доли плитки - полоска
+AUTO_MIN_CUT = 1 / 3
+# веса оценки: полоски, число плиток, несимметричность краев
+AUTO_WEIGHTS = (100.0, 1.0, 0.1)
+
+
+def _auto_offsets(step):
+    """Candidate shifts of the first tile: [0, step)."""
+    n = min(int(ceil(step / AUTO_RESOLUTION)), AUTO_MAX_CANDIDATES)
+    return np.arange(n) * (step / n)
+
+
+def _slivers(width, cut, tile):
+    """How much the cut tiles are narrower than AUTO_MIN_CUT of the tile."""
+    return np.where(cut, np.maximum(AUTO_MIN_CUT - width / tile, 0), 0)
+
+
+def auto_origin(length, tile, delimiter):
+    """Origin of the axis with the best edges: no slivers, fewer tiles, equal cuts at both edges.
+
+    All the candidates are scored at once by `axis_edges`.
+    """
+    origin = delimiter - _auto_offsets(tile + delimiter)
+    n, a, b, cut_a, cut_b = axis_edges(length, tile, delimiter, origin)
+
+    w_sliver, w_count, w_symmetry = AUTO_WEIGHTS
+    score = (
+        w_sliver * (_slivers(a, cut_a, tile) + _slivers(b, cut_b, tile))
+        + w_count * n
+        + w_symmetry * np.abs(a - b) / tile
+    )
+    return float(origin[np.argmin(score)])
+
+
+def auto_layout(width, height, tw, th, d):
+    """The start of the tiles is searched for (see `auto_origin`), the axes are independent.
+
+    :rtype: GridPlan
+    """
+    columns = axis_layout(width, tw, d, auto_origin(width, tw, d))
+    rows = axis_layout(height, th, d, auto_origin(height, th, d))
+
+    return GridPlan(width, height, columns, rows)
+
+
+def auto_wall_start(widths, tw, d):
+    """Offcut the first wall starts with (sx of `direct_layout`).
+
+    The offcut of the last tile of a wall starts the next wall, so every
+    candidate is followed through all the walls at once and scored by the
+    slivers at the edges of all the walls and the number of tiles bought.
+
+    :param widths: widths of the walls in order (mm)
+    :return: sx (mm) or None
+    """
+    sx = _auto_offsets(tw + d)
+    start = sx
+    w_sliver, w_count, _ = AUTO_WEIGHTS
+    score = np.zeros(len(sx))
+    for i, width in enumerate(widths):
+        n, a, b, cut_a, cut_b = axis_edges(width, tw, d, d - sx)
+        # первая подрезанная плитка стены - из обрезка предыдущей, не покупается
+        bought = n - (cut_a if i else 0)
+        score += w_sliver * (_slivers(a, cut_a, tw) + _slivers(b, cut_b, tw)) + w_count * bought
+        sx = np.where(cut_b, b, 0)
+
+    best = float(start[np.argmin(score)])
+    return best or None
+
+
+def diagonal_layout(width, height, tw, th, d, angle):
+    """Tiles are rotated by the angle around the center of the surface.
+
+    :param angle: degrees
+    :rtype: DiagonalPlan
+    """
+    return DiagonalPlan(width, height, tw, th, d, angle)
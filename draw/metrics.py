@@ -0,0 +1,204 @@
+"""Per-stage timings of a request, aggregated metrics and sampled logs.
+
+Drawing code records stages with `stage(name)` and counters with
+`count(name, value)`. They go to the Timings of the current request
+(see `collect`), outside of a request they cost nothing.
+"""
+from collections import OrderedDict
+from contextlib import contextmanager
+import json
+import logging
+import random
+import threading
+import time
+
+
+# доля запросов, попадающих в лог
+LOG_SAMPLE_RATE = 0.01
+
+# границы корзин гистограмм (с)
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+logger = logging.getLogger('draw')
+
+_local = threading.local()
+
+
+class Timings:
+    """Stage durations (seconds) and counters of one request."""
+
+    def __init__(self):
+        self.stages = OrderedDict()
+        self.counters = {}
+
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+
+    @contextmanager
+    def stage(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    def merge(self, other):
+        """
+        :type other: Timings
+        """
+        for name, seconds in other.stages.items():
+            self.add(name, seconds)
+        for name, value in other.counters.items():
+            self.count(name, value)
+
+    def header(self):
+        """Value of the Server-Timing header."""
+        return ', '.join('%s;dur=%.2f' % (name, seconds * 1000) for name, seconds in self.stages.items())
+
+    def as_dict(self):
+        return {
+            'stages': {name: round(seconds, 6) for name, seconds in self.stages.items()},
+            'counters': dict(self.counters),
+        }
+
+
+def current():
+    """Timings of the request handled by this thread or None."""
+    return getattr(_local, 'timings', None)
+
+
+@contextmanager
+def stage(name):
+    timings = current()
+    if timings is None:
+        yield
+        return
+    with timings.stage(name):
+        yield
+
+
+def count(name, value=1):
+    timings = current()
+    if timings is not None:
+        timings.count(name, value)
+
+
+def collect(enqueued, fn, *args):
+    """Run fn(*args) (in a worker) recording its stages.
+    :param enqueued: time.time() of the submission, the wait is the 'queue' stage
+    :return: result of fn and Timings
+    """
+    timings = Timings()
+    timings.add('queue', max(time.time() - enqueued, 0.0))
+
+    _local.timings = timings
+    try:
+        result = fn(*args)
+    finally:
+        _local.timings = None
+
+    return result, timings
+
+
+def log_sampled(event, **fields):
+    """Structured log record of a part of the requests (LOG_SAMPLE_RATE)."""
+    if LOG_SAMPLE_RATE < 1 and random.random() >= LOG_SAMPLE_RATE:
+        return
+    logger.info('%s %s', event, json.dumps(fields, default=str, sort_keys=True))
+
+
+class Histogram:
+
+    def __init__(self, buckets=BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        for i, le in enumerate(self.buckets):
+            if value <= le:
+                self.counts[i] += 1
+                break
+        self.sum += value
+        self.count += 1
+
+
+def _label_value(value):
+    # в значении метки экранируются \, " и перевод строки (формат Prometheus)
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(**labels):
+    return '{%s}' % ','.join('%s="%s"' % (k, _label_value(v)) for k, v in labels.items())
+
+
+class Metrics:
+    """Histograms of the stages and totals of the counters by handler."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = OrderedDict()
+        self._counters = OrderedDict()
+        self._requests = OrderedDict()
+
+    def observe(self, handler, status, timings):
+        """
+        :param handler: name of the endpoint
+        :param status: HTTP status
+        :type timings: Timings
+        """
+        with self._lock:
+            key = (handler, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+
+            for name, seconds in timings.stages.items():
+                key = (handler, name)
+                if key not in self._histograms:
+                    self._histograms[key] = Histogram()
+                self._histograms[key].observe(seconds)
+
+            for name, value in timings.counters.items():
+                key = (handler, name)
+                self._counters[key] = self._counters.get(key, 0) + value
+
+    def render(self, gauges=None):
+        """Prometheus text exposition format.
+        :param gauges: extra values {name: value}
+        :rtype: str
+        """
+        lines = []
+        with self._lock:
+            lines.append('# TYPE draw_requests_total counter')
+            for (handler, status), value in self._requests.items():
+                lines.append('draw_requests_total%s %d' % (_labels(handler=handler, status=status), value))
+
+            lines.append('# TYPE draw_stage_seconds histogram')
+            for (handler, name), h in self._histograms.items():
+                cumulative = 0
+                for le, c in zip(h.buckets, h.counts):
+                    cumulative += c
+                    lines.append('draw_stage_seconds_bucket%s %d' % (
+                        _labels(handler=handler, stage=name, le=le), cumulative
+                    ))
+                lines.append('draw_stage_seconds_bucket%s %d' % (
+                    _labels(handler=handler, stage=name, le='+Inf'), h.count
+                ))
+                lines.append('draw_stage_seconds_sum%s %f' % (_labels(handler=handler, stage=name), h.sum))
+                lines.append('draw_stage_seconds_count%s %d' % (_labels(handler=handler, stage=name), h.count))
+
+            names = OrderedDict.fromkeys(name for _, name in self._counters)
+            for name in names:
+                lines.append('# TYPE draw_%s_total counter' % name)
+                for (handler, n), value in self._counters.items():
+                    if n == name:
+                        lines.append('draw_%s_total%s %d' % (name, _labels(handler=handler), value))
+
+        for name, value in (gauges or {}).items():
+            lines.append('# TYPE %s gauge' % name)
+            lines.append('%s %s' % (name, value))
+
+        return '\n'.join(lines) + '\n'
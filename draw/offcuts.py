@@ -0,0 +1,227 @@
+"""Cut plan: the cut tiles of all surfaces of a job from as few tiles as possible.
+
+Every cut tile (piece) is a rectangle of its size in the tile (bounding
+box for notched and slanted pieces). A bought tile is cut by guillotine
+cuts, its offcuts go to the pool and supply the next pieces, whatever
+surface they are on. Tiles cut the same way are kept as one pattern with
+a count and pieces of equal size are placed in batches, so the cost
+depends on the number of sizes and patterns, not on the number of pieces.
+
+The greedy plan (largest pieces first, the best fitting offcut) is always
+made, other orders of the pieces are tried while the time budget lasts,
+the plan with the fewest tiles is returned.
+"""
+from math import ceil, floor
+import random
+import time
+
+import numpy as np
+
+from .layout import EPS
+from .metrics import count
+
+
+# время на поиск лучшего плана (с)
+TIME_BUDGET = 0.05
+# ширина реза (мм)
+KERF = 0.0
+# точность размеров частей (мм)
+SIZE_DECIMALS = 1
+
+# порядок частей: ключи сортировки (по убыванию)
+ORDERS = (
+    ('area', lambda w, h: (w * h, max(w, h))),
+    ('side', lambda w, h: (max(w, h), w * h)),
+    ('width', lambda w, h: (w, h)),
+    ('height', lambda w, h: (h, w)),
+)
+# деление остатка после части: первый рез по большему остатку / по короткой стороне
+SPLIT_MAX_AREA = 'max_area'
+SPLIT_SHORT_SIDE = 'short_side'
+SPLITS = (SPLIT_MAX_AREA, SPLIT_SHORT_SIDE)
+
+
+class Pattern:
+    """`count` tiles cut into the same pieces."""
+
+    def __init__(self, count, pieces=()):
+        self.count = count
+        self.pieces = list(pieces)
+        self.offcuts = []
+
+    def split(self, k):
+        """k tiles of the pattern become a new pattern (with copies of the offcuts).
+        :rtype: Pattern
+        """
+        other = Pattern(k, self.pieces)
+        self.count -= k
+        for offcut in self.offcuts:
+            other.offcuts.append(Offcut(offcut.w, offcut.h, other))
+        return other
+
+
+class Offcut:
+    """Offcut of every tile of the pattern."""
+
+    def __init__(self, w, h, pattern):
+        self.w = w
+        self.h = h
+        self.pattern = pattern
+
+
+def _remainders(W, H, w, h, split):
+    """Offcuts of (W, H) after the piece (w, h) is cut from its corner."""
+    right, bottom = W - w - KERF, H - h - KERF
+    # первый рез вдоль всей высоты или вдоль всей ширины
+    vertical = ((right, H), (w, bottom))
+    horizontal = ((right, h), (W, bottom))
+    if split == SPLIT_SHORT_SIDE:
+        cuts = vertical if right < bottom else horizontal
+    else:
+        cuts = vertical if max(right * H, w * bottom) >= max(right * h, W * bottom) else horizontal
+    return [(a, b) for a, b in cuts if a > EPS and b > EPS]
+
+
+def _pack(groups, tw, th, split):
+    """Place the pieces in the given order.
+    :param groups: (w, h, number of pieces)
+    :return: patterns of the opened tiles
+    """
+    pool = []
+    patterns = []
+
+    def add_offcuts(pattern, W, H, w, h):
+        pattern.pieces.append((w, h))
+        for a, b in _remainders(W, H, w, h, split):
+            offcut = Offcut(a, b, pattern)
+            pattern.offcuts.append(offcut)
+            pool.append(offcut)
+
+    for gi, (w, h, n) in enumerate(groups):
+        # остатки меньше всех оставшихся частей уже не пригодятся
+        if gi and pool:
+            min_w = min(g[0] for g in groups[gi:])
+            min_h = min(g[1] for g in groups[gi:])
+            pool = [o for o in pool if o.w >= min_w - EPS and o.h >= min_h - EPS]
+
+        while n > 0:
+            best = None
+            for o in pool:
+                if o.w >= w - EPS and o.h >= h - EPS and (best is None or o.w * o.h < best.w * best.h):
+                    best = o
+            if best is None:
+                # новые плитки: столько, чтобы хватило при раскрое сеткой
+                per_tile = max(floor((tw + KERF + EPS) / (w + KERF)) * floor((th + KERF + EPS) / (h + KERF)), 1)
+                pattern = Pattern(int(ceil(n / per_tile)))
+                patterns.append(pattern)
+                add_offcuts(pattern, tw, th, w, h)
+                n -= pattern.count
+                continue
+
+            pattern = best.pattern
+            k = min(n, pattern.count)
+            if k < pattern.count:
+                # часть плиток образца режется иначе - новый образец
+                pattern = pattern.split(k)
+                patterns.append(pattern)
+                pool.extend(pattern.offcuts)
+                best = pattern.offcuts[best.pattern.offcuts.index(best)]
+            pattern.offcuts.remove(best)
+            pool.remove(best)
+            add_offcuts(pattern, best.w, best.h, w, h)
+            n -= k
+
+    return patterns
+
+
+def _tiles(patterns):
+    return sum(p.count for p in patterns)
+
+
+def _groups(plans, tw, th):
+    """Pieces of all the layouts grouped by size.
+    :return: whole tiles, list of (w, h, number of pieces)
+    """
+    whole = 0
+    sizes = {}
+    for plan in plans:
+        w, h, cut, _, n = plan.groups()
+        whole += int(n[cut == 0].sum())
+        sel = cut != 0
+        w = np.minimum(np.round(w[sel], SIZE_DECIMALS), tw)
+        h = np.minimum(np.round(h[sel], SIZE_DECIMALS), th)
+        for key, c in zip(zip(w.tolist(), h.tolist()), n[sel].tolist()):
+            sizes[key] = sizes.get(key, 0) + c
+    return whole, [(w, h, n) for (w, h), n in sizes.items() if n > 0]
+
+
+def _lower_bound(groups, tw, th):
+    """No plan has fewer tiles: by the area and by the pieces bigger than a half of the tile."""
+    area = sum(w * h * n for w, h, n in groups)
+    big = sum(n for w, h, n in groups if w > (tw - KERF) / 2 + EPS and h > (th - KERF) / 2 + EPS)
+    return max(int(ceil(area / (tw * th) - EPS)), big)
+
+
+def make_cut_plan(plans, tw, th, budget=None):
+    """Cut plan of the cut tiles of the layouts of a job.
+    :param plans: layouts of all surfaces (LayoutPlan)
+    :param tw: tile width (mm)
+    :param th: tile height (mm)
+    :param budget: time for the search (s), TIME_BUDGET if not set
+    :rtype: dict
+    """
+    started = time.perf_counter()
+    budget = TIME_BUDGET if budget is None else budget
+    whole, groups = _groups(plans, tw, th)
+    bound = _lower_bound(groups, tw, th)
+
+    def order(key):
+        return sorted(groups, key=lambda g: key(g[0], g[1]), reverse=True)
+
+    # жадный план - всегда, остальные - пока есть время
+    best = _pack(order(ORDERS[0][1]), tw, th, SPLITS[0])
+    strategy = '%s/%s' % (ORDERS[0][0], SPLITS[0])
+    greedy = _tiles(best)
+
+    candidates = [(name, key, split) for name, key in ORDERS for split in SPLITS][1:]
+    rnd = random.Random(0)
+    tried = 1
+    while _tiles(best) > bound and time.perf_counter() - started < budget:
+        if candidates:
+            name, key, split = candidates.pop(0)
+            ordered = order(key)
+        else:
+            # случайные перестановки частей жадного порядка
+            name, split = 'shuffle', SPLITS[tried % len(SPLITS)]
+            ordered = order(ORDERS[0][1])
+            for _ in range(max(len(ordered) // 4, 1)):
+                i, j = rnd.randrange(len(ordered)), rnd.randrange(len(ordered))
+                ordered[i], ordered[j] = ordered[j], ordered[i]
+        patterns = _pack(ordered, tw, th, split)
+        tried += 1
+        if _tiles(patterns) < _tiles(best):
+            best, strategy = patterns, '%s/%s' % (name, split)
+
+    elapsed = time.perf_counter() - started
+    count('cut_plan_tries', tried)
+    cut_tiles = _tiles(best)
+
+    return {
+        'tiles': whole + cut_tiles,
+        'whole': whole,
+        'cut_tiles': cut_tiles,
+        'pieces': sum(n for _, _, n in groups),
+        'greedy': whole + greedy,
+        'lower_bound': whole + bound,
+        'optimal': cut_tiles == bound,
+        'strategy': strategy,
+        'time': round(elapsed, 4),
+        'patterns': [
+            {
+                'count': p.count,
+                'pieces': [{'width': w, 'height': h} for w, h in p.pieces],
+                'waste': round(tw * th - sum(w * h for w, h in p.pieces), SIZE_DECIMALS),
+            }
+            for p in sorted(best, key=lambda p: -p.count) if p.count
+        ],
+    }
@@ -0,0 +1,97 @@
+"""Render-and-store pipeline of a draw request.
+
+Functions here take the normalized request (see `server.parse_draw_args`)
+and are safe to run in a worker thread or process.
+"""
+from .algorithms import draw_floor1, draw_bathroom
+from .core import Size, DIAGONAL_ANGLE, surface_openings
+from .metrics import stage, count
+from .offcuts import make_cut_plan
+from .utils import encode_image, encode_svg, new_image_name, FORMAT_PNG, FORMAT_SVG
+
+
+def render(params):
+    """Render the scheme.
+    :param params: normalized request
+    :type params: dict
+    :return: PIL.Image or SVG document (str) for FORMAT_SVG, and details of the drawing
+        (level of detail, cut plan of the drawn layouts if options.cut_plan is given)
+    :rtype: tuple
+    """
+    tile = params['tile']
+    opts = params['options']
+    vector = (params.get('output') or {}).get('format') == FORMAT_SVG
+
+    if params['scheme'] == 'floor':
+        canvas = draw_floor1(
+            params['width'], params['length'],
+            tile['delimiter'], tile['width'], tile['length'], opts['method'],
+            vector=vector, angle=opts.get('angle', DIAGONAL_ANGLE),
+            openings=surface_openings(opts.get('openings'))
+        )
+        return _picture(canvas, vector, tile, opts.get('cut_plan', False))
+
+    door = opts.get('door')
+    door_size = Size(door['width'], door['height']) if door else None
+    canvas = draw_bathroom(
+        params['length'], params['width'], opts['height'],
+        tile['delimiter'], tile['width'], tile['length'], door_size,
+        vector=vector, openings=[surface_openings(opts.get('openings'), i) for i in range(4)],
+        auto_start=opts.get('auto_start', False)
+    )
+    return _picture(canvas, vector, tile, opts.get('cut_plan', False))
+
+
+def _picture(canvas, vector, tile, cut_plan=False):
+    details = {'lod': canvas.lod}
+    if cut_plan:
+        with stage('cut_plan'):
+            details['cut_plan'] = make_cut_plan(canvas.layouts, tile['width'], tile['length'])
+    return canvas.to_svg() if vector else canvas.im, details
+
+
+def render_encoded(params):
+    """Render the scheme and encode it in the requested format.
+    :param params: normalized request
+    :return: encoded picture and details of the drawing
+    :rtype: tuple
+    """
+    im, details = render(params)
+
+    output = params.get('output') or {}
+    with stage('encode'):
+        if output.get('format') == FORMAT_SVG:
+            encoded = encode_svg(im)
+        else:
+            encoded = encode_image(im, output.get('format', FORMAT_PNG), output.get('compress_level'))
+    count('encoded_bytes', encoded.size)
+
+    return encoded, details
+
+
+def render_encoded_bytes(params):
+    """Same as `render_encoded`, the result is picklable for a process pool.
+    :rtype: bytes
+    """
+    return render_encoded(params)[0].data
+
+
+def render_and_store(params, storage):
+    """Render the scheme and store the picture (encoded in memory, no temporary files).
+    :param params: normalized request
+    :param storage: CloudinaryStorage, MediaStorage
+    :return: URL of the picture and encoding details
+    :rtype: dict
+    """
+    encoded, details = render_encoded(params)
+
+    with stage('upload'):
+        url = storage.store(encoded.data, new_image_name(encoded.ext))
+
+    return {
+        'url': url,
+        'format': encoded.format,
+        'bytes': encoded.size,
+        'encode_time': round(encoded.encode_time, 4),
+        **details
+    }
@@ -0,0 +1,312 @@
+"""Placement of the tiles of a grid layout in pixels.
+
+The layout is counted in mm, but the picture steps the tiles in whole
+pixels the way the drawing loops always did: the tile and the delimiter
+are converted to pixels once and every position is a sum of them. So the
+picture is the same whatever the layout code counts in mm.
+
+An axis is a sequence of intervals (x0, x1, inclusive bounds) in the order
+the tiles are painted, with the cut flags of their sides. A bound may be
+less than the other one: such tiles were always painted too (the delimiter
+ate the rest of the axis). Some tiles are painted over others (the center
+method), so the intervals are numbered by layers: the intervals of one
+layer do not overlap, a later one of two overlapping intervals is in an
+upper layer.
+"""
+import numpy as np
+
+from .layout import STEPS_CENTER
+
+
+class PixelAxis:
+    """Tiles of one axis in pixels."""
+
+    def __init__(self, x0, x1, cut_lo, cut_hi):
+        """
+        :param x0: lower side of every tile (px)
+        :param x1: upper side of every tile (px)
+        :param cut_lo: the lower side is a cut
+        :param cut_hi: the upper side is a cut
+        """
+        self.x0 = x0
+        self.x1 = x1
+        self.cut_lo = cut_lo
+        self.cut_hi = cut_hi
+
+    def __len__(self):
+        return len(self.x0)
+
+    def __getitem__(self, index):
+        return PixelAxis(self.x0[index], self.x1[index], self.cut_lo[index], self.cut_hi[index])
+
+    @classmethod
+    def concat(cls, axes):
+        return cls(*(np.concatenate([getattr(a, f) for a in axes]) for f in ('x0', 'x1', 'cut_lo', 'cut_hi')))
+
+    def mirror(self, length):
+        """Axis counted from the opposite side of `length` (same painting order)."""
+        return PixelAxis(length - self.x1, length - self.x0, self.cut_hi, self.cut_lo)
+
+    def bounds(self):
+        return np.minimum(self.x0, self.x1), np.maximum(self.x0, self.x1)
+
+    def layers(self):
+        """Layer of every tile: a tile overlapping an earlier one is painted in an upper layer."""
+        lo, hi = self.bounds()
+        layer = np.zeros(len(self), dtype=np.int64)
+        if len(self) < 2:
+            return layer
+        # перекрываются только соседние по положению плитки
+        order = np.argsort(lo, kind='stable')
+        pairs = []
+        for gap in (1, 2):
+            a, b = order[:-gap], order[gap:]
+            hit = lo[b] <= hi[a]
+            a, b = a[hit], b[hit]
+            pairs.append((np.minimum(a, b), np.maximum(a, b)))
+        first, later = (np.concatenate(p) for p in zip(*pairs))
+        for _ in range(len(self)):
+            up = np.maximum(layer[later], layer[first] + 1)
+            if (up == layer[later]).all():
+                break
+            np.maximum.at(layer, later, up)
+        return layer
+
+    def visible(self, lo, hi):
+        """Tiles intersecting [lo, hi] (px)."""
+        a, b = self.bounds()
+        return (b >= lo) & (a <= hi)
+
+    def aggregate(self, n):
+        """Whole tiles of the lowest layer grouped by n as one tile (for tiles too small to see).
+        :return: axis, layers
+        """
+        layer = self.layers()
+        whole = np.flatnonzero((layer == 0) & ~self.cut_lo & ~self.cut_hi)
+        if n < 2 or len(whole) < 2:
+            return self, layer
+        lo, hi = self.bounds()
+        whole = whole[np.argsort(lo[whole], kind='stable')]
+        first = whole[::n]
+        last = whole[np.minimum(np.arange(len(first)) * n + n - 1, len(whole) - 1)]
+
+        rest = np.ones(len(self), dtype=bool)
+        rest[whole] = False
+        rest[first] = True
+        # группа рисуется на месте своей первой плитки
+        x0, x1 = self.x0.copy(), self.x1.copy()
+        x0[first], x1[first] = lo[first], hi[last]
+        grouped = PixelAxis(x0, x1, self.cut_lo, self.cut_hi)
+        return grouped[rest], layer[rest]
+
+
+class _Steps:
+    """Intervals collected by a stepping loop."""
+
+    def __init__(self):
+        self.parts = []
+
+    def tile(self, x0, x1, cut_lo=False, cut_hi=False):
+        self.parts.append((np.array([x0]), np.array([x1]), cut_lo, cut_hi))
+
+    def run(self, x0, tile):
+        """Whole tiles starting at x0 (array)."""
+        if len(x0):
+            self.parts.append((x0, x0 + tile, False, False))
+
+    def axis(self):
+        if not self.parts:
+            e = np.zeros(0, dtype=np.int64)
+            return PixelAxis(e, e, np.zeros(0, dtype=bool), np.zeros(0, dtype=bool))
+        return PixelAxis(
+            np.concatenate([p[0] for p in self.parts]).astype(np.int64),
+            np.concatenate([p[1] for p in self.parts]).astype(np.int64),
+            np.concatenate([np.full(len(p[0]), p[2]) for p in self.parts]),
+            np.concatenate([np.full(len(p[0]), p[3]) for p in self.parts]),
+        )
+
+
+def direct_steps(length, tile, delimiter, start=None, lead=0, jump=True):
+    """Tiles from the lower side, every tile (and the first one) after a delimiter.
+
+    The last tile is cut at `length - delimiter`.
+    :param length: length of the axis (px)
+    :param tile: tile (px)
+    :param delimiter: delimiter (px, > 0)
+    :param start: the first tile is an offcut shorter by `start` (px) or None
+    :param lead: space before the first delimiter (px)
+    :param jump: after the cut tile the axis ends (columns), or one more tile is stepped (rows)
+    :return: PixelAxis, the width of the last cut tile (px) or None
+    """
+    steps = _Steps()
+    step = tile + delimiter
+    offcut = None
+    local = lead
+    first = True
+    while True:
+        # целые плитки подряд - без цикла
+        if not first and local + delimiter + tile + delimiter <= length:
+            n = (length - tile - 2 * delimiter - local) // step + 1
+            steps.run(local + delimiter + step * np.arange(n), tile)
+            local += n * step
+
+        local += delimiter  # ряд начинается с разделителя
+
+        start_x = start if first else None
+        max_x = None
+        if local + tile + delimiter > length:  # целая плитка не входит
+            max_x = (length - delimiter) - local
+
+        steps.tile(
+            local, local + (tile if max_x is None else max_x) - (start_x or 0),
+            start_x is not None, max_x is not None
+        )
+
+        if max_x is not None and max_x > 0:
+            offcut = max_x  # подрезка последней плитки
+        if jump and max_x is not None and max_x > 0:
+            local += delimiter + max_x - (start_x or 0)
+        else:
+            local += tile - (start_x or 0)
+
+        if local >= length:
+            break
+        first = False
+
+    return steps.axis(), offcut
+
+
+def center_strips(length, tile, delimiter):
+    """Columns of the center method: the central one, then to the right, then to the left.
+
+    The tile before the last one on the right is stretched to the end
+    (`length - delimiter`), the last one on the left is cut at 0.
+    :return: PixelAxis
+    """
+    steps = _Steps()
+    step = tile + delimiter
+    center = (length - tile) // 2
+    steps.tile(center, center + tile)
+
+    # полосы справа
+    x = center + tile
+    while True:
+        if x + delimiter + tile <= length - tile:
+            n = (length - 2 * tile - delimiter - x) // step + 1
+            steps.run(x + delimiter + step * np.arange(n), tile)
+            x += n * step
+
+        x += delimiter
+        if x + tile > length - tile:  # целая плитка не входит
+            steps.tile(x, length - delimiter, False, True)
+        else:
+            steps.tile(x, x + tile)
+
+        x += tile
+        if x > length:
+            break
+
+    # полосы слева
+    x = center
+    while True:
+        if x - step >= 0:
+            n = (x - step) // step + 1
+            steps.run(x - step * (np.arange(n) + 1), tile)
+            x -= n * step
+
+        x -= tile + delimiter
+        if x < 0:  # целая плитка не входит
+            steps.tile(0, x + tile, True, False)
+        else:
+            steps.tile(x, x + tile)
+
+        if x < 0:
+            break
+
+    return steps.axis()
+
+
+def center_rows(length, tile, delimiter, start=None):
+    """Tiles of a column of the center method: the central one, then down, then up.
+
+    The central tile is painted over by its neighbours (they step from
+    it by the delimiter). The tile before the last one at the bottom is
+    stretched to the end, the last one at the top is cut at 0.
+    :param start: the central tile is cut by `start` (px) at the top
+    :return: PixelAxis, the cut of the last tile at the top (px)
+    """
+    steps = _Steps()
+    step = tile + delimiter
+    center = (length - tile) // 2
+    steps.tile(center + (start or 0), center + tile, start is not None, False)
+
+    # вниз от центра
+    y = center + tile - delimiter
+    while True:
+        if y + delimiter + tile <= length - tile:
+            n = (length - 2 * tile - delimiter - y) // step + 1
+            steps.run(y + delimiter + step * np.arange(n), tile)
+            y += n * step
+
+        y += delimiter
+        if y + tile > length - tile:  # целая плитка не входит
+            steps.tile(y, length - delimiter, False, True)
+        else:
+            steps.tile(y, y + tile)
+
+        y += tile
+        if y > length:
+            break
+
+    # вверх от центра
+    y = center
+    start_y = None
+    while True:
+        if y - delimiter >= 0:
+            n = (y - delimiter) // step + 1
+            steps.run(y - delimiter - step * np.arange(n), tile)
+            y -= n * step
+
+        y -= delimiter
+        if y < 0:  # целая плитка не входит
+            start_y = -y
+            steps.tile(0, y + tile, True, False)
+        else:
+            start_y = None
+            steps.tile(y, y + tile)
+
+        y -= tile
+        if y < -tile:
+            break
+
+    return steps.axis(), start_y
+
+
+def grid_steps(steps, length, tile, delimiter, to_pixels, columns=True):
+    """Tiles of an axis of a grid layout in pixels.
+    :type steps: AxisSteps
+    :param length: length of the axis (px)
+    :param tile: tile (px)
+    :param delimiter: delimiter (px, > 0)
+    :param to_pixels: conversion of mm
+    :param columns: the axis is X
+    :return: list of PixelAxis (the columns of the center method have own rows), offcut (px) or None
+    """
+    if steps.kind == STEPS_CENTER:
+        if columns:
+            return [center_strips(length, tile, delimiter)], None
+        # центральная плитка каждой колонки, кроме первой, подрезана как последняя плитка предыдущей
+        first, start = center_rows(length, tile, delimiter)
+        rest, _ = center_rows(length, tile, delimiter, start)
+        return [first, rest], None
+
+    start, lead = None, 0
+    if steps.shift >= steps.tile:
+        # от первой плитки виден только разделитель
+        lead = max(tile + delimiter - to_pixels(steps.shift), 0)
+    elif steps.shift:
+        start = to_pixels(steps.shift)
+    axis, offcut = direct_steps(length, tile, delimiter, start, lead, jump=columns)
+    if steps.mirrored:
+        axis = axis.mirror(length)
+    return [axis], offcut
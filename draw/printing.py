@@ -0,0 +1,187 @@
+"""Print export: the scheme on a paper sheet at print resolution (PNG).
+
+At 300 DPI an A1 sheet is about 7000x9900 px, a full RGBA canvas of it
+is hundreds of MB. The page is drawn by horizontal strips instead: every
+strip is drawn on its own canvas (the same `Scene` the pyramid tiles
+draw, only the tiles in the strip are drawn) and compressed into the PNG
+stream right away, so the memory depends on the strip height and the
+page width, not on the page height.
+"""
+import struct
+import zlib
+
+import numpy as np
+
+from .core import Canvas, DRAWING_WATERMARK_TEXT, get_watermark
+from .metrics import stage, count
+from .scene import Scene
+
+
+DPI = 300
+MIN_DPI = 72
+MAX_DPI = 600
+MM_PER_INCH = 25.4
+
+# размеры листов (мм), книжная ориентация
+PAPER_SIZES = {
+    'A4': (210, 297),
+    'A3': (297, 420),
+    'A2': (420, 594),
+    'A1': (594, 841),
+    'A0': (841, 1189),
+}
+DEFAULT_PAPER = 'A2'
+# поля листа (мм)
+PAGE_MARGIN = 10
+
+# экранный кадр схемы (px): водяной знак листа занимает ту же его долю
+WATERMARK_FRAME = (1280, 720)
+
+# высота полосы (px): память на полосу - ширина листа * STRIP_HEIGHT * 4 байт
+STRIP_HEIGHT = 256
+COMPRESS_LEVEL = 6
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+# фильтр строк PNG: разность со строкой выше (строки схемы в основном повторяются)
+PNG_FILTER_UP = 2
+
+
+def _chunk(tag, data):
+    return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+
+class PngWriter:
+    """RGB PNG written by rows: the compressed rows go to `write` at once."""
+
+    def __init__(self, write, width, height, dpi=None, compress_level=COMPRESS_LEVEL):
+        """
+        :param write: callable taking bytes (file.write)
+        :param dpi: physical resolution written to the file (pHYs)
+        """
+        self._write = write
+        self._width = width
+        self._rows_left = height
+        self._compressor = zlib.compressobj(compress_level)
+        # последняя записанная строка (для фильтра следующей)
+        self._last = np.zeros(width * 3, dtype=np.uint8)
+
+        write(PNG_SIGNATURE)
+        write(_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+        if dpi:
+            ppm = int(round(dpi / MM_PER_INCH * 1000))
+            write(_chunk(b'pHYs', struct.pack('>IIB', ppm, ppm, 1)))
+
+    def write_rows(self, rgb):
+        """
+        :param rgb: rows of the picture, uint8 array (rows, width, 3)
+        """
+        h, w = rgb.shape[:2]
+        assert w == self._width and h <= self._rows_left, 'rows do not fit the picture'
+        self._rows_left -= h
+
+        flat = rgb.reshape(h, w * 3)
+        rows = np.empty((h, w * 3 + 1), dtype=np.uint8)
+        rows[:, 0] = PNG_FILTER_UP
+        np.subtract(flat[:1], self._last, out=rows[:1, 1:])
+        np.subtract(flat[1:], flat[:-1], out=rows[1:, 1:])
+        self._last = flat[-1].copy()
+
+        data = self._compressor.compress(rows)
+        if data:
+            self._write(_chunk(b'IDAT', data))
+
+    def close(self):
+        assert not self._rows_left, 'not all rows are written'
+        self._write(_chunk(b'IDAT', self._compressor.flush()))
+        self._write(_chunk(b'IEND', b''))
+
+
+class PrintPage:
+
+    def __init__(self, scene, paper=DEFAULT_PAPER, dpi=DPI):
+        """The scene in the center of the sheet, the orientation of the sheet fits the scene best.
+        :type scene: Scene
+        :param paper: key of PAPER_SIZES
+        """
+        self.scene = scene
+        self.paper = paper
+        self.dpi = dpi
+        px_per_mm = dpi / MM_PER_INCH
+
+        candidates = []
+        pw, ph = PAPER_SIZES[paper]
+        for w, h in ((pw, ph), (ph, pw)):
+            scale = min((w - PAGE_MARGIN * 2) / scene.width, (h - PAGE_MARGIN * 2) / scene.height)
+            candidates.append((scale, w, h))
+        scale, w, h = max(candidates)
+
+        self.width = int(round(w * px_per_mm))
+        self.height = int(round(h * px_per_mm))
+        # px в 1 мм схемы
+        self.scale = scale * px_per_mm
+        self.left = int(round((self.width - scene.width * self.scale) / 2))
+        self.top = int(round((self.height - scene.height * self.scale) / 2))
+
+    @classmethod
+    def from_params(cls, params):
+        """Same scene as `draw_floor1` and `draw_bathroom` draw.
+        :param params: normalized request with the print options
+        :rtype: PrintPage
+        """
+        options = params['print']
+        return cls(Scene.from_params(params), options['paper'], options['dpi'])
+
+    def strips(self, height=STRIP_HEIGHT):
+        """Strips of the page from the top, the watermark is in the center of the page.
+        :return: iterator of (top, PIL.Image.Image)
+        """
+        scale = min(self.width / WATERMARK_FRAME[0], self.height / WATERMARK_FRAME[1])
+        overlay, (ox, oy) = get_watermark(DRAWING_WATERMARK_TEXT, (self.width, self.height), scale=scale)
+
+        for top in range(0, self.height, height):
+            canvas = Canvas(self.width, min(height, self.height - top), scale_factor=self.scale)
+            self.scene.draw(canvas, self.scale, -self.left, top - self.top)
+            im = canvas.im
+
+            # часть водяного знака в полосе
+            y0, y1 = max(oy, top), min(oy + overlay.height, top + im.height)
+            if y0 < y1:
+                im.alpha_composite(overlay, (ox, y0 - top), (0, y0 - oy, overlay.width, y1 - oy))
+            count('print_strips')
+            yield top, im
+
+    def write_png(self, write, strip_height=STRIP_HEIGHT):
+        """Draw the page and write it as PNG strip by strip.
+        :param write: callable taking bytes (file.write)
+        """
+        png = PngWriter(write, self.width, self.height, self.dpi)
+        for _, im in self.strips(strip_height):
+            rgb = np.asarray(im)[..., :3]
+            with stage('encode'):
+                png.write_rows(rgb)
+        with stage('encode'):
+            png.close()
+
+
+def render_print(params, path):
+    """Render the print page of the request into the file.
+    :param params: normalized request with the print options (see `server.parse_print_args`)
+    :param path: PNG file
+    :return: details of the page
+    :rtype: dict
+    """
+    with stage('layout'):
+        page = PrintPage.from_params(params)
+
+    with open(path, 'wb') as f:
+        page.write_png(f.write)
+        size = f.tell()
+    count('encoded_bytes', size)
+
+    return {
+        'paper': page.paper,
+        'dpi': page.dpi,
+        'width': page.width,
+        'height': page.height,
+        'bytes': size,
+    }
@@ -0,0 +1,120 @@
+"""Zoomable image pyramid of a scheme.
+
+The scheme is kept as objects placed in mm (the layouts are computed
+once). Every pyramid tile is drawn on its own small canvas, only the
+tiles of the layout in its window are drawn, so a full resolution
+raster never exists.
+
+Zoom 0 is the whole scheme in one tile, every next zoom doubles the
+scale up to MAX_PX_PER_MM.
+"""
+from collections import OrderedDict
+from math import ceil, log2
+import threading
+
+from .core import Canvas
+from .metrics import stage, count
+from .scene import Scene
+from .utils import encode_image, FORMAT_PNG
+
+
+TILE_SIZE = 256
+# масштаб наибольшего приближения: плитка 600 мм - 300 px
+MAX_PX_PER_MM = 0.5
+
+# схемы в памяти процесса (раскладки посчитаны)
+PYRAMIDS_CACHE_SIZE = 16
+
+
+class Pyramid:
+
+    def __init__(self, scene):
+        """
+        :type scene: Scene
+        """
+        self.scene = scene
+        self.width = scene.width
+        self.height = scene.height
+        self.max_zoom = max(int(ceil(log2(max(self.width, self.height) * MAX_PX_PER_MM / TILE_SIZE))), 0)
+
+    @classmethod
+    def from_params(cls, params):
+        """Same scene as `draw_floor1` and `draw_bathroom` draw.
+        :param params: normalized request
+        :rtype: Pyramid
+        """
+        return cls(Scene.from_params(params))
+
+    def scale(self, z):
+        """px in 1 mm at the zoom."""
+        return TILE_SIZE * 2 ** z / max(self.width, self.height)
+
+    def grid_size(self, z):
+        """Number of tiles (columns, rows) at the zoom."""
+        s = self.scale(z)
+        return int(ceil(self.width * s / TILE_SIZE)), int(ceil(self.height * s / TILE_SIZE))
+
+    def info(self):
+        return {
+            'tile_size': TILE_SIZE,
+            'max_zoom': self.max_zoom,
+            'width': int(ceil(self.width * self.scale(self.max_zoom))),
+            'height': int(ceil(self.height * self.scale(self.max_zoom))),
+        }
+
+    def tile(self, z, x, y):
+        """
+        :return: tile image or None (out of the pyramid)
+        :rtype: PIL.Image.Image
+        """
+        if not 0 <= z <= self.max_zoom:
+            return None
+        cols, rows = self.grid_size(z)
+        if not (0 <= x < cols and 0 <= y < rows):
+            return None
+
+        s = self.scale(z)
+        canvas = Canvas(TILE_SIZE, TILE_SIZE, scale_factor=s)
+        self.scene.draw(canvas, s, x * TILE_SIZE, y * TILE_SIZE)
+        return canvas.im
+
+
+_pyramids = OrderedDict()
+_lock = threading.Lock()
+
+
+def get_pyramid(key, params):
+    """Pyramid of the request from the cache of the process.
+    :param key: key of the request
+    :rtype: Pyramid
+    """
+    with _lock:
+        pyramid = _pyramids.get(key)
+        if pyramid is not None:
+            _pyramids.move_to_end(key)
+            return pyramid
+
+    with stage('layout'):
+        pyramid = Pyramid.from_params(params)
+
+    with _lock:
+        _pyramids[key] = pyramid
+        while len(_pyramids) > PYRAMIDS_CACHE_SIZE:
+            _pyramids.popitem(last=False)
+
+    return pyramid
+
+
+def render_pyramid_tile(key, params, z, x, y):
+    """Encoded pyramid tile (PNG) or None.
+    :rtype: bytes
+    """
+    im = get_pyramid(key, params).tile(z, x, y)
+    if im is None:
+        return None
+
+    with stage('encode'):
+        encoded = encode_image(im, FORMAT_PNG)
+    count('encoded_bytes', encoded.size)
+
+    return encoded.data
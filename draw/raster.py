@@ -0,0 +1,259 @@
+"""Rasterization of the display list into the canvas image.
+
+Tiles are passed as pixel rectangles with inclusive bounds
+(x0, y0, x1, y1) and CUT_* flags; the rectangles must not overlap.
+Every tile is a fill plus four border lines drawn in the order:
+top (y0), left (x0), right (x1), bottom (y1), a later line wins in the
+corners. x1 < x0 (y1 < y0) is allowed: the lines keep their order.
+
+A rotated lattice of tiles is drawn pixel by pixel: the position of the
+pixel center in the lattice tells if it is in a tile or on its border.
+
+Everything is drawn in place into one `Frame`: NumPy and ImageDraw write
+into the same buffer, the picture is never copied.
+"""
+from math import cos, sin, radians
+
+import numpy as np
+from PIL import Image, ImageDraw
+
+from .display import LINE, POLYGON, TEXT, TILES, LATTICE
+from .layout import CUT_LEFT, CUT_TOP, CUT_RIGHT, CUT_BOTTOM
+
+
+BACKEND_PIL = 'pil'
+BACKEND_NUMPY = 'numpy'
+
+# решетка рисуется полосами строк: временные массивы не больше полосы
+LATTICE_BAND_ROWS = 64
+
+
+class Frame:
+    """RGBA picture of one buffer: `im` (PIL) and `pixels` (NumPy, uint32 pixels) share the memory."""
+
+    def __init__(self, w, h, background):
+        self.rgba = np.empty((h, w, 4), dtype=np.uint8)
+        self.rgba[...] = background
+        self.pixels = self.rgba.view(np.uint32)[..., 0]
+        self.im = Image.frombuffer('RGBA', (w, h), self.rgba, 'raw', 'RGBA', 0, 1)
+        # PIL пишет прямо в буфер массива (иначе копия при первом рисовании)
+        self.im.readonly = 0
+
+
+def pil_draw_tiles(im, x0, y0, x1, y1, cut, fill, color, color_cutted):
+    """Draw tiles by ImageDraw calls, one polygon and four lines per tile.
+    :type im: PIL.Image.Image
+    """
+    d = ImageDraw.Draw(im)
+
+    for tx0, ty0, tx1, ty1, c in zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist(), cut.tolist()):
+        d.polygon([(tx0, ty0), (tx1, ty0), (tx1, ty1), (tx0, ty1)], fill=fill)
+
+        d.line((tx0, ty0, tx1, ty0), fill=color_cutted if c & CUT_TOP else color, width=1)
+        d.line((tx0, ty1, tx0, ty0), fill=color_cutted if c & CUT_LEFT else color, width=1)
+        d.line((tx1, ty0, tx1, ty1), fill=color_cutted if c & CUT_RIGHT else color, width=1)
+        d.line((tx1, ty1, tx0, ty1), fill=color_cutted if c & CUT_BOTTOM else color, width=1)
+
+
+def _accumulate(shape, points):
+    """Sum of +1/-1 marks in a 2D array.
+    :param points: sequence of (sign, rows, columns)
+    """
+    acc = np.zeros(shape, dtype=np.int8)
+    for sign, r, c in points:
+        np.add.at(acc, (r, c), sign)
+    return acc
+
+
+def _rects_mask(shape, x0, y0, x1, y1):
+    """Mask of the union of rectangles (inclusive bounds, already clipped)."""
+    h, w = shape
+    acc = _accumulate((h + 1, w + 1), (
+        (1, y0, x0),
+        (-1, y0, x1 + 1),
+        (-1, y1 + 1, x0),
+        (1, y1 + 1, x1 + 1),
+    ))
+    np.cumsum(acc, axis=0, out=acc)
+    np.cumsum(acc, axis=1, out=acc)
+    return acc[:h, :w] > 0
+
+
+def _lines_index(shape, pos, start, end, horizontal):
+    """Flat indexes of pixels of 1px axis-aligned lines (inclusive bounds, already clipped).
+    :param pos: row of horizontal line / column of vertical line
+    """
+    w = shape[1]
+    length = end - start + 1
+    step = 1 if horizontal else w
+    first = pos * w + start if horizontal else start * w + pos
+    # номер пикселя внутри своей линии
+    k = np.arange(length.sum()) - np.repeat(np.cumsum(length) - length, length)
+    return np.repeat(first, length) + k * step
+
+
+def _packed(rgba):
+    """RGBA color as one uint32 pixel value."""
+    return np.array(rgba, dtype=np.uint8).view(np.uint32)[0]
+
+
+def numpy_draw_tiles(pixels, x0, y0, x1, y1, cut, fill, color, color_cutted):
+    """Draw tiles by slice/mask assignment into the RGBA buffer (in place).
+
+    The result is equal to `pil_draw_tiles` pixel for pixel.
+    :param pixels: RGBA pixels as uint32 values (see `Frame`)
+    """
+    if not len(x0):
+        return
+    h, w = pixels.shape
+    lx, hx = np.minimum(x0, x1), np.maximum(x0, x1)
+    ly, hy = np.minimum(y0, y1), np.maximum(y0, y1)
+
+    # работаем только в пределах охватывающего прямоугольника
+    bx0 = max(int(lx.min()), 0)
+    by0 = max(int(ly.min()), 0)
+    bx1 = min(int(hx.max()), w - 1)
+    by1 = min(int(hy.max()), h - 1)
+    if bx0 > bx1 or by0 > by1:
+        return
+    view = pixels[by0:by1 + 1, bx0:bx1 + 1]
+    vh, vw = view.shape
+
+    x0, x1, lx, hx = x0 - bx0, x1 - bx0, lx - bx0, hx - bx0
+    y0, y1, ly, hy = y0 - by0, y1 - by0, ly - by0, hy - by0
+
+    cx0 = np.clip(lx, 0, vw - 1)
+    cx1 = np.clip(hx, 0, vw - 1)
+    cy0 = np.clip(ly, 0, vh - 1)
+    cy1 = np.clip(hy, 0, vh - 1)
+
+    # прямоугольники, попадающие в область
+    inside = (hx >= 0) & (lx < vw) & (hy >= 0) & (ly < vh)
+
+    view[_rects_mask((vh, vw), cx0[inside], cy0[inside], cx1[inside], cy1[inside])] = _packed(fill)
+
+    # линии пишем по плоским индексам области (без копии)
+    flat = view.flat
+
+    borders = (
+        # (flag, horizontal line?, line coordinate)
+        (CUT_TOP, True, y0),
+        (CUT_LEFT, False, x0),
+        (CUT_RIGHT, False, x1),
+        (CUT_BOTTOM, True, y1),
+    )
+    for flag, horizontal, pos in borders:
+        limit = vh if horizontal else vw
+        on = inside & (pos >= 0) & (pos < limit)
+        is_cut = (cut & flag) != 0
+        for sel, c in ((on & ~is_cut, color), (on & is_cut, color_cutted)):
+            if not sel.any():
+                continue
+            if horizontal:
+                idx = _lines_index((vh, vw), pos[sel], cx0[sel], cx1[sel], True)
+            else:
+                idx = _lines_index((vh, vw), pos[sel], cy0[sel], cy1[sel], False)
+            flat[idx] = _packed(c)
+
+
+def numpy_draw_lattice(pixels, lattice, fill, color, color_cutted):
+    """Draw a rotated lattice of tiles (in place), border lines are 1px inside the tiles,
+    the sides cut by the clip rectangle are drawn by `color_cutted`.
+    :param pixels: RGBA pixels as uint32 values (see `Frame`)
+    :type lattice: Lattice
+    """
+    h, w = pixels.shape
+
+    x0, y0, x1, y1 = lattice.rect
+    bx0, by0 = max(x0, 0), max(y0, 0)
+    bx1, by1 = min(x1, w - 1), min(y1, h - 1)
+    if bx0 > bx1 or by0 > by1:
+        return
+
+    # центры пикселей относительно угла плитки, в осях решетки
+    ox, oy = lattice.origin
+    px = (np.arange(bx0, bx1 + 1) + 0.5 - ox).astype(np.float32)
+    c, s = cos(radians(lattice.angle)), sin(radians(lattice.angle))
+    (su, sv), (tu, tv) = lattice.step, lattice.tile
+
+    for r0 in range(by0, by1 + 1, LATTICE_BAND_ROWS):
+        r1 = min(r0 + LATTICE_BAND_ROWS, by1 + 1)
+        view = pixels[r0:r1, bx0:bx1 + 1]
+        py = (np.arange(r0, r1) + 0.5 - oy).astype(np.float32)[:, None]
+        fu = np.mod(px * c + py * s, su)
+        fv = np.mod(py * c - px * s, sv)
+
+        tile = (fu < tu) & (fv < tv)
+        border = tile & ((fu < 1) | (fu > tu - 1) | (fv < 1) | (fv > tv - 1))
+        # края прямоугольника (не края изображения)
+        cut = np.zeros_like(tile)
+        cut[0, :] |= r0 == y0
+        cut[-1, :] |= r1 - 1 == y1
+        cut[:, 0] |= bx0 == x0
+        cut[:, -1] |= bx1 == x1
+
+        view[tile] = _packed(fill)
+        view[border] = _packed(color)
+        view[tile & cut] = _packed(color_cutted)
+
+
+class PilBackend:
+    """Draws everything by ImageDraw."""
+
+    def __init__(self, fill, color, color_cutted):
+        """
+        :param fill: fill of tiles
+        :param color: border of tiles
+        :param color_cutted: border of the cut side of tiles
+        """
+        self.fill = fill
+        self.color = color
+        self.color_cutted = color_cutted
+
+    def draw_tiles(self, frame, t):
+        """
+        :type frame: Frame
+        :type t: Tiles
+        """
+        pil_draw_tiles(frame.im, t.x0, t.y0, t.x1, t.y1, t.cut, self.fill, self.color, self.color_cutted)
+
+    def render(self, frame, items):
+        """Draw the display list items into the frame.
+        :type frame: Frame
+        """
+        d = None
+        for item in items:
+            kind = item[0]
+            if kind == LATTICE:
+                numpy_draw_lattice(frame.pixels, item[1], self.fill, self.color, self.color_cutted)
+                continue
+            if kind == TILES:
+                self.draw_tiles(frame, item[1])
+                continue
+
+            if d is None:
+                d = ImageDraw.Draw(frame.im)
+            if kind == LINE:
+                _, xy, fill, width = item
+                d.line(xy, fill=fill, width=width)
+            elif kind == POLYGON:
+                _, points, fill, outline = item
+                d.polygon(points, fill=fill, outline=outline)
+            elif kind == TEXT:
+                _, xy, text, fill, font = item
+                d.text(xy, text, fill=fill, font=font)
+            else:
+                raise Exception(f"unknown primitive: {kind}")
+
+
+class NumpyBackend(PilBackend):
+    """Tiles are drawn by NumPy, other primitives by ImageDraw."""
+
+    def draw_tiles(self, frame, t):
+        numpy_draw_tiles(frame.pixels, t.x0, t.y0, t.x1, t.y1, t.cut, self.fill, self.color, self.color_cutted)
+
+
+BACKENDS = {
+    BACKEND_PIL: PilBackend,
+    BACKEND_NUMPY: NumpyBackend,
+}
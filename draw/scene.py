@@ -0,0 +1,101 @@
+"""Scheme of a request as objects placed in mm.
+
+The same scene `draw_floor1` and `draw_bathroom` draw, without a canvas:
+used by the pyramid tiles, the print export and the geometry payload.
+"""
+from .core import Floor, Wall, WallTilesOptions, Position, DIAGONAL_ANGLE, surface_openings
+from .layout import auto_wall_start
+
+
+class Scene:
+
+    def __init__(self, objects, width, height, contour):
+        """
+        :param objects: (object, x, y, draw options), position in mm
+        :param width: scene width (mm)
+        :param height: scene height (mm)
+        :param contour: length of the contour marks at the corners (mm)
+        """
+        self.objects = objects
+        self.width = width
+        self.height = height
+        self.contour = contour
+
+    def draw(self, canvas, scale, left, top):
+        """Draw the part of the scene the canvas shows, only the tiles in it are drawn.
+        :type canvas: Canvas
+        :param scale: px in 1 mm of the whole picture
+        :param left: position of the canvas in the whole picture (px)
+        :param top: position of the canvas in the whole picture (px)
+        """
+        cw, ch = canvas.size
+        # метки углов - в px холста, как у draw_floor1 и draw_bathroom
+        contour = canvas.to_pixels(self.contour)
+        for obj, ox, oy, options in self.objects:
+            # начало объекта в целых px всей картинки: соседние части стыкуются
+            px, py = int(round(ox * scale)), int(round(oy * scale))
+            size = obj.get_size()
+            if px - contour - left > cw or py - contour - top > ch \
+                    or px + size.width * scale + contour < left or py + size.height * scale + contour < top:
+                continue
+
+            pos = Position(px - left, py - top)
+            obj.draw_contour_out(canvas, pos, contour)
+            window = (
+                (left - px) / scale, (top - py) / scale,
+                (left + cw - px) / scale, (top + ch - py) / scale,
+            )
+            obj.draw(canvas, pos, window=window, **options)
+
+        canvas.flush()
+
+    @classmethod
+    def from_params(cls, params):
+        """
+        :param params: normalized request
+        :rtype: Scene
+        """
+        tile = params['tile']
+        opts = params['options']
+
+        if params['scheme'] == 'floor':
+            width, length = params['width'], params['length']
+            margin = length / 100.0
+            floor = Floor(
+                width, length,
+                WallTilesOptions(tile['width'], tile['length'], tile['delimiter']),
+                options={
+                    'angle': opts.get('angle', DIAGONAL_ANGLE),
+                    'openings': surface_openings(opts.get('openings')),
+                }
+            )
+            return cls(
+                [(floor, margin, margin, {'method': opts['method']})],
+                length + margin * 2, width + margin * 2, margin
+            )
+
+        l, w, h = params['length'], params['width'], opts['height']
+        margin = l / 100.0 * 3.0
+        wall_del = margin * 3
+
+        objects = []
+        x = margin
+        offcut = None
+        if opts.get('auto_start'):
+            offcut = auto_wall_start((l, w, l, w), tile['width'], tile['delimiter'])
+        for i, wall_width in enumerate((l, w, l, w)):
+            options = {'openings': surface_openings(opts.get('openings'), i)}
+            door = opts.get('door')
+            if i == 2 and door:
+                options['door_width'] = door['width']
+                options['door_height'] = door['height']
+            wall = Wall(
+                wall_width, h,
+                tile=WallTilesOptions(tile['width'], tile['length'], tile['delimiter'], sx=offcut),
+                options=options
+            )
+            offcut = wall.get_tile_options().max_x
+            objects.append((wall, x, margin, {}))
+            x += wall_width + wall_del
+
+        return cls(objects, x - wall_del + margin, h + margin * 2, margin)
@@ -0,0 +1,275 @@
+"""SVG output of the same scene as the raster canvas.
+
+Units of the document are pixels of the canvas. Whole tiles of a grid
+layout are drawn by one <pattern>, so the size of the document depends
+on the number of cut tiles only.
+"""
+from xml.sax.saxutils import escape, quoteattr
+
+import numpy as np
+
+from .core import Canvas, fit_font, color, color_cutted, color_tile, WATERMARK_COLOR
+from .display import LINE, POLYGON, TEXT, TILES, LAYOUT
+from .layout import CUT_LEFT, CUT_TOP, CUT_RIGHT, CUT_BOTTOM, DiagonalPlan, MAX_VERTICES
+from .metrics import stage, count
+from .raster import BACKEND_PIL
+
+
+def _n(value):
+    """Compact number."""
+    return ('%.2f' % value).rstrip('0').rstrip('.')
+
+
+def _paint(c):
+    """SVG paint attributes of the color: RGBA tuple or '#rgb' string."""
+    if c is None:
+        return 'none', None
+    if isinstance(c, str):
+        return c, None
+    r, g, b = c[:3]
+    opacity = c[3] / 255 if len(c) > 3 and c[3] != 255 else None
+    return '#%02x%02x%02x' % (r, g, b), opacity
+
+
+def _attrs(**kwargs):
+    return ' '.join(
+        '%s=%s' % (k.rstrip('_').replace('_', '-'), quoteattr(str(v)))
+        for k, v in kwargs.items() if v is not None
+    )
+
+
+def _stroke(c):
+    paint, opacity = _paint(c)
+    return _attrs(stroke=paint, stroke_opacity=opacity and _n(opacity), stroke_width=1)
+
+
+def _fill(c):
+    paint, opacity = _paint(c)
+    return _attrs(fill=paint, fill_opacity=opacity and _n(opacity))
+
+
+class SvgDocument:
+
+    def __init__(self, width, height):
+        self.width = width
+        self.height = height
+        self.viewbox = (0, 0, width, height)
+        self.defs = []
+        self.elements = []
+
+    def to_string(self):
+        vx, vy, vw, vh = self.viewbox
+        return (
+            '<svg xmlns="http://www.w3.org/2000/svg" %s>' % _attrs(
+                width=_n(vw), height=_n(vh), viewBox=' '.join(map(_n, (vx, vy, vw, vh)))
+            )
+            + '<rect %s/>' % _attrs(x=_n(vx), y=_n(vy), width='100%', height='100%', fill='#fff')
+            + ('<defs>%s</defs>' % ''.join(self.defs) if self.defs else '')
+            + ''.join(self.elements)
+            + '</svg>'
+        )
+
+
+class SvgBackend:
+    """Converts the display list into SVG elements."""
+
+    def __init__(self, fill, color, color_cutted):
+        self.fill = fill
+        self.color = color
+        self.color_cutted = color_cutted
+
+    def render(self, doc, items, scale_factor):
+        """
+        :type doc: SvgDocument
+        :param scale_factor: px in 1 mm (for layouts)
+        """
+        for item in items:
+            kind = item[0]
+            if kind == LINE:
+                _, (x0, y0, x1, y1), fill, width = item
+                doc.elements.append('<line %s %s/>' % (
+                    _attrs(x1=_n(x0), y1=_n(y0), x2=_n(x1), y2=_n(y1)), _stroke(fill)
+                ))
+            elif kind == POLYGON:
+                _, points, fill, outline = item
+                doc.elements.append('<polygon %s %s %s/>' % (
+                    _attrs(points=' '.join('%s,%s' % (_n(x), _n(y)) for x, y in points)),
+                    _fill(fill),
+                    _stroke(outline) if outline else '',
+                ))
+            elif kind == TEXT:
+                _, (x, y), text, fill, font = item
+                doc.elements.append('<text %s %s>%s</text>' % (
+                    _attrs(x=_n(x), y=_n(y), font_family='Arial', font_size=font.size, dominant_baseline='hanging'),
+                    _fill(fill),
+                    escape(text),
+                ))
+            elif kind == TILES:
+                t = item[1]
+                self._tiles(doc, t.x0, t.y0, t.x1 + 1, t.y1 + 1, t.cut)
+            elif kind == LAYOUT:
+                _, origin, plan = item
+                self._layout(doc, origin, plan, scale_factor)
+            else:
+                raise Exception(f"unknown primitive: {kind}")
+
+    def _tiles(self, doc, x0, y0, x1, y1, cut):
+        """Tiles one by one: one path of fills and one path of borders per color."""
+        if not len(x0):
+            return
+
+        doc.elements.append('<path %s %s/>' % (_attrs(d=''.join(
+            'M%s %sh%sv%sh-%sz' % (_n(a), _n(b), _n(c - a), _n(d - b), _n(c - a))
+            for a, b, c, d in zip(x0.tolist(), y0.tolist(), x1.tolist(), y1.tolist())
+        )), _fill(self.fill)))
+
+        for c, is_cut in ((self.color, False), (self.color_cutted, True)):
+            segments = []
+            for flag, fmt, a, b, e in (
+                    (CUT_TOP, 'M%s %sH%s', x0, y0, x1),
+                    (CUT_BOTTOM, 'M%s %sH%s', x0, y1, x1),
+                    (CUT_LEFT, 'M%s %sV%s', x0, y0, y1),
+                    (CUT_RIGHT, 'M%s %sV%s', x1, y0, y1),
+            ):
+                sel = ((cut & flag) != 0) == is_cut
+                segments.extend(
+                    fmt % (_n(p), _n(q), _n(r))
+                    for p, q, r in zip(a[sel].tolist(), b[sel].tolist(), e[sel].tolist())
+                )
+            if segments:
+                doc.elements.append('<path %s %s/>' % (_attrs(d=''.join(segments), fill='none'), _stroke(c)))
+
+    def _layout(self, doc, origin, plan, sf):
+        if isinstance(plan, DiagonalPlan):
+            self._lattice(doc, origin, plan, sf)
+            return
+
+        sx, sy = origin
+        idx = None
+
+        cols = plan.columns
+        rows = plan.rows
+        ci = cols.full_range() if cols is not None else None
+        ri = rows.full_range() if rows is not None else None
+
+        if ci is not None and ri is not None:
+            # целые плитки - одним шаблоном
+            (c0, c1), (r0, r1) = ci, ri
+            tw = cols.size[c0] * sf
+            th = rows.size[r0] * sf
+            step_x = (cols.start[c0 + 1] - cols.start[c0]) * sf if c1 > c0 else tw
+            step_y = (rows.start[r0 + 1] - rows.start[r0]) * sf if r1 > r0 else th
+            x = sx + cols.start[c0] * sf
+            y = sy + rows.start[r0] * sf
+
+            pattern_id = 'tiles%d' % len(doc.defs)
+            doc.defs.append('<pattern %s><rect %s %s %s/></pattern>' % (
+                _attrs(id=pattern_id, patternUnits='userSpaceOnUse',
+                       x=_n(x), y=_n(y), width=_n(step_x), height=_n(step_y)),
+                _attrs(x=0, y=0, width=_n(tw), height=_n(th)),
+                _fill(self.fill),
+                _stroke(self.color),
+            ))
+            doc.elements.append('<rect %s/>' % _attrs(
+                x=_n(x), y=_n(y),
+                width=_n((cols.start[c1] + cols.size[c1]) * sf + sx - x),
+                height=_n((rows.start[r1] + rows.size[r1]) * sf + sy - y),
+                fill='url(#%s)' % pattern_id,
+            ))
+
+            # плитки блока уже нарисованы шаблоном (скрытые закрывает дверь)
+            idx = plan.outside_block(c0, c1, r0, r1)
+
+        x, y, w, h, cut = plan.tiles(plan.visible_indexes(idx))
+        self._tiles(doc, sx + x * sf, sy + y * sf, sx + (x + w) * sf, sy + (y + h) * sf, cut)
+
+    def _lattice(self, doc, origin, plan, sf):
+        """Rotated tiles: one rotated <pattern> in the clip rectangle, the cut sides over it."""
+        sx, sy = origin
+        ox, oy = plan.to_surface(-plan.tw / 2, -plan.th / 2)
+        ox, oy = sx + ox * sf, sy + oy * sf
+        x0, y0, x1, y1 = plan.rect
+
+        pattern_id = 'tiles%d' % len(doc.defs)
+        doc.defs.append('<pattern %s><rect %s %s %s/></pattern>' % (
+            _attrs(id=pattern_id, patternUnits='userSpaceOnUse', x=_n(ox), y=_n(oy),
+                   width=_n((plan.tw + plan.d) * sf), height=_n((plan.th + plan.d) * sf),
+                   patternTransform='rotate(%s %s %s)' % (_n(plan.angle), _n(ox), _n(oy))),
+            _attrs(x=0, y=0, width=_n(plan.tw * sf), height=_n(plan.th * sf)),
+            _fill(self.fill),
+            _stroke(self.color),
+        ))
+        doc.elements.append('<rect %s/>' % _attrs(
+            x=_n(sx + x0 * sf), y=_n(sy + y0 * sf),
+            width=_n((x1 - x0) * sf), height=_n((y1 - y0) * sf),
+            fill='url(#%s)' % pattern_id,
+        ))
+
+        # стороны частей плиток, лежащие на краю прямоугольника - резы
+        points, n = plan.cut_points, plan.cut_n
+        k = np.arange(MAX_VERTICES)
+        nxt = np.take_along_axis(points, np.where(k + 1 < n[:, None], k + 1, 0)[..., None], axis=1)
+        on_edge = np.zeros(n.shape + (MAX_VERTICES,), dtype=bool)
+        for axis, bound in ((0, x0), (0, x1), (1, y0), (1, y1)):
+            on_edge |= (np.abs(points[..., axis] - bound) < 1e-6) & (np.abs(nxt[..., axis] - bound) < 1e-6)
+        on_edge &= k < n[:, None]
+
+        a, b = points[on_edge], nxt[on_edge]
+        if len(a):
+            doc.elements.append('<path %s %s/>' % (_attrs(d=''.join(
+                'M%s %sL%s %s' % (_n(sx + p * sf), _n(sy + q * sf), _n(sx + r * sf), _n(sy + t * sf))
+                for p, q, r, t in zip(a[:, 0].tolist(), a[:, 1].tolist(), b[:, 0].tolist(), b[:, 1].tolist())
+            ), fill='none'), _stroke(self.color_cutted)))
+
+
+class SvgCanvas(Canvas):
+    """Canvas producing an SVG document instead of a raster image."""
+
+    def __init__(self, w, h, scale_factor=None, max_size=None):
+        super(SvgCanvas, self).__init__(w, h, scale_factor=scale_factor, max_size=max_size, backend=BACKEND_PIL)
+        self._backend = SvgBackend(color_tile, color, color_cutted)
+        self._doc = SvgDocument(w, h)
+
+    @property
+    def im(self):
+        raise Exception("SVG canvas has no raster image")
+
+    def draw_layout(self, start_pos, plan, delimiter=0):
+        self.layouts.append(plan)
+        _, _, _, _, n = plan.groups()
+        count('tiles', int(n.sum()))
+        self._display_list.layout((start_pos.x, start_pos.y), plan)
+
+    def flush(self):
+        if not len(self._display_list):
+            return
+        with stage('raster'):
+            items = self._display_list.optimize()
+            self._display_list.clear()
+            self._backend.render(self._doc, items, self._scale_factor)
+
+    def set_viewbox(self, x, y, w, h):
+        """Visible part of the canvas (same as crop and paste of the raster image)."""
+        self._doc.viewbox = (x, y, w, h)
+
+    def watermark(self, text):
+        self.flush()
+        vx, vy, vw, vh = self._doc.viewbox
+        paint, opacity = _paint(WATERMARK_COLOR)
+        self._doc.elements.append('<text %s>%s</text>' % (
+            _attrs(
+                x=_n(vx + vw / 2), y=_n(vy + vh / 2),
+                font_family='Arial', font_size=fit_font(text, (int(vw), int(vh))).size,
+                text_anchor='middle', dominant_baseline='central',
+                fill=paint, fill_opacity=opacity and _n(opacity),
+            ),
+            escape(text),
+        ))
+
+    def to_svg(self):
+        """
+        :return: SVG document
+        :rtype: str
+        """
+        self.flush()
+        return self._doc.to_string()
@@ -1,23 +1,193 @@
+import hashlib
+import io
 import os
+import time
 import uuid
 
 import cloudinary
 import cloudinary.uploader
 import cloudinary.api
+import numpy as np
+from PIL import Image
 
 
-def save_image(image, path):
-    filename = str(uuid.uuid4()) + ".png"
-    fullname = os.path.join(path, filename)
-    image.save(fullname, "PNG")
+FORMAT_PNG = 'png'  # палитра (8 бит)
+FORMAT_PNG32 = 'png32'  # RGBA
+FORMAT_WEBP = 'webp'  # WebP без потерь
+FORMAT_SVG = 'svg'  # векторный документ
+FORMATS = (FORMAT_PNG, FORMAT_PNG32, FORMAT_WEBP, FORMAT_SVG)
 
-    return fullname
+CONTENT_TYPES = {
+    FORMAT_PNG: 'image/png',
+    FORMAT_PNG32: 'image/png',
+    FORMAT_WEBP: 'image/webp',
+    FORMAT_SVG: 'image/svg+xml',
+}
+EXTENSIONS = {
+    FORMAT_PNG: 'png',
+    FORMAT_PNG32: 'png',
+    FORMAT_WEBP: 'webp',
+    FORMAT_SVG: 'svg',
+}
 
 
-def upload_image(filename):
+class EncodedImage:
+    def __init__(self, data, fmt, encode_time, inexact_pixels=0):
+        """
+        :param data: encoded image
+        :type data: bytes
+        :param fmt: FORMAT_*
+        :param encode_time: seconds
+        :param inexact_pixels: pixels whose color is replaced by the nearest palette color
+        """
+        self.data = data
+        self.format = fmt
+        self.encode_time = encode_time
+        self.inexact_pixels = inexact_pixels
+
+    @property
+    def size(self):
+        return len(self.data)
+
+    @property
+    def content_type(self):
+        return CONTENT_TYPES[self.format]
+
+    @property
+    def ext(self):
+        return EXTENSIONS[self.format]
+
+
+def to_palette(image):
+    """Convert RGBA image to "P" mode with the palette of its own colors.
+
+    The drawings have a few colors, so the result is exact. If there are
+    more than 256 colors (antialiased watermark edges), the rarest ones
+    are replaced by the nearest palette color.
+    :type image: PIL.Image.Image
+    :return: image and number of pixels with replaced color
+    """
+    if image.mode != 'RGBA':
+        image = image.convert('RGBA')
+    a = np.asarray(image)
+    h, w = a.shape[:2]
+    packed = a.view(np.uint32).ravel()
+
+    colors = image.getcolors(maxcolors=w * h)
+    colors.sort(key=lambda c: c[0], reverse=True)
+    palette = np.array([c for _, c in colors[:256]], dtype=np.uint8)
+
+    keys = palette.view(np.uint32).ravel()
+    order = np.argsort(keys)
+    keys = keys[order]
+
+    pos = np.minimum(np.searchsorted(keys, packed), len(keys) - 1)
+    exact = keys[pos] == packed
+    indices = order[pos]
+
+    inexact_pixels = int(np.count_nonzero(~exact))
+    if inexact_pixels:
+        rare, inverse = np.unique(packed[~exact], return_inverse=True)
+        rare = rare.view(np.uint8).reshape(-1, 4).astype(np.int32)
+        dist = ((rare[:, None, :] - palette[None, :, :].astype(np.int32)) ** 2).sum(axis=2)
+        indices[~exact] = dist.argmin(axis=1)[inverse]
+
+    im = Image.fromarray(indices.astype(np.uint8).reshape(h, w), 'P')
+    im.putpalette(palette[:, :3].ravel().tolist())
+    if (palette[:, 3] < 255).any():
+        im.info['transparency'] = bytes(palette[:, 3].tolist())
+
+    return im, inexact_pixels
+
+
+def encode_image(image, fmt=FORMAT_PNG, compress_level=None):
+    """Encode the image in memory.
+    :type image: PIL.Image.Image
+    :param fmt: FORMAT_*
+    :param compress_level: zlib compression level of PNG (0-9), not used by WebP
+    :rtype: EncodedImage
+    """
+    assert fmt in FORMATS and fmt != FORMAT_SVG, f'Unknown format: {fmt}'
+
+    started = time.perf_counter()
+    buf = io.BytesIO()
+    inexact_pixels = 0
+
+    kwargs = {}
+    if compress_level is not None:
+        kwargs['compress_level'] = compress_level
+
+    if fmt == FORMAT_PNG:
+        image, inexact_pixels = to_palette(image)
+        if 'transparency' in image.info:
+            kwargs['transparency'] = image.info['transparency']
+        image.save(buf, 'PNG', **kwargs)
+    elif fmt == FORMAT_PNG32:
+        image.save(buf, 'PNG', **kwargs)
+    else:
+        image.save(buf, 'WEBP', lossless=True)
+
+    return EncodedImage(buf.getvalue(), fmt, time.perf_counter() - started, inexact_pixels)
+
+
+def encode_svg(document):
+    """
+    :param document: SVG document
+    :type document: str
+    :rtype: EncodedImage
     """
-    https://res.cloudinary.com/hndb3kzlx/image/upload/v1574079318/fgpbnms77h9xrm9mmalf.png
+    started = time.perf_counter()
+    data = document.encode('utf-8')
+    return EncodedImage(data, FORMAT_SVG, time.perf_counter() - started)
+
+
+def new_image_name(ext='png'):
+    return str(uuid.uuid4()) + '.' + ext
+
+
+def content_name(data, ext='png'):
+    """Content-addressed file name.
+    :type data: bytes
     """
-    uploaded = cloudinary.uploader.upload(filename)
-    # FIXME: process bad request
-    return uploaded['secure_url']
+    return hashlib.sha256(data).hexdigest() + '.' + ext
+
+
+class CloudinaryStorage:
+    """Upload images to Cloudinary"""
+
+    def store(self, data, name):
+        """
+        https://res.cloudinary.com/hndb3kzlx/image/upload/v1574079318/fgpbnms77h9xrm9mmalf.png
+
+        :param data: encoded image
+        :type data: bytes
+        :param name: file name
+        :return: URL of the image
+        """
+        f = io.BytesIO(data)
+        f.name = name
+        uploaded = cloudinary.uploader.upload(f)
+        # FIXME: process bad request
+        return uploaded['secure_url']
+
+
+class MediaStorage:
+    """Save images into the local media directory (debug mode)"""
+
+    def __init__(self, root, url):
+        """
+        :param root: media directory
+        :param url: URL of the media directory
+        """
+        self.root = root
+        self.url = url
+
+    def store(self, data, name):
+        """The file is named by the hash of the content (same image - same file).
+        :param name: file name, only its extension is used
+        """
+        name = content_name(data, os.path.splitext(name)[1].lstrip('.'))
+        with open(os.path.join(self.root, name), 'wb') as f:
+            f.write(data)
+
+        return self.url + name
@@ -1,36 +1,84 @@
+import asyncio
 import json
+import time
 from typing import (
     Any,
 )
 import os
 import logging
+import tempfile
 
 import tornado.httpserver
 import tornado.ioloop
 import tornado.web
 from tornado.options import define, options
 
-from draw.algorithms import draw_floor, draw_floor1, draw_bathroom
-from draw.core import Size
-from draw.utils import save_image, upload_image
+from draw.cache import RenderCache, ParamsStore, request_key
+from draw.executor import BoundedExecutor, SingleFlight, QueueFull, EXECUTOR_THREAD
+from draw.core import Canvas, DIAGONAL_ANGLE
+from draw.estimate import estimate
+from draw.geometry import encode_geometry, CONTENT_TYPE as GEOMETRY_CONTENT_TYPE
+from draw import metrics
+from draw.metrics import Metrics, Timings, collect, log_sampled
+from draw import offcuts
+from draw.pipeline import render_and_store, render_encoded_bytes
+from draw import printing
+from draw.pyramid import Pyramid, render_pyramid_tile
+from draw.utils import CloudinaryStorage, MediaStorage, FORMATS, FORMAT_PNG, FORMAT_SVG, CONTENT_TYPES
 
 DEBUG_MEDIA_ROOT = '/tmp/'
 DEBUG_MEDIA_URL = '/media/'
 
 SCHEMES = ('floor', 'walls')
 
+RESPONSE_URL = 'url'  # картинка загружается в хранилище
+RESPONSE_IMAGE = 'image'  # картинка в ответе
+RESPONSE_PYRAMID = 'pyramid'  # пирамида тайлов для масштабирования
+RESPONSES = (RESPONSE_URL, RESPONSE_IMAGE, RESPONSE_PYRAMID)
+
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+IMAGE_CACHE_PREFIX = 'image-'
+PYRAMID_CACHE_PREFIX = 'pyramid-'
+# каталог запросов пирамид в cache_dir
+PYRAMIDS_DIR = 'pyramids'
+
 FLOOR_LAYING_METHOD_DIRECT = 1
 FLOOR_LAYING_METHOD_DIRECT_CENTER = 2
 FLOOR_LAYING_METHOD_DIAGONAL = 3
+FLOOR_LAYING_METHOD_AUTO = 4
 FLOOR_LAYING_METHODS = (
     FLOOR_LAYING_METHOD_DIRECT,
     FLOOR_LAYING_METHOD_DIRECT_CENTER,
-    FLOOR_LAYING_METHOD_DIAGONAL
+    FLOOR_LAYING_METHOD_DIAGONAL,
+    FLOOR_LAYING_METHOD_AUTO,
 )
 
+# проемов (окна, ниши, короба) на всю схему
+MAX_OPENINGS = 64
+
+# плиток вдоль стороны поверхности, больше - запрос отклоняется
+MAX_TILES_PER_SIDE = 10000
+# расчет до стольких плиток вдоль стороны - прямо в IOLoop (меньше 1 мс), больше - в пуле
+INLINE_TILES_PER_SIDE = 64
+
+# печать отдается из временного файла частями
+PRINT_CHUNK_SIZE = 256 * 1024
+
 define('port', default='5000', help='Listening port', type=str)
 define('cookie_secret', default=os.environ.get('COOKIE_SECRET'), help='Secret cookie', type=str)
 define('debug', default=False, help='Debug mode', type=bool)
+define('workers', default=os.cpu_count() or 1, help='Number of rendering workers', type=int)
+define('executor', default=EXECUTOR_THREAD, help='Rendering workers: thread or process', type=str)
+define('queue_size', default=16, help='Max number of draw requests waiting for a worker', type=int)
+define('cache_size', default=1024, help='Number of render results cached in memory', type=int)
+define('cache_dir', default=None, help='Directory of the disk render cache (disabled if not set)', type=str)
+define('cache_disk_limit', default=256 * 1024 * 1024, help='Max size of the disk render cache (bytes)', type=int)
+define('pyramids_size', default=100000, help='Number of pyramids kept in memory without cache_dir, older ids expire', type=int)
+define('batch_size', default=500, help='Max number of items of a batch draw request', type=int)
+define('log_sample_rate', default=metrics.LOG_SAMPLE_RATE, help='Share of requests written to the log', type=float)
+define('lod_threshold', default=Canvas.LOD_MIN_TILE_PX, help='Tile step (px) below which whole tiles are drawn by groups, 0 - never', type=int)
+define('cut_plan_budget', default=offcuts.TIME_BUDGET, help='Time (s) of the search of the cut plan, the greedy plan is always made', type=float)
+define('retry_after', default=1, help='Retry-After (seconds) of the response when the queue is full', type=int)
 
 
 class BadRequest(tornado.web.HTTPError):
@@ -41,10 +89,39 @@ class BadRequest(tornado.web.HTTPError):
         super().__init__(400, log_message, *args, **kwargs)
 
 
+class ServiceUnavailable(tornado.web.HTTPError):
+
+    def __init__(
+            self, retry_after: int, log_message: str = None, *args: Any, ** kwargs: Any
+    ) -> None:
+        super().__init__(503, log_message, *args, **kwargs)
+        self.retry_after = retry_after
+
+
 class BaseRequestHandler(tornado.web.RequestHandler):
+    # имя в метриках, None - запросы не учитываются
+    metrics_name = None
+
+    def prepare(self):
+        self.timings = Timings()
+
+    def finish(self, chunk=None):
+        if self.metrics_name and not self._finished:
+            self.timings.add('total', self.request.request_time())
+            self.set_header('Server-Timing', self.timings.header())
+        return super().finish(chunk)
+
+    def on_finish(self):
+        if self.metrics_name:
+            self.application.metrics.observe(self.metrics_name, self.get_status(), self.timings)
+            log_sampled(
+                'request', handler=self.metrics_name, status=self.get_status(), **self.timings.as_dict()
+            )
 
     def write_error(self, status_code: int, **kwargs: Any):
         self.set_header('Content-Type', 'application/json')
+        if 'exc_info' in kwargs and isinstance(kwargs['exc_info'][1], ServiceUnavailable):
+            self.set_header('Retry-After', str(kwargs['exc_info'][1].retry_after))
         self.finish(json.dumps({
             'error': {
                 'code': status_code,
@@ -53,10 +130,204 @@ class BaseRequestHandler(tornado.web.RequestHandler):
         }))
 
 
+def parse_draw_args(args):
+    """Validate the draw request and normalize it.
+    :param args: decoded JSON body
+    :type args: dict
+    :return: normalized request (only known arguments)
+    :rtype: dict
+    """
+    if 'scheme' not in args:
+        raise BadRequest('Required argument: scheme')
+    scheme = args['scheme']
+    if scheme not in SCHEMES:
+        raise BadRequest(f'Invalid scheme ({scheme}), expected: {",".join(SCHEMES)}')
+
+    # validate common arguments
+    if 'tile' not in args:
+        raise BadRequest('Required argument: tile')
+    tile = args['tile']
+
+    params = {
+        'scheme': scheme,
+        'tile': {
+            'width': tile['width'],
+            'length': tile['length'],
+            'delimiter': tile['delimiter'],
+        },
+        'width': args['width'],
+        'length': args['length'],
+    }
+
+    # output format
+    fmt = args.get('format', FORMAT_PNG)
+    if fmt not in FORMATS:
+        raise BadRequest(f'Invalid format ({fmt}), expected: {",".join(FORMATS)}')
+    compress_level = args.get('compress_level')
+    if compress_level is not None and compress_level not in range(10):
+        raise BadRequest(f'Invalid compress_level ({compress_level}), expected: 0-9')
+    params['output'] = {
+        'format': fmt,
+        'compress_level': compress_level,
+    }
+
+    # validate scheme-specified arguments
+    if scheme == 'floor':
+        floor_method = args['options'].get('method', FLOOR_LAYING_METHOD_AUTO)
+        if floor_method not in FLOOR_LAYING_METHODS:
+            raise BadRequest((
+                f'Invalid floor laying method ({floor_method}),'
+                f' expected: {",".join(map(str, FLOOR_LAYING_METHODS))}'
+            ))
+        params['options'] = {'method': floor_method}
+        if floor_method == FLOOR_LAYING_METHOD_DIAGONAL:
+            angle = args['options'].get('angle', DIAGONAL_ANGLE)
+            if not isinstance(angle, (int, float)) or not -360 <= angle <= 360:
+                raise BadRequest(f'Invalid angle ({angle}), expected: -360..360')
+            params['options']['angle'] = angle
+        if 'openings' in args['options']:
+            params['options']['openings'] = parse_openings(
+                args['options']['openings'], [(params['length'], params['width'])], walls=False
+            )
+    elif scheme == 'walls':
+        door = None
+        if 'door' in args['options']:
+            door = {
+                'width': args['options']['door']['width'],
+                'height': args['options']['door']['height'],
+            }
+        params['options'] = {
+            'height': args['options']['height'],
+            'door': door,
+        }
+        auto_start = args['options'].get('auto_start', False)
+        if not isinstance(auto_start, bool):
+            raise BadRequest(f'Invalid auto_start ({auto_start}), expected: true or false')
+        if auto_start:
+            params['options']['auto_start'] = True
+        if 'openings' in args['options']:
+            l, w, h = params['length'], params['width'], params['options']['height']
+            params['options']['openings'] = parse_openings(
+                args['options']['openings'], [(l, h), (w, h), (l, h), (w, h)], walls=True
+            )
+
+    # план раскроя - только по запросу (поиск занимает до cut_plan_budget)
+    cut_plan = args['options'].get('cut_plan', False)
+    if not isinstance(cut_plan, bool):
+        raise BadRequest(f'Invalid cut_plan ({cut_plan}), expected: true or false')
+    if cut_plan:
+        params['options']['cut_plan'] = True
+
+    return params
+
+
+def parse_openings(openings, sizes, walls):
+    """Validate the openings of the scheme.
+    :param openings: list of {"wall": i, "x", "y", "width", "height"} ("wall" - walls only)
+    :param sizes: (width, height) of every surface (mm)
+    :param walls: the surfaces are walls
+    :return: normalized openings
+    :rtype: list
+    """
+    if not isinstance(openings, list):
+        raise BadRequest('Invalid openings, expected: list')
+    if len(openings) > MAX_OPENINGS:
+        raise BadRequest(f'Too many openings ({len(openings)}), max: {MAX_OPENINGS}')
+
+    result = []
+    for o in openings:
+        if not isinstance(o, dict):
+            raise BadRequest('Invalid opening, expected: object')
+        i = o.get('wall') if walls else 0
+        if i not in range(len(sizes)):
+            raise BadRequest(f'Invalid opening wall ({i}), expected: 0-{len(sizes) - 1}')
+        values = [o.get(k) for k in ('x', 'y', 'width', 'height')]
+        if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in values):
+            raise BadRequest(f'Invalid opening ({o})')
+        x, y, w, h = values
+        sw, sh = sizes[i]
+        if w <= 0 or h <= 0 or x < 0 or y < 0 or x + w > sw or y + h > sh:
+            raise BadRequest(f'Invalid opening ({o}), expected inside {sw}x{sh}')
+
+        opening = {'x': x, 'y': y, 'width': w, 'height': h}
+        if walls:
+            opening['wall'] = i
+        result.append(opening)
+
+    return result
+
+
+def parse_print_args(args):
+    """Validate the print request and normalize it (same as the draw request, plus the sheet).
+    :type args: dict
+    :rtype: dict
+    """
+    params = parse_draw_args(args)
+    del params['output']
+
+    paper = args.get('paper', printing.DEFAULT_PAPER)
+    if paper not in printing.PAPER_SIZES:
+        raise BadRequest(f'Invalid paper ({paper}), expected: {",".join(printing.PAPER_SIZES)}')
+    dpi = args.get('dpi', printing.DPI)
+    if not isinstance(dpi, int) or isinstance(dpi, bool) or not printing.MIN_DPI <= dpi <= printing.MAX_DPI:
+        raise BadRequest(f'Invalid dpi ({dpi}), expected: {printing.MIN_DPI}-{printing.MAX_DPI}')
+    params['print'] = {'paper': paper, 'dpi': dpi}
+
+    return params
+
+
+def tiles_per_side(params):
+    """Number of tiles along the longest side of the surfaces of the normalized request.
+    The time of the layout grows with it, not with the area.
+    :type params: dict
+    :rtype: float
+    """
+    tile = params['tile']
+    sides = [params['width'], params['length']]
+    if params['scheme'] == 'walls':
+        sides.append(params['options']['height'])
+    for v in (tile['width'], tile['length'], *sides):
+        if not isinstance(v, (int, float)) or isinstance(v, bool) or v <= 0:
+            raise BadRequest(f'Invalid size ({v}), expected a positive number')
+    if not isinstance(tile['delimiter'], (int, float)) or tile['delimiter'] < 0:
+        raise BadRequest(f'Invalid delimiter ({tile["delimiter"]})')
+    return max(sides) / (min(tile['width'], tile['length']) + tile['delimiter'])
+
+
+def check_tiles_per_side(params):
+    """Reject the request with too many tiles along a side (see MAX_TILES_PER_SIDE).
+    :type params: dict
+    :return: number of tiles along the longest side
+    :rtype: float
+    """
+    n = tiles_per_side(params)
+    if n > MAX_TILES_PER_SIDE:
+        raise BadRequest(f'Too many tiles along a side ({int(n)}), max: {MAX_TILES_PER_SIDE}')
+    return n
+
+
+def parse_estimate_args(args):
+    """Validate the estimate request and normalize it (same as the draw request, plus a tile price).
+    :type args: dict
+    :rtype: dict
+    """
+    params = parse_draw_args(args)
+    del params['output']
+
+    price = args['tile'].get('price')
+    if price is not None and (not isinstance(price, (int, float)) or price < 0):
+        raise BadRequest(f'Invalid tile price ({price})')
+    params['tile']['price'] = price
+    check_tiles_per_side(params)
+
+    return params
+
+
 class DrawHandler(BaseRequestHandler):
     """Create a new scheme of fitting the tiles"""
+    metrics_name = 'draw'
 
-    def post(self):
+    async def post(self):
         """
         Floor example:
         {
@@ -68,9 +339,25 @@ class DrawHandler(BaseRequestHandler):
             },
             "width": 4000,
             "length": 5000,
+            /* Optional: png (8 bit palette), png32, webp (lossless), svg */
+            "format": "png",
+            /* Optional: PNG compression 0-9 */
+            "compress_level": 6,
+            /* Optional: url (stored picture, default), image (encoded picture in the response)
+               or pyramid (URL template of the zoomable tiles, drawn on demand; without
+               --cache_dir only the last --pyramids_size pyramids are kept, older URLs give 404) */
+            "response": "url",
             /* The scheme-specific options */
             "options": {
-                "method": 1
+                /* Optional: 1 - direct, 2 - from the center, 3 - diagonal,
+                   4 - the start is searched for: no slivers at the edges (default) */
+                "method": 1,
+                /* Optional, method 3 only: rotation of the tiles (degrees, 45 by default) */
+                "angle": 45,
+                /* Optional: columns, boxes, etc (mm, x - along the length) */
+                "openings": [{"x": 0, "y": 0, "width": 300, "height": 300}],
+                /* Optional: add the cut plan to the response (offcuts of all surfaces supply the cuts) */
+                "cut_plan": true
             }
         }
 
@@ -90,81 +377,398 @@ class DrawHandler(BaseRequestHandler):
                 "door": {
                     "width": 800,
                     "height": 2000
-                }
+                },
+                /* Optional: the offcut the first wall starts with is searched for (no slivers) */
+                "auto_start": true,
+                /* Optional: windows, niches, pipes (mm, wall 0-3, y - height above the floor) */
+                "openings": [{"wall": 1, "x": 1500, "y": 1200, "width": 600, "height": 600}]
             }
         }
 
+        """
+        with self.timings.stage('validation'):
+            args = json.loads(self.request.body)
+            params = parse_draw_args(args)
+
+            response = args.get('response', RESPONSE_URL)
+            if response not in RESPONSES:
+                raise BadRequest(f'Invalid response ({response}), expected: {",".join(RESPONSES)}')
+
+        if response == RESPONSE_IMAGE:
+            await self.write_image(params)
+            return
+        if response == RESPONSE_PYRAMID:
+            self.write_pyramid(params)
+            return
+
+        stored = await self.application.draw(params, self.timings)
+
+        result = {
+            'ok': True,
+            **stored
+        }
+
+        self.write(json.dumps(result))
+
+    async def get(self):
+        """The picture itself: /api/draw?q=<JSON document of POST>
+
+        The response is the same for the same request, so it is
+        cached by clients (ETag, If-None-Match).
+        """
+        with self.timings.stage('validation'):
+            try:
+                args = json.loads(self.get_query_argument('q'))
+            except ValueError:
+                raise BadRequest('Invalid argument: q')
+            if not isinstance(args, dict):
+                raise BadRequest('Invalid argument: q')
+            params = parse_draw_args(args)
+
+        await self.write_image(params)
+
+    def write_pyramid(self, params):
+        """Save the scheme for the pyramid tiles, nothing is drawn here."""
+        # формат вывода у тайлов свой
+        params = {k: v for k, v in params.items() if k != 'output'}
+        pyramid_id = request_key(params)
+        self.application.pyramids.put(pyramid_id, params)
+
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps({
+            'ok': True,
+            'id': pyramid_id,
+            'tiles': f'/api/draw/{pyramid_id}/tiles/{{z}}/{{x}}/{{y}}.png',
+            **Pyramid.from_params(params).info()
+        }))
+
+    async def write_image(self, params):
+        """Encoded picture with a strong ETag of the normalized request."""
+        etag = '"%s"' % request_key(params)
+        self.set_header('Etag', etag)
+        self.set_header('Cache-Control', IMMUTABLE_CACHE_CONTROL)
+
+        # не рендерим то, что уже есть у клиента
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        self.set_header('Content-Type', CONTENT_TYPES[params['output']['format']])
+        self.write(await self.application.draw_image(params, self.timings))
+
+
+class DrawBatchHandler(BaseRequestHandler):
+    """Create many schemes in one call"""
+    metrics_name = 'draw_batch'
+
+    async def post(self):
+        """
+        {
+            /* documents of /api/draw */
+            "items": [
+                {"scheme": "floor", ...},
+                {"scheme": "walls", ...}
+            ]
+        }
+
+        Response (in the same order, a failed item does not fail the batch):
+        {
+            "ok": true,
+            "items": [
+                {"ok": true, "url": "...", ...},
+                {"ok": false, "error": {"code": 400, "message": "..."}}
+            ]
+        }
         """
         args = json.loads(self.request.body)
-        print(args)
-
-        if 'scheme' not in args:
-            raise BadRequest('Required argument: scheme')
-        scheme = args['scheme']
-        if scheme not in SCHEMES:
-            raise BadRequest(f'Invalid scheme ({scheme}), expected: {",".join(SCHEMES)}')
-
-        # validate common arguments
-        if 'tile' not in args:
-            raise BadRequest('Required argument: tile')
-        tile = args['tile']
-        tile_width = tile['width']
-        tile_length = tile['length']
-        delimiter = tile['delimiter']
-
-        width_mm = args['width']
-        length_mm = args['length']
-
-        # validate scheme-specified arguments
-        if scheme == 'floor':
-            floor_method = args['options']['method']
-            if floor_method not in FLOOR_LAYING_METHODS:
-                raise BadRequest((
-                    f'Invalid floor laying method ({floor_method}),'
-                    f' expected: {",".join(FLOOR_LAYING_METHODS)}'
-                ))
-        elif scheme == 'walls':
-            height_mm = args['options']['height']
-            if 'door' in args['options']:
-                door_size = Size(
-                    args['options']['door']['width'],
-                    args['options']['door']['height']
-                )
-            else:
-                door_size = None
-
-        # render picture
-        if scheme == 'floor':
-            if floor_method in (FLOOR_LAYING_METHOD_DIRECT, FLOOR_LAYING_METHOD_DIRECT_CENTER):
-                canvas = draw_floor1(width_mm, length_mm, delimiter, tile_width, tile_length, floor_method)
-                im = canvas.im
-            else:
-                im = draw_floor(width_mm, length_mm, tile_width, tile_length, floor_method)
-        else:
-            canvas = draw_bathroom(length_mm, width_mm, height_mm, delimiter, tile_width, tile_length, door_size)
-            im = canvas.im
+        items = args.get('items') if isinstance(args, dict) else None
+        if not isinstance(items, list):
+            raise BadRequest('Required argument: items (list)')
+        if len(items) > options.batch_size:
+            raise BadRequest(f'Too many items ({len(items)}), max: {options.batch_size}')
 
-        filename = save_image(im, DEBUG_MEDIA_ROOT if options.debug else '/tmp')
+        # не больше задач, чем воркеров: пакет не переполняет очередь
+        semaphore = asyncio.Semaphore(self.application.executor.workers)
+        results = await asyncio.gather(*(self._draw_item(semaphore, item) for item in items))
 
-        if options.debug:
-            img_url = os.path.join(DEBUG_MEDIA_URL, os.path.basename(filename))
-        else:
-            img_url = upload_image(filename)
-            os.remove(filename)
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps({
+            'ok': True,
+            'items': results,
+        }))
+
+    async def _draw_item(self, semaphore, args):
+        try:
+            if not isinstance(args, dict):
+                raise BadRequest('Item is not an object')
+            try:
+                params = parse_draw_args(args)
+            except (KeyError, TypeError) as e:
+                raise BadRequest(f'Invalid item: {e}')
+
+            async with semaphore:
+                stored = await self.application.draw(params, self.timings)
+        except tornado.web.HTTPError as e:
+            return {'ok': False, 'error': {'code': e.status_code, 'message': e.log_message}}
+        except Exception:
+            logging.exception('Batch item failed')
+            return {'ok': False, 'error': {'code': 500, 'message': 'Internal Server Error'}}
+
+        return {
+            'ok': True,
+            **stored
+        }
+
+
+class EstimateHandler(BaseRequestHandler):
+    """Tile counts, cuts and cost of a scheme without drawing it"""
+    metrics_name = 'estimate'
+
+    async def post(self):
+        """
+        The same body as /api/draw, the tile may have a price:
+        {
+            "scheme": "walls",
+            "tile": {
+                "width": 500,
+                "length": 500,
+                "delimiter": 2,
+                /* Optional: price of one tile */
+                "price": 1.5
+            },
+            ...
+        }
+
+        The cut plan is made only when "options": {"cut_plan": true} is given.
+        A surface with more than MAX_TILES_PER_SIDE tiles along a side is rejected (400).
 
+        Response:
+        {
+            "ok": true,
+            "tiles": 120,  /* tiles of the layout */
+            "whole": 96,
+            "cut": 24,
+            "reused": 3,  /* cut tiles made of offcuts of the previous wall */
+            "cuts": [{"width": 250.0, "height": 500.0, "count": 12}, ...],
+            /* options.cut_plan only: offcuts of all surfaces supply the cuts (the same in the /api/draw response) */
+            "cut_plan": {
+                "tiles": 115,  /* tiles to buy */
+                "whole": 96,
+                "cut_tiles": 19,  /* tiles cut into pieces */
+                "pieces": 27,
+                "greedy": 116,  /* tiles of the greedy plan */
+                "lower_bound": 114,  /* no plan has fewer tiles */
+                "optimal": false,
+                "strategy": "area/max_area",
+                "time": 0.05,
+                "patterns": [{"count": 12, "pieces": [{"width": 250.0, "height": 500.0}, ...], "waste": 0.0}, ...]
+            },
+            "cost": 172.5,  /* price of the tiles of the cut plan (of the layout without it) */
+            /* walls only: every wall and the offcut it passes to the next one */
+            "walls": [{"width": 4000, "height": 2500, "offcut": 123.0, ...}, ...]
+        }
+        """
+        with self.timings.stage('validation'):
+            args = json.loads(self.request.body)
+            params = parse_estimate_args(args)
+
+        if params['options'].get('cut_plan') or tiles_per_side(params) > INLINE_TILES_PER_SIDE:
+            # поиск плана раскроя занимает до cut_plan_budget, а большая раскладка -
+            # десятки мс: в пуле, IOLoop свободен
+            try:
+                with self.timings.stage('estimate'):
+                    result, timings = await self.application.executor.run(collect, time.time(), estimate, params)
+            except QueueFull:
+                raise ServiceUnavailable(options.retry_after, 'Too many draw requests')
+            self.timings.merge(timings)
+        else:
+            # без плана раскроя небольшая раскладка считается быстро - прямо в IOLoop
+            with self.timings.stage('estimate'):
+                result = estimate(params)
         result = {
             'ok': True,
-            'url': img_url
+            **result
         }
 
+        self.set_header('Content-Type', 'application/json')
         self.write(json.dumps(result))
 
 
+class PrintHandler(BaseRequestHandler):
+    """The scheme on a paper sheet at print resolution"""
+    metrics_name = 'print'
+
+    async def post(self):
+        """
+        The same body as /api/draw (output options are ignored), plus:
+        {
+            /* Optional: A4, A3, A2 (default), A1, A0 */
+            "paper": "A1",
+            /* Optional: 72-600, 300 by default */
+            "dpi": 300,
+            ...
+        }
+
+        Response: PNG of the whole sheet (RGB, the resolution is in the file).
+        It is drawn by strips into a temporary file and sent by parts, so
+        neither the worker nor the server keeps the whole picture in memory.
+        """
+        with self.timings.stage('validation'):
+            args = json.loads(self.request.body)
+            params = parse_print_args(args)
+
+        fd, path = tempfile.mkstemp(suffix='.png')
+        os.close(fd)
+        try:
+            try:
+                page, timings = await self.application.executor.run(
+                    collect, time.time(), printing.render_print, params, path
+                )
+            except QueueFull:
+                raise ServiceUnavailable(options.retry_after, 'Too many draw requests')
+            self.timings.merge(timings)
+
+            self.set_header('Content-Type', CONTENT_TYPES[FORMAT_PNG])
+            self.set_header('Content-Length', str(page['bytes']))
+            self.set_header(
+                'Content-Disposition',
+                'attachment; filename="scheme-%s-%ddpi.png"' % (page['paper'], page['dpi'])
+            )
+            # заголовки уходят с первой частью
+            self.set_header('Server-Timing', self.timings.header())
+            with self.timings.stage('send'), open(path, 'rb') as f:
+                while True:
+                    chunk = f.read(PRINT_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    self.write(chunk)
+                    await self.flush()
+        finally:
+            os.remove(path)
+
+
+class LayoutHandler(BaseRequestHandler):
+    """Geometry of a scheme for drawing on the client (see `draw.geometry`)"""
+    metrics_name = 'layout'
+
+    async def post(self):
+        """
+        The same body as /api/draw (output options are ignored).
+        A surface with more than MAX_TILES_PER_SIDE tiles along a side is rejected (400).
+
+        Response: binary payload of `draw.geometry`, nothing is drawn or stored.
+        """
+        with self.timings.stage('validation'):
+            args = json.loads(self.request.body)
+            params = parse_draw_args(args)
+            del params['output']
+            tiles = check_tiles_per_side(params)
+
+        self.set_header('Etag', '"%s"' % request_key(params))
+        self.set_header('Cache-Control', IMMUTABLE_CACHE_CONTROL)
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        if tiles > INLINE_TILES_PER_SIDE:
+            # большая раскладка считается десятки мс - в пуле, IOLoop свободен
+            try:
+                with self.timings.stage('geometry'):
+                    data, timings = await self.application.executor.run(
+                        collect, time.time(), encode_geometry, params
+                    )
+            except QueueFull:
+                raise ServiceUnavailable(options.retry_after, 'Too many draw requests')
+            self.timings.merge(timings)
+        else:
+            # небольшая раскладка без растра - быстрая, прямо в IOLoop
+            with self.timings.stage('geometry'):
+                data = encode_geometry(params)
+        self.timings.count('encoded_bytes', len(data))
+
+        self.set_header('Content-Type', GEOMETRY_CONTENT_TYPE)
+        self.write(data)
+
+
+class PyramidTileHandler(BaseRequestHandler):
+    """Tile of the zoomable pyramid, drawn on first access"""
+    metrics_name = 'pyramid_tile'
+
+    async def get(self, pyramid_id, z, x, y):
+        z, x, y = int(z), int(x), int(y)
+
+        self.set_header('Etag', '"%s-%d-%d-%d"' % (pyramid_id, z, x, y))
+        self.set_header('Cache-Control', IMMUTABLE_CACHE_CONTROL)
+        if self.check_etag_header():
+            self.set_status(304)
+            return
+
+        params = self.application.pyramids.get(pyramid_id)
+        if params is None:
+            raise tornado.web.HTTPError(404, 'Unknown pyramid')
+
+        data = await self.application.draw_pyramid_tile(pyramid_id, params, z, x, y, self.timings)
+
+        self.set_header('Content-Type', CONTENT_TYPES[FORMAT_PNG])
+        self.write(data)
+
+
+class MediaHandler(tornado.web.StaticFileHandler):
+    """Pictures stored by MediaStorage (debug mode). Names are content hashes, so they never change."""
+
+    def set_extra_headers(self, path):
+        self.set_header('Cache-Control', IMMUTABLE_CACHE_CONTROL)
+
+
+class MetricsHandler(BaseRequestHandler):
+    """Aggregated metrics in Prometheus text format"""
+
+    def get(self):
+        executor = self.application.executor.stats()
+        cache = self.application.cache.stats()
+        single_flight = self.application.single_flight.stats()
+
+        self.set_header('Content-Type', 'text/plain; version=0.0.4')
+        self.write(self.application.metrics.render({
+            'draw_executor_in_flight': executor['in_flight'],
+            'draw_executor_queue_depth': executor['queue_depth'],
+            'draw_executor_rejected': executor['rejected'],
+            'draw_cache_hits_memory': cache['hits_memory'],
+            'draw_cache_hits_disk': cache['hits_disk'],
+            'draw_cache_misses': cache['misses'],
+            'draw_cache_disk_usage_bytes': cache['disk_usage'],
+            'draw_single_flight_coalesced': single_flight['coalesced'],
+        }))
+
+
+class StatusHandler(BaseRequestHandler):
+    """State of the rendering pool and the render cache"""
+
+    def get(self):
+        self.set_header('Content-Type', 'application/json')
+        self.write(json.dumps({
+            'executor': self.application.executor.stats(),
+            'cache': self.application.cache.stats(),
+            'single_flight': self.application.single_flight.stats(),
+        }))
+
+
 class Application(tornado.web.Application):
     def __init__(self):
         handlers = [
             (r'/api/draw', DrawHandler),
+            (r'/api/draw/batch', DrawBatchHandler),
+            (r'/api/draw/([0-9a-f]{64})/tiles/(\d+)/(\d+)/(\d+)\.png', PyramidTileHandler),
+            (r'/api/estimate', EstimateHandler),
+            (r'/api/layout', LayoutHandler),
+            (r'/api/print', PrintHandler),
+            (r'/api/status', StatusHandler),
+            (r'/metrics', MetricsHandler),
         ]
+        if options.debug:
+            handlers.append((
+                DEBUG_MEDIA_URL + r'([0-9a-f]{64}\.\w+)', MediaHandler, {'path': DEBUG_MEDIA_ROOT}
+            ))
         settings = dict(
             cookie_secret=options.cookie_secret,
             static_path=os.path.join(os.path.dirname(__file__), 'static'),
@@ -172,9 +776,89 @@ class Application(tornado.web.Application):
         )
         super().__init__(handlers, **settings)
 
+        self.executor = BoundedExecutor(options.workers, options.queue_size, options.executor)
+        if options.debug:
+            self.storage = MediaStorage(DEBUG_MEDIA_ROOT, DEBUG_MEDIA_URL)
+        else:
+            self.storage = CloudinaryStorage()
+        self.cache = RenderCache(options.cache_size, options.cache_dir, options.cache_disk_limit)
+        # запросы пирамид на диске не вытесняются: выданные URL тайлов работают всегда,
+        # без cache_dir в памяти хранятся последние pyramids_size
+        self.pyramids = ParamsStore(
+            os.path.join(options.cache_dir, PYRAMIDS_DIR) if options.cache_dir else None, options.pyramids_size
+        )
+        self.single_flight = SingleFlight()
+        self.metrics = Metrics()
+
+    async def draw(self, params, timings):
+        """Stored picture of the normalized request: from the cache or rendered.
+        :param timings: stages of the request
+        :type timings: Timings
+        :raise ServiceUnavailable: the queue is full
+        :rtype: dict
+        """
+        return await self._cached(request_key(params), self.render, params, timings)
+
+    async def draw_image(self, params, timings):
+        """Encoded picture of the normalized request: from the cache or rendered (not stored).
+        :type timings: Timings
+        :raise ServiceUnavailable: the queue is full
+        :rtype: bytes
+        """
+        return await self._cached(IMAGE_CACHE_PREFIX + request_key(params), self.render_image, params, timings)
+
+    async def draw_pyramid_tile(self, pyramid_id, params, z, x, y, timings):
+        """Encoded tile of the pyramid: from the cache or rendered.
+        :raise HTTPError: 404, the tile is out of the pyramid
+        :rtype: bytes
+        """
+        key = '%s%s-%d-%d-%d' % (PYRAMID_CACHE_PREFIX, pyramid_id, z, x, y)
+        return await self._cached(key, self.render_pyramid_tile, (pyramid_id, params, z, x, y), timings)
+
+    async def render_pyramid_tile(self, key, args):
+        data, timings = await self.executor.run(collect, time.time(), render_pyramid_tile, *args)
+        if data is None:
+            raise tornado.web.HTTPError(404, 'Tile is out of the pyramid')
+        self.cache.put(key, data)
+
+        return data, timings
+
+    async def _cached(self, key, render, params, timings):
+        # the same scheme is already rendered
+        with timings.stage('cache'):
+            value = self.cache.get(key)
+
+        if value is None:
+            # identical requests in progress share one render
+            try:
+                value, render_timings = await self.single_flight.run(key, render, key, params)
+            except QueueFull:
+                raise ServiceUnavailable(options.retry_after, 'Too many draw requests')
+            timings.merge(render_timings)
+
+        return value
+
+    async def render_image(self, key, params):
+        data, timings = await self.executor.run(collect, time.time(), render_encoded_bytes, params)
+        self.cache.put(key, data)
+
+        return data, timings
+
+    async def render(self, key, params):
+        """Render the picture and store it in the pool (the IOLoop stays free), cache the result.
+        :return: result and timings of the render
+        """
+        stored, timings = await self.executor.run(collect, time.time(), render_and_store, params, self.storage)
+        self.cache.put(key, stored)
+
+        return stored, timings
+
 
 def main():
     tornado.options.parse_command_line()
+    metrics.LOG_SAMPLE_RATE = options.log_sample_rate
+    Canvas.LOD_MIN_TILE_PX = options.lod_threshold
+    offcuts.TIME_BUDGET = options.cut_plan_budget
     logging.getLogger().setLevel(logging.DEBUG)
     http_server = tornado.httpserver.HTTPServer(Application())
     http_server.listen(options.port)
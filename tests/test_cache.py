@@ -0,0 +1,107 @@
+import os
+import threading
+
+from draw.cache import RenderCache, ParamsStore, request_key
+
+
+def test_request_key_canonical_numbers():
+    assert request_key({'a': 300, 'b': [1, 2.0]}) == request_key({'b': [1.0, 2], 'a': 300.0})
+    assert request_key({'a': 300}) != request_key({'a': 301})
+
+
+def test_memory_lru():
+    cache = RenderCache(memory_size=2)
+    cache.put('a', 'url-a')
+    cache.put('b', 'url-b')
+    assert cache.get('a') == 'url-a'
+    # 'b' - давно не использованный
+    cache.put('c', 'url-c')
+
+    assert cache.get('b') is None
+    assert cache.get('a') == 'url-a'
+    assert cache.get('c') == 'url-c'
+    assert cache.stats()['misses'] == 1
+
+
+def test_disk_tier_values(tmp_path):
+    cache = RenderCache(disk_dir=str(tmp_path))
+    cache.put('url', '/static/x.png')
+    cache.put('bin', b'\x89PNG')
+    cache.put('json', {'tiles': 10})
+
+    cache = RenderCache(disk_dir=str(tmp_path))
+    assert cache.get('url') == '/static/x.png'
+    assert cache.get('bin') == b'\x89PNG'
+    assert cache.get('json') == {'tiles': 10}
+    assert cache.stats()['hits_disk'] == 3
+
+
+def test_disk_usage_overwrite(tmp_path):
+    cache = RenderCache(disk_dir=str(tmp_path))
+    for _ in range(5):
+        cache.put('k', b'x' * 100)
+    cache.put('k', b'x' * 40)
+
+    assert cache.stats()['disk_usage'] == 40
+    assert RenderCache(disk_dir=str(tmp_path)).stats()['disk_usage'] == 40
+
+
+def test_disk_concurrent_overwrite(tmp_path):
+    cache = RenderCache(disk_dir=str(tmp_path))
+
+    def put(n):
+        for _ in range(50):
+            cache.put('k', b'x' * n)
+
+    threads = [threading.Thread(target=put, args=(n,)) for n in (10, 20, 30, 40)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    # у каждой записи свой временный файл, размер учтен один раз
+    assert os.listdir(str(tmp_path)) == ['k.bin']
+    assert cache.stats()['disk_usage'] == os.path.getsize(os.path.join(str(tmp_path), 'k.bin'))
+
+
+def test_disk_limit(tmp_path):
+    cache = RenderCache(memory_size=1, disk_dir=str(tmp_path), disk_limit=250)
+    for i in range(5):
+        path = os.path.join(str(tmp_path), f'k{i}.bin')
+        cache.put(f'k{i}', b'x' * 100)
+        # порядок удаления - по времени использования
+        os.utime(path, (i, i))
+
+    assert cache.stats()['disk_usage'] <= 250
+    assert cache.get('k0') is None
+    assert cache.get('k4') == b'x' * 100
+
+
+def test_params_store_memory():
+    store = ParamsStore()
+    assert store.get('p') is None
+    store.put('p', {'scheme': 'floor'})
+    assert store.get('p') == {'scheme': 'floor'}
+
+
+def test_params_store_disk_not_evicted(tmp_path):
+    cache = RenderCache(memory_size=1, disk_dir=str(tmp_path), disk_limit=10)
+    store = ParamsStore(os.path.join(str(tmp_path), 'pyramids'))
+    store.put('p', {'scheme': 'floor', 'width': 4000})
+    for i in range(3):
+        cache.put(f'k{i}', b'x' * 100)
+
+    assert ParamsStore(os.path.join(str(tmp_path), 'pyramids')).get('p') == {'scheme': 'floor', 'width': 4000}
+
+
+def test_params_store_memory_bounded():
+    store = ParamsStore(memory_size=2)
+    store.put('a', {'scheme': 'floor'})
+    store.put('b', {'scheme': 'walls'})
+    assert store.get('a') == {'scheme': 'floor'}
+    # без диска старые id истекают
+    store.put('c', {'scheme': 'floor', 'width': 1})
+
+    assert store.get('b') is None
+    assert store.get('a') == {'scheme': 'floor'}
+    assert store.get('c') == {'scheme': 'floor', 'width': 1}
@@ -0,0 +1,87 @@
+import numpy as np
+
+from draw.display import DisplayList, Tiles, LINE, POLYGON, TILES
+
+
+def tiles(*rects):
+    x0, y0, x1, y1 = (np.array(a) for a in zip(*rects))
+    return Tiles(x0, y0, x1, y1, np.zeros(len(rects), dtype=np.uint8))
+
+
+def test_duplicates_removed():
+    dl = DisplayList()
+    dl.line((0, 0, 10, 0), 'red')
+    dl.line((0, 0, 10, 0), 'red')
+    dl.polygon([(0, 0), (5, 0), (5, 5)], fill='#fff')
+    dl.polygon([(0, 0), (5, 0), (5, 5)], fill='#fff')
+
+    assert [item[0] for item in dl.optimize()] == [LINE, POLYGON]
+
+
+def test_duplicate_lines_collapse():
+    # линия вдоль оси - та же в обе стороны
+    dl = DisplayList()
+    dl.line((10, 5, 0, 5), 'red')
+    dl.line((0, 5, 10, 5), 'red')
+    dl.line((0, 0, 10, 5), 'red')
+    dl.line((10, 5, 0, 0), 'red')
+
+    assert [item[1] for item in dl.optimize()] == [(0, 5, 10, 5), (0, 0, 10, 5), (10, 5, 0, 0)]
+
+
+def test_last_duplicate_kept():
+    # повтор рисуется поверх того, что было между копиями
+    dl = DisplayList()
+    dl.line((0, 0, 10, 0), 'red')
+    dl.polygon([(0, 0), (10, 0), (10, 10)], fill='#fff')
+    dl.line((0, 0, 10, 0), 'red')
+
+    assert [item[0] for item in dl.optimize()] == [POLYGON, LINE]
+
+
+def test_tiles_not_deduplicated():
+    dl = DisplayList()
+    dl.tiles(tiles((0, 0, 9, 9)))
+    dl.line((0, 0, 10, 0), 'red')
+    dl.tiles(tiles((0, 0, 9, 9)))
+
+    assert [item[0] for item in dl.optimize()] == [TILES, LINE, TILES]
+
+
+def test_separate_batches_merged():
+    dl = DisplayList()
+    dl.tiles(tiles((0, 0, 9, 9), (11, 0, 20, 9)))
+    dl.tiles(tiles((0, 11, 9, 20)))
+    dl.tiles(tiles((22, 0, 30, 9)))
+
+    items = dl.optimize()
+    assert [item[0] for item in items] == [TILES]
+    assert items[0][1].x0.tolist() == [0, 11, 0, 22]
+
+
+def test_overlapping_batches_keep_order():
+    dl = DisplayList()
+    dl.tiles(tiles((0, 0, 9, 9)))
+    dl.tiles(tiles((5, 5, 15, 15)))
+    dl.tiles(tiles((20, 20, 25, 25)))
+
+    items = dl.optimize()
+    # вторая пачка перекрывает первую - рисуется после нее, третья присоединяется ко второй
+    assert [item[1].x0.tolist() for item in items] == [[0], [5, 20]]
+
+
+def test_batches_separated_by_other_items():
+    dl = DisplayList()
+    dl.tiles(tiles((0, 0, 9, 9)))
+    dl.line((0, 0, 30, 30), 'red')
+    dl.tiles(tiles((20, 20, 25, 25)))
+
+    assert [item[0] for item in dl.optimize()] == [TILES, LINE, TILES]
+
+
+def test_bbox_of_reversed_tiles():
+    # плитка без места (x1 < x0) тоже в рамке пачки
+    batch = tiles((10, 10, 8, 12))
+
+    assert batch.bbox() == (8, 10, 10, 12)
+    assert batch.overlaps(tiles((7, 11, 8, 11)))
@@ -0,0 +1,126 @@
+import asyncio
+import threading
+
+import pytest
+
+from draw.executor import BoundedExecutor, SingleFlight, QueueFull
+
+
+def test_full_queue_rejects():
+    release = threading.Event()
+
+    async def main():
+        executor = BoundedExecutor(1, 1)
+        # одна задача рисуется, одна ждет
+        running = [asyncio.ensure_future(executor.run(release.wait)) for _ in range(2)]
+        await asyncio.sleep(0)
+        assert (executor.in_flight, executor.queue_depth) == (1, 1)
+
+        with pytest.raises(QueueFull):
+            await executor.run(release.wait)
+        assert executor.stats()['rejected'] == 1
+
+        release.set()
+        await asyncio.gather(*running)
+        executor.shutdown()
+        return executor.stats()
+
+    stats = asyncio.run(main())
+    assert (stats['in_flight'], stats['queue_depth'], stats['completed']) == (0, 0, 2)
+
+
+def test_slot_released_after_completion():
+    async def main():
+        executor = BoundedExecutor(1, 0)
+        results = [await executor.run(sum, (1, 2)) for _ in range(3)]
+        executor.shutdown()
+        return executor, results
+
+    executor, results = asyncio.run(main())
+    assert results == [3, 3, 3]
+    assert executor.stats()['completed'] == 3
+    assert executor.stats()['rejected'] == 0
+
+
+def test_slot_released_after_error():
+    def fail():
+        raise ValueError('render failed')
+
+    async def main():
+        executor = BoundedExecutor(1, 0)
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                await executor.run(fail)
+        result = await executor.run(sum, (1, 2))
+        executor.shutdown()
+        return executor, result
+
+    executor, result = asyncio.run(main())
+    assert result == 3
+    assert executor.in_flight == 0
+    assert executor.stats()['rejected'] == 0
+
+
+def test_concurrent_calls_share_one_execution():
+    calls = []
+
+    async def render(value):
+        calls.append(value)
+        await asyncio.sleep(0.01)
+        return value * 2
+
+    async def main():
+        flight = SingleFlight()
+        results = await asyncio.gather(flight.run('a', render, 1), flight.run('a', render, 1), flight.run('b', render, 2))
+        return flight, results
+
+    flight, results = asyncio.run(main())
+    assert results == [2, 2, 4]
+    assert calls == [1, 2]
+    assert flight.stats() == {'in_flight': 0, 'coalesced': 1}
+
+
+def test_error_is_shared():
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError('render failed')
+
+    async def main():
+        flight = SingleFlight()
+        return flight, await asyncio.gather(flight.run('k', fail), flight.run('k', fail), return_exceptions=True)
+
+    flight, results = asyncio.run(main())
+    assert [type(r) for r in results] == [ValueError, ValueError]
+    assert len(flight) == 0
+
+
+def test_finished_call_runs_again():
+    calls = []
+
+    async def render():
+        calls.append(1)
+        return len(calls)
+
+    async def main():
+        flight = SingleFlight()
+        return [await flight.run('k', render), await flight.run('k', render)]
+
+    assert asyncio.run(main()) == [1, 2]
+
+
+def test_cancelled_waiter_does_not_cancel_the_call():
+    async def render():
+        await asyncio.sleep(0.02)
+        return 'done'
+
+    async def main():
+        flight = SingleFlight()
+        first = asyncio.ensure_future(flight.run('k', render))
+        second = asyncio.ensure_future(flight.run('k', render))
+        await asyncio.sleep(0)
+        first.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await first
+        return await second
+
+    assert asyncio.run(main()) == 'done'
@@ -0,0 +1,89 @@
+import numpy as np
+import pytest
+
+from draw.geometry import (
+    MAGIC, SURFACE_FLOOR, SURFACE_WALL, LAYOUT_GRID, LAYOUT_LATTICE, encode_geometry, decode_geometry,
+)
+from draw.layout import CUT_NOTCH
+from draw.scene import Scene
+
+FLOOR = {
+    'scheme': 'floor',
+    'tile': {'width': 300, 'length': 300, 'delimiter': 2},
+    'width': 3000,
+    'length': 4000,
+    'options': {'method': 1, 'openings': [{'x': 100, 'y': 100, 'width': 500, 'height': 500}]},
+}
+WALLS = {
+    'scheme': 'walls',
+    'tile': {'width': 300, 'length': 200, 'delimiter': 2},
+    'width': 3000,
+    'length': 4000,
+    'options': {'height': 2500, 'door': {'width': 800, 'height': 2000}},
+}
+
+
+def test_grid_round_trip():
+    data = encode_geometry(FLOOR)
+    assert data[:4] == MAGIC
+    assert len(data) % 4 == 0
+
+    geometry = decode_geometry(data)
+    surface, = geometry['surfaces']
+    assert (surface['kind'], surface['layout']) == (SURFACE_FLOOR, LAYOUT_GRID)
+
+    obj, _, _, options = Scene.from_params(FLOOR).objects[0]
+    plan = obj.get_layout(options['method'])
+    for axis, (start, size, _) in ((plan.columns, surface['columns']), (plan.rows, surface['rows'])):
+        np.testing.assert_allclose(start, axis.start, atol=1e-3)
+        np.testing.assert_allclose(size, axis.size, atol=1e-3)
+
+    index, box, cut = surface['parts']
+    assert index.tolist() == plan.part_idx.tolist()
+    np.testing.assert_allclose(box, plan.part_box, atol=1e-3)
+    assert (cut == plan.part_cut).all()
+    np.testing.assert_allclose(surface['openings'], [[100, 100, 500, 500]])
+
+
+def test_regular_grid_is_runs():
+    data = encode_geometry(dict(FLOOR, width=30000, length=40000, options={'method': 1}))
+    surface, = decode_geometry(data)['surfaces']
+
+    # размер не зависит от числа плиток
+    assert len(data) < 400
+    assert len(surface['columns'][0]) == 133
+
+
+def test_walls():
+    geometry = decode_geometry(encode_geometry(WALLS))
+
+    assert [s['kind'] for s in geometry['surfaces']] == [SURFACE_WALL] * 4
+    assert [s['width'] for s in geometry['surfaces']] == [4000, 3000, 4000, 3000]
+    # дверь - на третьей стене
+    assert [len(s['openings']) for s in geometry['surfaces']] == [0, 0, 1, 0]
+
+
+def test_lattice():
+    params = dict(FLOOR, options={'method': 3, 'angle': 30})
+    surface, = decode_geometry(encode_geometry(params))['surfaces']
+
+    assert surface['layout'] == LAYOUT_LATTICE
+    np.testing.assert_allclose(surface['lattice'], [30, 300, 300, 2])
+    i, j, n, points = surface['cut']
+    assert len(i) == len(j) == len(n) == len(points) > 0
+    assert (n >= 3).all()
+
+
+def test_unsupported_payload():
+    data = bytearray(encode_geometry(FLOOR))
+    data[:4] = b'XXXX'
+    with pytest.raises(Exception):
+        decode_geometry(bytes(data))
+
+
+def test_notch_flag_kept():
+    params = dict(FLOOR, options={'method': 1, 'openings': [{'x': 400, 'y': 400, 'width': 100, 'height': 100}]})
+    surface, = decode_geometry(encode_geometry(params))['surfaces']
+
+    _, _, cut = surface['parts']
+    assert (cut & CUT_NOTCH).any()
@@ -0,0 +1,53 @@
+"""Schemes against the pictures of the old drawing loops (tests/golden).
+
+The pictures were rendered without the watermark (its text depends on the
+FreeType the font is drawn with), the schemes here are drawn the same way.
+"""
+import os
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from draw.algorithms import draw_floor1, draw_bathroom
+from draw.core import Draw, Size
+
+GOLDEN_DIR = os.path.join(os.path.dirname(__file__), 'golden')
+
+CASES = {
+    'floor_direct': lambda: draw_floor1(4000, 5000, 2, 300, 300, 1),
+    'floor_center': lambda: draw_floor1(2000, 7000, 5, 600, 300, 2),
+    'floor_diagonal': lambda: draw_floor1(3000, 4500, 3, 300, 300, 3),
+    'walls_door': lambda: draw_bathroom(5000, 4000, 2500, 2, 300, 300, Size(800, 2000)),
+    # вторая стена кончается без подрезки, четвертая начинается с отрицательного обрезка
+    'walls_door_cut': lambda: draw_bathroom(4933, 2166, 2208, 10, 150, 100, Size(700, 1900)),
+    # половина ширины двери в px - дробная, дверь почти во всю стену
+    'walls_door_odd': lambda: draw_bathroom(3333, 2777, 2601, 3, 250, 200, Size(777, 2051)),
+    'walls_door_wide': lambda: draw_bathroom(1234, 987, 2400, 2, 100, 100, Size(1233, 2399)),
+}
+# старые циклы не рисовали плитки диагональной раскладки (x0, y0, x1, y1 - с контуром пола)
+NOT_DRAWN = {
+    'floor_diagonal': (125, 17, 1155, 702),
+}
+
+
+@pytest.fixture(autouse=True)
+def no_watermark(monkeypatch):
+    monkeypatch.setattr(Draw, 'draw_wm', lambda self, canvas: None)
+
+
+def render(name):
+    return np.array(CASES[name]().im.convert('RGB'))
+
+
+@pytest.mark.parametrize('name', sorted(CASES))
+def test_same_as_golden(name):
+    expected = np.array(Image.open(os.path.join(GOLDEN_DIR, name + '.png')).convert('RGB'))
+    actual = render(name)
+
+    assert actual.shape == expected.shape
+    if name in NOT_DRAWN:
+        x0, y0, x1, y1 = NOT_DRAWN[name]
+        actual[y0:y1, x0:x1] = expected[y0:y1, x0:x1]
+    diff = np.argwhere((actual != expected).any(axis=-1))
+    assert not len(diff), f'{len(diff)} pixels differ, first (y, x): {diff[0].tolist()}'
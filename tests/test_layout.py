@@ -0,0 +1,214 @@
+import numpy as np
+import pytest
+
+from draw.layout import (
+    CUT_LEFT, CUT_RIGHT, CUT_TOP, CUT_BOTTOM, CUT_NOTCH, AUTO_MIN_CUT,
+    BlockIndex, LayoutPlan, axis_layout, axis_edges, direct_layout, center_layout, auto_layout, auto_wall_start,
+    diagonal_layout, clip_polygons,
+)
+from draw.pixels import direct_steps, center_rows
+
+
+def test_axis_layout():
+    axis = axis_layout(1000, 300, 2, 2)
+
+    np.testing.assert_allclose(axis.start, [2, 304, 606, 908])
+    np.testing.assert_allclose(axis.size, [300, 300, 300, 90])
+    assert axis.cut_lo.tolist() == [False, False, False, False]
+    assert axis.cut_hi.tolist() == [False, False, False, True]
+    assert axis.full_range() == (0, 2)
+
+
+def test_axis_mirror():
+    axis = axis_layout(1000, 300, 2, 2).mirror(1000)
+
+    np.testing.assert_allclose(axis.start, [2, 94, 396, 698])
+    np.testing.assert_allclose(axis.size, [90, 300, 300, 300])
+    assert axis.cut_lo.tolist() == [True, False, False, False]
+
+
+@pytest.mark.parametrize('origin', [2.0, -17.5, 150.0, -301.0, 33.3])
+def test_axis_edges_same_as_layout(origin):
+    axis = axis_layout(2345, 300, 3, origin)
+    n, first, last, cut_first, cut_last = axis_edges(2345, 300, 3, np.array([origin]))
+
+    assert n[0] == len(axis)
+    assert first[0] == pytest.approx(axis.size[0])
+    assert last[0] == pytest.approx(axis.size[-1])
+    assert cut_first[0] == axis.cut_lo[0]
+    assert cut_last[0] == axis.cut_hi[-1]
+
+
+def test_direct_layout_counts():
+    plan = direct_layout(1000, 600, 300, 300, 0)
+
+    assert len(plan) == 8
+    assert plan.count == 8
+    assert plan.cut_count == 2
+    assert plan.offcut == 100
+
+
+def test_direct_layout_reused_first_column():
+    plan = direct_layout(1000, 600, 300, 300, 0, sx=100)
+
+    # первая колонка - из обрезка предыдущей стены
+    assert len(plan) == 8
+    assert plan.count == 6
+
+
+def test_opening_hides_whole_tiles():
+    plan = direct_layout(900, 900, 300, 300, 0)
+    plan.exclude([(300, 300, 300, 300)])
+
+    assert plan.count == 8
+    assert plan.cut_count == 0
+    assert plan.hidden == [(1, 1, 1, 1)]
+    assert 4 not in plan.visible_indexes().tolist()
+
+
+def test_opening_cuts_crossing_tiles():
+    plan = direct_layout(900, 900, 300, 300, 0)
+    plan.exclude([(250, 250, 400, 400)])
+
+    w, h, cut, reused, n = plan.groups()
+    groups = sorted(zip(w.tolist(), h.tolist(), cut.tolist(), n.tolist()))
+    assert groups == [
+        (250, 300, CUT_LEFT, 1),
+        (250, 300, CUT_RIGHT, 1),
+        (300, 250, CUT_TOP, 1),
+        (300, 250, CUT_BOTTOM, 1),
+        (300, 300, CUT_NOTCH, 4),
+    ]
+
+
+def test_crop():
+    plan = direct_layout(3000, 3000, 300, 300, 2)
+    plan.exclude([(100, 100, 200, 200)])
+    window = plan.crop(0, 0, 700, 400)
+
+    assert (len(window.columns), len(window.rows)) == (3, 2)
+    # проемы пересчитаны для окна
+    assert window.cut_count == plan.crop(0, 0, 350, 350).cut_count == 1
+
+
+def test_block_index():
+    index = BlockIndex([(0, 2, 0, 0), (1, 1, 0, 3)])
+
+    assert index.contains(np.array([0, 2, 1, 0, 3]), np.array([0, 0, 3, 1, 0])).tolist() == [
+        True, True, True, False, False
+    ]
+    cells = index.cells()
+    assert sum((c1 - c0 + 1) * (r1 - r0 + 1) for c0, c1, r0, r1 in cells) == 6
+    assert not BlockIndex([]).contains(np.array([0]), np.array([0])).any()
+
+
+def test_grid_groups_same_as_tiles():
+    plan = direct_layout(2500, 4000, 300, 200, 2, sx=120, y_dir=-1)
+    plan.exclude([(1600, 500, 800, 2000), (100, 100, 450, 450)])
+
+    # те же плитки поштучно
+    idx = plan.visible_indexes()
+    x, y, w, h, cut = plan.tiles(idx)
+    explicit = LayoutPlan(plan.width, plan.height, x, y, w, h, cut, reused=idx % len(plan.columns) == 0)
+
+    for a, b in zip(plan.groups(), explicit.groups()):
+        np.testing.assert_array_equal(a, b)
+    assert plan.count == explicit.count
+    assert plan.cut_count == explicit.cut_count
+
+
+def test_grid_groups_are_runs():
+    # 50 x 50 м мозаики 20 мм: группы считаются по классам колонок и рядов
+    plan = direct_layout(50000, 50000, 20, 20, 2)
+    w, h, cut, reused, n = plan.groups()
+
+    assert len(n) <= 4
+    assert n.sum() == len(plan.columns) * len(plan.rows) == len(plan)
+
+
+def test_direct_steps():
+    axis, offcut = direct_steps(110, 30, 2)
+
+    assert axis.x0.tolist() == [2, 34, 66, 98]
+    assert axis.x1.tolist() == [32, 64, 96, 108]
+    assert axis.cut_hi.tolist() == [False, False, False, True]
+    assert offcut == 10
+
+    # места не осталось - плитка нулевой ширины рисуется, как всегда рисовалась
+    axis, offcut = direct_steps(100, 30, 2)
+    assert (axis.x0[-1], axis.x1[-1], offcut) == (98, 98, None)
+
+
+def test_direct_steps_offcut_start():
+    # первая плитка - обрезок предыдущей стены, отрицательный - длиннее
+    axis, _ = direct_steps(100, 30, 2, start=10)
+    assert (axis.x0[0], axis.x1[0], axis.cut_lo[0]) == (2, 22, True)
+
+    axis, _ = direct_steps(100, 30, 2, start=-3)
+    assert (axis.x0[0], axis.x1[0]) == (2, 35)
+
+
+def test_direct_steps_whole_runs_as_loop():
+    # целые плитки подряд шагаются так же, как по одной
+    axis, offcut = direct_steps(1000, 7, 3)
+    x = 3 + 10 * np.arange(99)
+    assert axis.x0[:99].tolist() == x.tolist()
+    assert axis.x1[:99].tolist() == (x + 7).tolist()
+    assert (axis.x0[-1], axis.x1[-1], offcut) == (993, 997, 4)
+
+
+def test_center_rows_overlap_center():
+    axis, start = center_rows(100, 30, 2)
+
+    # центральная плитка, вниз, вверх
+    assert axis.x0.tolist() == [35, 65, 97, 33, 1, 0]
+    assert axis.x1.tolist() == [65, 98, 98, 63, 31, -1]
+    # соседи центральной плитки рисуются поверх нее
+    assert axis.layers().tolist() == [0, 1, 2, 1, 0, 0]
+    assert start == 31
+
+
+def test_auto_layout_no_slivers():
+    plan = auto_layout(1000, 1310, 300, 300, 2)
+
+    for axis in (plan.columns, plan.rows):
+        cut = axis.cut_lo | axis.cut_hi
+        assert (axis.size[cut] >= AUTO_MIN_CUT * 300).all()
+
+
+def test_auto_wall_start():
+    sx = auto_wall_start((2000, 1500, 2000, 1500), 300, 2)
+
+    assert sx is None or 0 < sx < 302
+
+
+def test_diagonal_without_rotation_is_center_layout():
+    grid = center_layout(5000, 4000, 600, 300, 2)
+    lattice = diagonal_layout(5000, 4000, 600, 300, 2, 0)
+
+    assert lattice.count == grid.count
+    assert lattice.cut_count == grid.cut_count
+
+
+def test_diagonal_covers_surface():
+    plan = diagonal_layout(3000, 2000, 300, 300, 2, 45)
+    w, h, cut, reused, n = plan.groups()
+
+    whole = n[cut == 0].sum()
+    # целых плиток не больше, чем помещается по площади
+    assert 0 < whole * 300 * 300 < 3000 * 2000
+    assert plan.count > whole
+
+
+def test_clip_polygons():
+    # ромб через угол прямоугольника, квадрат внутри, треугольник снаружи
+    points = np.zeros((3, 4, 2))
+    points[0] = [(0, -10), (10, 0), (0, 10), (-10, 0)]
+    points[1] = [(2, 2), (4, 2), (4, 4), (2, 4)]
+    points[2, :3] = [(-5, -5), (-1, -5), (-1, -1)]
+    clipped, n = clip_polygons(points, np.array([4, 4, 3]), 0, 0, 20, 20)
+
+    assert n[1:].tolist() == [4, 0]
+    # вершины на сторонах прямоугольника могут повторяться
+    assert sorted(set(map(tuple, clipped[0, :n[0]].tolist()))) == [(0, 0), (0, 10), (10, 0)]
+    np.testing.assert_allclose(clipped[1, :4], points[1])
@@ -0,0 +1,67 @@
+import re
+
+from draw.metrics import Metrics, Timings, BUCKETS
+
+# строка с метками формата Prometheus: name{k="v",...} value
+SAMPLE = re.compile(r'^([a-zA-Z_:][a-zA-Z0-9_:]*)\{((?:[a-zA-Z_]\w*="(?:[^"\\\n]|\\[\\"n])*",?)*)\} (\S+)$')
+LABEL = re.compile(r'([a-zA-Z_]\w*)="((?:[^"\\\n]|\\[\\"n])*)"')
+
+
+def unescape(value):
+    return re.sub(r'\\([\\"n])', lambda m: '\n' if m.group(1) == 'n' else m.group(1), value)
+
+
+def parse(text):
+    samples = []
+    for line in text.splitlines():
+        if line.startswith('# TYPE '):
+            continue
+        m = SAMPLE.match(line)
+        if m is None:
+            name, value = line.split(' ')
+            samples.append((name, {}, float(value)))
+            continue
+        labels = {k: unescape(v) for k, v in LABEL.findall(m.group(2))}
+        samples.append((m.group(1), labels, float(m.group(3))))
+    return samples
+
+
+def timings(**stages):
+    t = Timings()
+    for name, seconds in stages.items():
+        t.add(name, seconds)
+    return t
+
+
+def test_label_values_escaped():
+    stage = 'a\\b "c"\nd'
+    metrics = Metrics()
+    metrics.observe('draw', 200, timings(**{stage: 0.002}))
+    text = metrics.render()
+
+    # перевод строки значения не разрывает строку выборки
+    assert all(line.startswith(('# TYPE ', 'draw_')) for line in text.splitlines())
+    stages = {labels['stage'] for name, labels, _ in parse(text) if 'stage' in labels}
+    assert stages == {stage}
+
+
+def test_exposition_format():
+    metrics = Metrics()
+    metrics.observe('draw', 200, timings(render=0.002))
+    metrics.observe('draw', 200, timings(render=0.2))
+    metrics.observe('draw', 503, timings())
+    samples = parse(metrics.render({'draw_queue_depth': 3}))
+
+    requests = {labels['status']: value for name, labels, value in samples if name == 'draw_requests_total'}
+    assert requests == {'200': 2, '503': 1}
+
+    buckets = [(labels['le'], value) for name, labels, value in samples if name == 'draw_stage_seconds_bucket']
+    assert [le for le, _ in buckets] == [str(b) for b in BUCKETS] + ['+Inf']
+    counts = [value for _, value in buckets]
+    assert counts == sorted(counts) and counts[-1] == 2
+    assert dict(buckets)['0.0025'] == 1
+
+    values = {name: value for name, _, value in samples}
+    assert values['draw_stage_seconds_count'] == 2
+    assert abs(values['draw_stage_seconds_sum'] - 0.202) < 1e-6
+    assert values['draw_queue_depth'] == 3
@@ -0,0 +1,51 @@
+from draw.layout import direct_layout
+from draw.offcuts import make_cut_plan
+
+
+def test_whole_tiles_only():
+    plan = direct_layout(3000, 3000, 300, 300, 0)
+    result = make_cut_plan([plan], 300, 300, budget=0)
+
+    assert result['tiles'] == result['whole'] == 100
+    assert result['cut_tiles'] == 0
+    assert result['patterns'] == []
+
+
+def test_pieces_share_a_tile():
+    # по половине плитки в каждом ряду
+    plan = direct_layout(450, 600, 300, 300, 0)
+    result = make_cut_plan([plan], 300, 300)
+
+    assert result['whole'] == 2
+    assert result['pieces'] == 2
+    assert result['cut_tiles'] == 1
+    assert result['optimal']
+    assert result['patterns'] == [
+        {'count': 1, 'pieces': [{'width': 150, 'height': 300}, {'width': 150, 'height': 300}], 'waste': 0},
+    ]
+
+
+def test_offcuts_supply_other_surfaces():
+    wall = direct_layout(400, 300, 300, 300, 0)
+    result = make_cut_plan([wall, wall], 300, 300)
+
+    # подрезки 100 мм двух стен - из одной плитки
+    assert result['tiles'] == 3
+    assert result['patterns'][0]['waste'] == 300 * 300 - 2 * 100 * 300
+
+
+def test_big_pieces_do_not_share():
+    wall = direct_layout(500, 300, 300, 300, 0)
+    result = make_cut_plan([wall, wall], 300, 300)
+
+    assert result['cut_tiles'] == result['lower_bound'] - result['whole'] == 2
+
+
+def test_plan_bounds():
+    plans = [direct_layout(2345, 1678, 300, 200, 2), direct_layout(1234, 2500, 300, 200, 2)]
+    result = make_cut_plan(plans, 300, 200)
+
+    assert result['lower_bound'] <= result['tiles'] <= result['greedy']
+    assert sum(p['count'] for p in result['patterns']) == result['cut_tiles']
+    assert sum(p['count'] * len(p['pieces']) for p in result['patterns']) == result['pieces']
+    assert all(p['waste'] >= 0 for p in result['patterns'])
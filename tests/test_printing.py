@@ -0,0 +1,133 @@
+import io
+import struct
+import tracemalloc
+import zlib
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from draw import printing
+from draw.printing import PngWriter, PrintPage, WATERMARK_FRAME
+
+FLOOR = {
+    'scheme': 'floor',
+    'tile': {'width': 300, 'length': 300, 'delimiter': 2},
+    'width': 3000,
+    'length': 4000,
+    'options': {'method': 1},
+}
+# водяной знак - полоса через несколько полос листа
+WATERMARK_SIZE = (40, 300)
+
+
+@pytest.fixture(autouse=True)
+def watermark(monkeypatch):
+    # текст водяного знака зависит от FreeType, вместо него - прямоугольник
+    scales = []
+
+    def get_watermark(text, size, scale=1):
+        scales.append(scale)
+        overlay = Image.new('RGBA', WATERMARK_SIZE, (0, 0, 0, 128))
+        return overlay, ((size[0] - WATERMARK_SIZE[0]) // 2, (size[1] - WATERMARK_SIZE[1]) // 2)
+
+    monkeypatch.setattr(printing, 'get_watermark', get_watermark)
+    return scales
+
+
+def page(paper='A4', dpi=150):
+    return PrintPage.from_params(dict(FLOOR, print={'paper': paper, 'dpi': dpi}))
+
+
+def chunks(data):
+    pos = len(printing.PNG_SIGNATURE)
+    while pos < len(data):
+        n, = struct.unpack('>I', data[pos:pos + 4])
+        tag, body = data[pos + 4:pos + 8], data[pos + 8:pos + 8 + n]
+        assert struct.unpack('>I', data[pos + 8 + n:pos + 12 + n])[0] == zlib.crc32(tag + body)
+        yield tag, body
+        pos += n + 12
+
+
+def test_png_writer_rows():
+    rgb = np.random.RandomState(1).randint(0, 256, (37, 23, 3)).astype(np.uint8)
+    buf = io.BytesIO()
+    png = PngWriter(buf.write, 23, 37, dpi=300)
+    for y in range(0, 37, 10):
+        png.write_rows(rgb[y:y + 10])
+    png.close()
+
+    assert np.array_equal(np.array(Image.open(io.BytesIO(buf.getvalue()))), rgb)
+    with pytest.raises(AssertionError):
+        PngWriter(io.BytesIO().write, 23, 5).write_rows(rgb[:6])
+
+
+@pytest.mark.parametrize('paper, dpi', [('A4', 150), ('A3', 72)])
+def test_page_size_and_dpi(paper, dpi):
+    p = page(paper, dpi)
+    buf = io.BytesIO()
+    p.write_png(buf.write)
+    data = buf.getvalue()
+
+    pw, ph = printing.PAPER_SIZES[paper]
+    assert sorted((p.width, p.height)) == [round(pw * dpi / 25.4), round(ph * dpi / 25.4)]
+    im = Image.open(io.BytesIO(data))
+    assert (im.size, im.mode) == ((p.width, p.height), 'RGB')
+
+    # pHYs - точки на метр
+    phys = dict(chunks(data))[b'pHYs']
+    ppm = round(dpi / 25.4 * 1000)
+    assert struct.unpack('>IIB', phys) == (ppm, ppm, 1)
+    assert im.info['dpi'] == pytest.approx((dpi, dpi), abs=0.05)
+
+
+def test_strips_join_without_seams():
+    p = page()
+    whole, = [im for _, im in p.strips(p.height)]
+    strips = list(p.strips(100))
+
+    assert [top for top, _ in strips] == list(range(0, p.height, 100))
+    joined = np.concatenate([np.array(im) for _, im in strips])
+    assert np.array_equal(joined, np.array(whole))
+
+
+def test_contour_marks():
+    p = page()
+    image = np.array(next(im for _, im in p.strips(p.height)))
+    ink = (image[..., :3] != 255).any(axis=-1)
+
+    # левый верхний угол пола и метки от него в поля схемы
+    scene = p.scene
+    x0 = p.left + int(round(scene.contour * p.scale))
+    y0 = p.top + int(round(scene.contour * p.scale))
+    length = int(scene.contour * p.scale)
+    assert length > 2
+    assert ink[y0, x0 - length + 1:x0].all()
+    assert ink[y0 - length + 1:y0, x0].all()
+
+
+def test_watermark_scales_with_page(watermark):
+    for paper in ('A4', 'A0'):
+        p = page(paper)
+        list(p.strips())
+        assert watermark[-1] == min(p.width / WATERMARK_FRAME[0], p.height / WATERMARK_FRAME[1])
+
+    # на большом листе шрифт крупнее экранного
+    assert watermark[-1] > watermark[0] > 1
+
+
+def test_peak_memory_bounded_by_strip_height():
+    p = page('A4', 300)
+    peaks = {}
+    for height in (32, 128):
+        tracemalloc.start()
+        p.write_png(io.BytesIO().write, height)
+        peaks[height] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+
+    # память - на полосу (холст, RGB строк и фильтр PNG), не на лист
+    page_bytes = p.width * p.height * 4
+    for height, peak in peaks.items():
+        assert peak < p.width * height * 4 * 8 + 2 * 1024 * 1024
+    assert peaks[32] < page_bytes / 10
+    assert peaks[32] < peaks[128]
@@ -0,0 +1,99 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from draw.core import Canvas
+from draw.pyramid import Pyramid, TILE_SIZE, render_pyramid_tile
+
+FLOOR = {
+    'scheme': 'floor',
+    'tile': {'width': 300, 'length': 300, 'delimiter': 2},
+    'width': 3000,
+    'length': 4000,
+    'options': {'method': 1},
+}
+WALLS = {
+    'scheme': 'walls',
+    'tile': {'width': 300, 'length': 300, 'delimiter': 2},
+    'width': 3000,
+    'length': 4000,
+    'options': {'height': 2500, 'door': {'width': 800, 'height': 2000}},
+}
+
+
+def stitched(pyramid, z):
+    cols, rows = pyramid.grid_size(z)
+    a = np.zeros((rows * TILE_SIZE, cols * TILE_SIZE, 4), dtype=np.uint8)
+    for x in range(cols):
+        for y in range(rows):
+            a[y * TILE_SIZE:(y + 1) * TILE_SIZE, x * TILE_SIZE:(x + 1) * TILE_SIZE] = pyramid.tile(z, x, y)
+    return a
+
+
+def ink(a):
+    return (a != 255).any(axis=2)
+
+
+def dilate(mask):
+    out = mask.copy()
+    out[1:] |= mask[:-1]
+    out[:-1] |= mask[1:]
+    out[:, 1:] |= out[:, :-1].copy()
+    out[:, :-1] |= out[:, 1:].copy()
+    return out
+
+
+@pytest.mark.parametrize('params', [FLOOR, WALLS], ids=['floor', 'walls'])
+def test_neighbour_tiles_join_without_seams(params):
+    pyramid = Pyramid.from_params(params)
+    z = pyramid.max_zoom
+    tiles = stitched(pyramid, z)
+
+    # вся картинка одним холстом
+    s = pyramid.scale(z)
+    canvas = Canvas(tiles.shape[1], tiles.shape[0], scale_factor=s)
+    pyramid.scene.draw(canvas, s, 0, 0)
+
+    assert np.array_equal(tiles, np.array(canvas.im))
+
+
+@pytest.mark.parametrize('params', [FLOOR, WALLS], ids=['floor', 'walls'])
+def test_zoom_matches_downscale_of_next(params):
+    pyramid = Pyramid.from_params(params)
+    for z in range(pyramid.max_zoom):
+        lo = ink(stitched(pyramid, z))
+        hi = ink(stitched(pyramid, z + 1))
+        h, w = hi.shape[0] // 2, hi.shape[1] // 2
+        down = hi[:h * 2, :w * 2].reshape(h, 2, w, 2).any(axis=(1, 3))
+        h, w = min(h, lo.shape[0]), min(w, lo.shape[1])
+        lo, down = lo[:h, :w], down[:h, :w]
+
+        # линии уровня z - там же, где у z + 1 (с точностью до px)
+        assert not (lo & ~dilate(down)).any()
+        assert not (down & ~dilate(lo)).any()
+
+
+def test_contour_marks():
+    pyramid = Pyramid.from_params(FLOOR)
+    z = pyramid.max_zoom
+    s = pyramid.scale(z)
+    image = ink(stitched(pyramid, z))
+
+    # метки в углах пола - в полях схемы
+    x0, y0 = int(round(pyramid.scene.contour * s)), int(round(pyramid.scene.contour * s))
+    length = int(pyramid.scene.contour * s)
+    assert length > 2
+    assert image[y0, x0 - length + 1:x0].all()
+    assert image[y0 - length + 1:y0, x0].all()
+    assert not image[:y0 - length, :x0 - length].any()
+
+
+def test_render_pyramid_tile():
+    data = render_pyramid_tile('test-floor', FLOOR, 0, 0, 0)
+    im = Image.open(io.BytesIO(data))
+
+    assert (im.format, im.size) == ('PNG', (TILE_SIZE, TILE_SIZE))
+    assert render_pyramid_tile('test-floor', FLOOR, 0, 1, 0) is None
+    assert render_pyramid_tile('test-floor', FLOOR, Pyramid.from_params(FLOOR).max_zoom + 1, 0, 0) is None
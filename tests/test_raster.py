@@ -0,0 +1,40 @@
+import numpy as np
+import pytest
+
+from draw.algorithms import draw_floor1, draw_bathroom
+from draw.core import Canvas, Draw, Size
+from draw.raster import BACKEND_PIL, BACKEND_NUMPY
+
+OPENINGS = [(300, 400, 500, 700), (2000, 1000, 100, 100)]
+
+SCHEMES = {
+    'floor_direct': lambda: draw_floor1(4000, 5000, 2, 300, 300, 1),
+    'floor_center': lambda: draw_floor1(2000, 7000, 5, 600, 300, 2),
+    'floor_diagonal': lambda: draw_floor1(3000, 4500, 3, 300, 200, 3, angle=30),
+    'floor_auto': lambda: draw_floor1(3000, 4500, 3, 300, 200, 4),
+    'floor_openings': lambda: draw_floor1(3000, 4500, 2, 300, 300, 1, openings=OPENINGS),
+    # плитки меньше пикселя - рисуются группами
+    'floor_small_tiles': lambda: draw_floor1(60000, 80000, 1, 10, 10, 2),
+    'walls_door': lambda: draw_bathroom(5000, 4000, 2500, 2, 300, 300, Size(800, 2000)),
+    'walls_openings': lambda: draw_bathroom(
+        2000, 1700, 2700, 3, 200, 100, None, openings=[[], OPENINGS[:1], [], [(100, 100, 300, 300)]]
+    ),
+}
+
+
+@pytest.fixture(autouse=True)
+def no_watermark(monkeypatch):
+    monkeypatch.setattr(Draw, 'draw_wm', lambda self, canvas: None)
+
+
+def render(monkeypatch, name, backend):
+    monkeypatch.setattr(Canvas, 'DEFAULT_BACKEND', backend)
+    return np.array(SCHEMES[name]().im)
+
+
+@pytest.mark.parametrize('name', sorted(SCHEMES))
+def test_backends_draw_same_pixels(monkeypatch, name):
+    pil = render(monkeypatch, name, BACKEND_PIL)
+    numpy = render(monkeypatch, name, BACKEND_NUMPY)
+
+    assert np.array_equal(pil, numpy)
@@ -0,0 +1,156 @@
+import asyncio
+import json
+import threading
+from unittest import mock
+
+import pytest
+
+from tornado.escape import url_escape
+from tornado.testing import AsyncHTTPTestCase, gen_test
+
+import server
+from draw.core import Draw
+from draw.executor import BoundedExecutor
+from draw.geometry import MAGIC
+
+FLOOR = {
+    'scheme': 'floor',
+    'tile': {'width': 300, 'length': 300, 'delimiter': 2},
+    'width': 3000,
+    'length': 4000,
+    'options': {'method': 1},
+    'response': 'image',
+}
+
+
+class ServerTestCase(AsyncHTTPTestCase):
+
+    def setUp(self):
+        super().setUp()
+        # водяной знак зависит от FreeType, схемы рисуются без него
+        patch = mock.patch.object(Draw, 'draw_wm', lambda self, canvas: None)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def get_app(self):
+        return server.Application()
+
+    def post(self, path, body, **kwargs):
+        return self.http_client.fetch(
+            self.get_url(path), method='POST', body=json.dumps(body), raise_error=False, **kwargs
+        )
+
+
+class QueueFullTest(ServerTestCase):
+
+    def get_app(self):
+        app = super().get_app()
+        app.executor = BoundedExecutor(1, 0)
+        return app
+
+    @gen_test
+    async def test_rejected_then_served(self):
+        release = threading.Event()
+        busy = asyncio.ensure_future(self._app.executor.run(release.wait, 10))
+        await asyncio.sleep(0)
+
+        response = await self.post('/api/draw', FLOOR)
+        assert response.code == 503
+        assert response.headers['Retry-After'] == str(server.options.retry_after)
+        assert json.loads(response.body)['error']['code'] == 503
+
+        # место освобождается после отрисовки
+        release.set()
+        await busy
+        response = await self.post('/api/draw', FLOOR)
+        assert response.code == 200
+        assert self._app.executor.stats()['rejected'] == 1
+
+
+class EstimateTest(ServerTestCase):
+
+    @gen_test
+    async def test_small_layout_in_ioloop(self):
+        response = await self.post('/api/estimate', FLOOR)
+        assert response.code == 200
+        assert json.loads(response.body)['tiles'] == 14 * 10
+        assert self._app.executor.stats()['completed'] == 0
+
+    @gen_test
+    async def test_large_layout_in_executor(self):
+        body = dict(FLOOR, tile={'width': 20, 'length': 20, 'delimiter': 2}, options={'method': 3, 'angle': 30})
+        response = await self.post('/api/estimate', body)
+        assert response.code == 200
+        assert self._app.executor.stats()['completed'] == 1
+
+    @gen_test
+    async def test_too_many_tiles_rejected(self):
+        # 100 м пола плиткой 3 мм
+        body = dict(FLOOR, width=100000, length=100000, tile={'width': 3, 'length': 3, 'delimiter': 2})
+        response = await self.post('/api/estimate', body)
+        assert response.code == 400
+        assert self._app.executor.stats()['completed'] == 0
+
+    def test_tiles_per_side(self):
+        assert server.tiles_per_side(server.parse_draw_args(FLOOR)) == 4000 / 302
+        walls = dict(FLOOR, scheme='walls', width=1000, length=1000, options={'height': 3020})
+        assert server.tiles_per_side(server.parse_draw_args(walls)) == 10
+        with pytest.raises(server.BadRequest):
+            server.tiles_per_side(server.parse_draw_args(dict(FLOOR, width=0)))
+
+
+class ETagTest(ServerTestCase):
+
+    @gen_test
+    async def test_not_modified_until_params_change(self):
+        response = await self.post('/api/draw', FLOOR)
+        assert response.code == 200
+        assert response.headers['Content-Type'] == 'image/png'
+        etag = response.headers['Etag']
+        assert etag.startswith('"') and etag.endswith('"')
+        assert self._app.executor.stats()['completed'] == 1
+
+        # та же схема у клиента - без отрисовки
+        response = await self.post('/api/draw', FLOOR, headers={'If-None-Match': etag})
+        assert response.code == 304
+        assert not response.body
+        assert self._app.executor.stats()['completed'] == 1
+
+        response = await self.post('/api/draw', dict(FLOOR, width=3100), headers={'If-None-Match': etag})
+        assert response.code == 200
+        assert response.headers['Etag'] != etag
+        assert response.body
+
+    @gen_test
+    async def test_get_same_etag_as_post(self):
+        etag = (await self.post('/api/draw', FLOOR)).headers['Etag']
+
+        url = self.get_url('/api/draw?q=' + url_escape(json.dumps(FLOOR)))
+        response = await self.http_client.fetch(url, headers={'If-None-Match': etag}, raise_error=False)
+        assert response.code == 304
+        assert response.headers['Etag'] == etag
+
+
+class LayoutTest(ServerTestCase):
+
+    @gen_test
+    async def test_small_layout_in_ioloop(self):
+        response = await self.post('/api/layout', FLOOR)
+        assert response.code == 200
+        assert response.body[:4] == MAGIC
+        assert self._app.executor.stats()['completed'] == 0
+
+    @gen_test
+    async def test_large_layout_in_executor(self):
+        body = dict(FLOOR, tile={'width': 20, 'length': 20, 'delimiter': 2}, options={'method': 3, 'angle': 30})
+        response = await self.post('/api/layout', body)
+        assert response.code == 200
+        assert response.body[:4] == MAGIC
+        assert self._app.executor.stats()['completed'] == 1
+
+    @gen_test
+    async def test_too_many_tiles_rejected(self):
+        body = dict(FLOOR, width=100000, length=100000, tile={'width': 3, 'length': 3, 'delimiter': 2})
+        response = await self.post('/api/layout', body)
+        assert response.code == 400
+        assert self._app.executor.stats()['completed'] == 0
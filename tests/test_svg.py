@@ -0,0 +1,82 @@
+import re
+import xml.etree.ElementTree as ET
+
+from draw.core import Floor, WallTilesOptions, Position, LAYING_METHOD_DIRECT, LAYING_METHOD_DIAGONAL
+from draw.svg import SvgCanvas
+
+SVG = '{http://www.w3.org/2000/svg}'
+SCALE = 0.2
+ORIGIN = Position(10, 10)
+
+
+def render(method, **options):
+    canvas = SvgCanvas(1000, 1000, scale_factor=SCALE)
+    floor = Floor(3000, 4000, WallTilesOptions(300, 300, 2), options=options)
+    floor.draw(canvas, ORIGIN, method=method)
+    return floor, ET.fromstring(canvas.to_svg())
+
+
+def numbers(d):
+    return [float(v) for v in re.findall(r'-?[\d.]+', d)]
+
+
+def paths(doc, stroke):
+    return [p for p in doc.iter(SVG + 'path') if p.get('stroke') == stroke]
+
+
+def test_whole_tiles_are_one_pattern():
+    _, doc = render(LAYING_METHOD_DIRECT)
+
+    pattern, = doc.iter(SVG + 'pattern')
+    assert (pattern.get('width'), pattern.get('height')) == ('60.4', '60.4')
+    tile = pattern.find(SVG + 'rect')
+    assert (tile.get('width'), tile.get('height')) == ('60', '60')
+
+    block, = [r for r in doc.iter(SVG + 'rect') if r.get('fill') == 'url(#%s)' % pattern.get('id')]
+    # 13 x 9 целых плиток
+    assert (block.get('x'), block.get('y')) == ('10.4', '10.4')
+    assert float(block.get('width')) == round(12 * 60.4 + 60, 2)
+    assert float(block.get('height')) == round(8 * 60.4 + 60, 2)
+
+
+def test_cut_tiles_clipped_by_surface():
+    _, doc = render(LAYING_METHOD_DIRECT)
+
+    fill, = [p for p in doc.iter(SVG + 'path') if p.get('fill') == '#b9cbda']
+    tiles = [
+        tuple(map(float, t))
+        for t in re.findall(r'M([\d.]+) ([\d.]+)h([\d.]+)v([\d.]+)h-[\d.]+z', fill.get('d'))
+    ]
+    # нижний ряд, правая колонка и угол - подрезка
+    assert len(tiles) == 23
+    red, = paths(doc, '#ff0000')
+    assert red.get('d').count('M') == 24
+
+    # подрезанные плитки не выходят за поверхность
+    x1, y1 = ORIGIN.x + 4000 * SCALE, ORIGIN.y + 3000 * SCALE
+    for x, y, w, h in tiles:
+        assert ORIGIN.x < x and x + w <= x1 + 0.01
+        assert ORIGIN.y < y and y + h <= y1 + 0.01
+    assert max(x + w for x, _, w, _ in tiles) == round(x1 - 2 * SCALE, 2)
+    assert max(y + h for _, y, _, h in tiles) == round(y1 - 2 * SCALE, 2)
+
+
+def test_lattice_pattern_clipped_by_surface():
+    floor, doc = render(LAYING_METHOD_DIAGONAL, angle=30)
+    plan = floor.get_layout(LAYING_METHOD_DIAGONAL)
+
+    pattern, = doc.iter(SVG + 'pattern')
+    assert pattern.get('patternTransform').startswith('rotate(30 ')
+    clip, = [r for r in doc.iter(SVG + 'rect') if r.get('fill') == 'url(#%s)' % pattern.get('id')]
+    x0, y0, x1, y1 = plan.rect
+    assert float(clip.get('x')) == round(ORIGIN.x + x0 * SCALE, 2)
+    assert float(clip.get('width')) == round((x1 - x0) * SCALE, 2)
+    assert float(clip.get('height')) == round((y1 - y0) * SCALE, 2)
+
+    # резы - на краях прямоугольника
+    red, = paths(doc, '#ff0000')
+    values = numbers(red.get('d').replace('M', ' ').replace('L', ' '))
+    xs, ys = values[0::2], values[1::2]
+    on_x = [abs(x - (ORIGIN.x + x0 * SCALE)) < 0.01 or abs(x - (ORIGIN.x + x1 * SCALE)) < 0.01 for x in xs]
+    on_y = [abs(y - (ORIGIN.y + y0 * SCALE)) < 0.01 or abs(y - (ORIGIN.y + y1 * SCALE)) < 0.01 for y in ys]
+    assert len(xs) and all(a or b for a, b in zip(on_x, on_y))
@@ -0,0 +1,65 @@
+import io
+
+import numpy as np
+import pytest
+from PIL import Image
+
+from draw.algorithms import draw_floor1
+from draw.core import Draw
+from draw.utils import to_palette, encode_image, FORMAT_PNG, FORMAT_PNG32, FORMAT_WEBP
+
+
+def decode(encoded, mode='RGB'):
+    return np.array(Image.open(io.BytesIO(encoded.data)).convert(mode))
+
+
+@pytest.fixture
+def frame(monkeypatch):
+    monkeypatch.setattr(Draw, 'draw_wm', lambda self, canvas: None)
+    return draw_floor1(3000, 4000, 2, 300, 300, 1, openings=[(500, 500, 400, 400)]).im
+
+
+def test_palette_exact():
+    a = np.zeros((4, 4, 4), dtype=np.uint8)
+    a[..., 3] = 255
+    a[1:, :, 0] = 200
+    a[:, 2:, 3] = 100
+    im, inexact_pixels = to_palette(Image.fromarray(a, 'RGBA'))
+
+    assert im.mode == 'P'
+    assert inexact_pixels == 0
+    assert np.array_equal(np.array(im.convert('RGBA')), a)
+
+
+def test_palette_over_256_colors():
+    # 300 цветов: 256 частых по 2 пикселя, 44 редких по одному
+    a = np.zeros((1, 556, 4), dtype=np.uint8)
+    a[..., 3] = 255
+    a[0, :512, 0] = np.repeat(np.arange(256), 2)
+    a[0, 512:, 0] = np.arange(44) * 5 + 1
+    a[0, 512:, 1] = 1
+    im, inexact_pixels = to_palette(Image.fromarray(a, 'RGBA'))
+
+    assert inexact_pixels == 44
+    b = np.array(im.convert('RGBA')).astype(int)
+    assert np.array_equal(b[0, :512], a[0, :512])
+    # редкие заменены ближайшими цветами палитры
+    assert np.array_equal(b[0, 512:, 0], a[0, 512:, 0])
+    assert (b[0, 512:, 1] == 0).all()
+
+
+@pytest.mark.parametrize('fmt', [FORMAT_PNG, FORMAT_PNG32, FORMAT_WEBP])
+def test_formats_decode_to_frame(frame, fmt):
+    encoded = encode_image(frame, fmt)
+
+    assert encoded.inexact_pixels == 0
+    assert np.array_equal(decode(encoded), np.array(frame.convert('RGB')))
+
+
+def test_palette_png_keeps_transparency():
+    a = np.zeros((2, 2, 4), dtype=np.uint8)
+    a[0] = (255, 0, 0, 255)
+    a[1] = (0, 0, 255, 128)
+    encoded = encode_image(Image.fromarray(a, 'RGBA'), FORMAT_PNG)
+
+    assert np.array_equal(decode(encoded, 'RGBA'), a)